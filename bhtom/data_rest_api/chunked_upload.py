@@ -0,0 +1,277 @@
+import logging
+import os
+import re
+from typing import Optional
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from tom_dataproducts.models import DataProduct, data_product_path
+from tom_targets.models import Target
+
+from bhtom.middleware.hashtag_authentication_middleware import HashtagAuthentication
+from bhtom.models import BHTomUploadSession, Instrument, Observatory
+from bhtom.utils.data_product_hash import file_sha256, find_duplicate_upload
+from bhtom.utils.target_names import AmbiguousTargetNameError, get_target_by_name
+from bhtom.utils.upload_session import expire_upload_session, is_expired
+from .data_upload import duplicate_upload_response, process_uploaded_data_product
+
+logger = logging.getLogger(__name__)
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+READ_SIZE: int = 1024 * 1024
+MAX_FILE_SIZE: int = 4 * 1024 * 1024 * 1024
+
+
+def get_user_session(request, session_id: int) -> Optional[BHTomUploadSession]:
+    """
+    Returns the session of the user, expired first if it has been abandoned
+    """
+    try:
+        session = BHTomUploadSession.objects.get(id=session_id, user=request.user)
+    except BHTomUploadSession.DoesNotExist:
+        return None
+    if session.status == 'O' and is_expired(session):
+        expire_upload_session(session)
+        session.refresh_from_db()
+    return session
+
+
+def parse_optional_float(value) -> Optional[float]:
+    if value is None or value == '':
+        return None
+    return float(value)
+
+
+def session_state(session: BHTomUploadSession) -> dict:
+    return {'session_id': session.id,
+            'offset': session.offset,
+            'size': session.size,
+            'status': session.status}
+
+
+class UploadSessionCreate(APIView):
+    """
+    Starts a resumable upload. The file is then sent with PUT requests to upload-session/<id>/
+    (each with a ``Content-Range: bytes <start>-<end>/<size>`` header, in order) and
+    upload-session/<id>/finalize/ is called with the sha256 of the whole file.
+    A session which doesn't receive anything for UPLOAD_SESSION_EXPIRY_HOURS expires and its file is removed.
+    """
+    authentication_classes = [HashtagAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        user = request.user
+        instrument = Instrument.objects.get(hashtag=request.headers.get('hashtag'))
+
+        target_name: str = request.data.get('target')
+        file_name: str = request.data.get('file_name')
+        data_product_type: str = request.data.get('data_product_type')
+
+        try:
+            size: int = int(request.data.get('size'))
+        except (TypeError, ValueError):
+            return Response({'error': 'size must be the file size in bytes'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not file_name or not data_product_type:
+            return Response({'error': 'file_name and data_product_type are required'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if data_product_type not in settings.DATA_PRODUCT_TYPES:
+            return Response({'error': 'data_product_type must be one of: %s' % ', '.join(settings.DATA_PRODUCT_TYPES)},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if size <= 0 or size > MAX_FILE_SIZE:
+            return Response({'error': f'File size must be between 1 and {MAX_FILE_SIZE} bytes'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            mjd: Optional[float] = parse_optional_float(request.data.get('mjd'))
+            exp_time: Optional[float] = parse_optional_float(request.data.get('exp_time'))
+        except (TypeError, ValueError):
+            return Response({'error': 'mjd and exp_time must be numbers'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            target: Optional[Target] = get_target_by_name(target_name)
+        except AmbiguousTargetNameError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if target is None:
+            return Response({'error': f'Target {target_name} does not exist'}, status=status.HTTP_400_BAD_REQUEST)
+
+        file_name = get_valid_filename("{}_{}".format(user.id, os.path.basename(file_name)))
+        dry_run_str: str = request.data.get('dry_run', 'False')
+
+        # Reserve the final location of the file, chunks are written directly there
+        path: str = default_storage.get_available_name(data_product_path(DataProduct(target=target), file_name))
+        full_path: str = default_storage.path(path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        open(full_path, 'wb').close()
+
+        try:
+            session: BHTomUploadSession = BHTomUploadSession.objects.create(
+                user=user,
+                instrument=instrument,
+                target=target,
+                data_product_type=data_product_type,
+                path=path,
+                size=size,
+                sha256=request.data.get('sha256'),
+                filter=request.data.get('filter'),
+                mjd=mjd,
+                exp_time=exp_time,
+                dry_run=True if dry_run_str == 'True' else False,
+                matching_radius=request.data.get('matching_radius', '2'),
+                comment=request.data.get('comment')
+            )
+        except Exception:
+            os.remove(full_path)
+            raise
+
+        logger.info('Upload session %s created for %s (%s bytes)' % (str(session.id), path, str(size)))
+
+        return Response(session_state(session), status=status.HTTP_201_CREATED)
+
+
+class UploadSessionDetail(APIView):
+    """
+    GET returns the number of bytes already received, so that an interrupted upload can be resumed.
+    PUT appends the chunk given in the request body.
+    """
+    authentication_classes = [HashtagAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, session_id: int):
+        session = get_user_session(request, session_id)
+        if session is None:
+            return Response({'error': f'Upload session {session_id} does not exist'},
+                            status=status.HTTP_404_NOT_FOUND)
+        return Response(session_state(session))
+
+    def put(self, request, session_id: int):
+        # The user is already authenticated from the headers, the body hasn't been read yet
+        session = get_user_session(request, session_id)
+        if session is None:
+            return Response({'error': f'Upload session {session_id} does not exist'},
+                            status=status.HTTP_404_NOT_FOUND)
+        if session.status != 'O':
+            return Response(session_state(session), status=status.HTTP_409_CONFLICT)
+
+        content_range = CONTENT_RANGE_RE.match(request.headers.get('Content-Range', ''))
+        if content_range is None:
+            return Response({'error': 'Content-Range: bytes <start>-<end>/<size> header is required'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        start, end, total = (int(v) for v in content_range.groups())
+        if total != session.size or start > end or end >= session.size:
+            return Response({'error': 'Invalid Content-Range'}, status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+        if end < session.offset:
+            # The chunk has already been received, e.g. the response was lost
+            return Response(session_state(session))
+        if start != session.offset:
+            return Response(session_state(session), status=status.HTTP_409_CONFLICT)
+
+        remaining: int = end - start + 1
+        written: int = 0
+
+        with open(default_storage.path(session.path), 'r+b') as f:
+            f.seek(start)
+            while remaining > 0:
+                block = request.stream.read(min(READ_SIZE, remaining))
+                if not block:
+                    break
+                f.write(block)
+                written += len(block)
+                remaining -= len(block)
+
+        # Only move the offset if no other request did it in the meantime
+        BHTomUploadSession.objects.filter(id=session.id, offset=start) \
+            .update(offset=start + written, modified=timezone.now())
+        session.refresh_from_db()
+
+        if remaining > 0:
+            logger.info('Upload session %s: chunk interrupted at %s' % (str(session.id), str(session.offset)))
+            return Response(session_state(session), status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(session_state(session))
+
+
+class UploadSessionFinalize(APIView):
+    """
+    Verifies the checksum of the received file and hands it over to the standard upload processing.
+    """
+    authentication_classes = [HashtagAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, session_id: int):
+        session = get_user_session(request, session_id)
+        if session is None:
+            return Response({'error': f'Upload session {session_id} does not exist'},
+                            status=status.HTTP_404_NOT_FOUND)
+        if session.status != 'O' or session.offset != session.size:
+            return Response(session_state(session), status=status.HTTP_409_CONFLICT)
+
+        expected_sha256: str = request.data.get('sha256') or session.sha256
+        if not expected_sha256:
+            return Response({'error': 'sha256 of the file is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Claimed before any work, so that a retried or concurrent finalize doesn't process the file twice
+        if not BHTomUploadSession.objects.filter(id=session.id, status='O', offset=session.size) \
+                .update(status='F', modified=timezone.now()):
+            session.refresh_from_db()
+            return Response(session_state(session), status=status.HTTP_409_CONFLICT)
+        session.refresh_from_db()
+
+        full_path: str = default_storage.path(session.path)
+        content_hash: str = file_sha256(full_path)
+
+        if content_hash != expected_sha256.lower():
+            # Start over, the stored bytes can't be trusted
+            open(full_path, 'wb').close()
+            session.status = 'O'
+            session.offset = 0
+            session.save(update_fields=['status', 'offset', 'modified'])
+            return Response({'error': 'Checksum mismatch, upload the file again', **session_state(session)},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        force_str: str = request.data.get('force', 'False')
+        if force_str != 'True':
+            duplicate = find_duplicate_upload(content_hash, session.target, session.data_product_type,
+                                              instrument=session.instrument, user=request.user)
+            if duplicate is not None:
+                os.remove(full_path)
+                session.data_product = duplicate.dataproduct_id
+                session.save(update_fields=['data_product', 'modified'])
+                return duplicate_upload_response(duplicate, session.filter)
+
+        dp: DataProduct = DataProduct(
+            target=session.target,
+            product_id=None,
+            data_product_type=session.data_product_type
+        )
+        dp.data.name = session.path
+        dp.save()
+
+        session.data_product = dp
+        session.save(update_fields=['data_product', 'modified'])
+
+        observatory = Observatory.objects.get(id=session.instrument.observatory_id.id)
+
+        response = process_uploaded_data_product(dp, observatory, request.user, session.instrument.hashtag,
+                                                 session.filter, session.mjd, session.exp_time,
+                                                 session.dry_run, session.matching_radius, session.comment,
+                                                 content_hash=content_hash)
+
+        if response.status_code >= 400:
+            # The DataProduct has been deleted, its file is removed too
+            try:
+                os.remove(full_path)
+            except FileNotFoundError:
+                pass
+            BHTomUploadSession.objects.filter(id=session.id).update(status='E', data_product=None,
+                                                                    modified=timezone.now())
+
+        return response
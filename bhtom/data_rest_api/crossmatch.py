@@ -0,0 +1,51 @@
+import logging
+from typing import Optional
+
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from bhtom.middleware.hashtag_authentication_middleware import HashtagAuthentication
+from bhtom.utils.crossmatch import crossmatch, read_positions, read_positions_csv
+
+logger = logging.getLogger(__name__)
+
+
+class Crossmatch(APIView):
+    """
+    Matches a list of positions against the target catalogue in one request.
+
+    The positions are given either as JSON, {"positions": [{"ra": ..., "dec": ..., "radius": ...}, ...]},
+    or as an uploaded CSV file ('file') with ra, dec and optionally radius columns. The radius of
+    positions without one is taken from 'radius'. All values are in degrees, radii are at most 5 degrees
+    (crossmatch.MAX_RADIUS).
+    """
+    authentication_classes = [HashtagAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    MAX_POSITIONS: int = 100000
+    # Size of the largest accepted CSV file, rejected before it is read
+    MAX_FILE_SIZE: int = 10 * 1024 * 1024
+
+    def post(self, request):
+        try:
+            default_radius: Optional[float] = float(request.data['radius']) if request.data.get('radius') else None
+
+            file = request.FILES.get('file')
+            if file is not None:
+                if file.size > self.MAX_FILE_SIZE:
+                    return Response({'error': f'The file can be at most {self.MAX_FILE_SIZE} bytes'},
+                                    status=status.HTTP_400_BAD_REQUEST)
+                ra, dec, radius = read_positions_csv(file, default_radius, self.MAX_POSITIONS)
+            else:
+                positions = request.data.get('positions')
+                if not isinstance(positions, list):
+                    return Response({'error': 'No positions given'}, status=status.HTTP_400_BAD_REQUEST)
+                ra, dec, radius = read_positions(positions, default_radius, self.MAX_POSITIONS)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        matches = crossmatch(ra, dec, radius)
+
+        return Response({'positions': len(ra), 'matches': matches})
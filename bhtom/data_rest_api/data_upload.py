@@ -1,17 +1,20 @@
 import logging
-from datetime import timedelta
+from typing import Optional, Union
 
-from django.utils import timezone
+from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from tom_common.hooks import run_hook
-from tom_dataproducts.data_processor import run_data_processor
 from tom_dataproducts.models import DataProduct, ReducedDatum
 from tom_targets.models import Target
 
 from bhtom.middleware.hashtag_authentication_middleware import HashtagAuthentication
-from bhtom.models import refresh_reduced_data_view, Instrument, Observatory, BHTomFits
+from bhtom.models import refresh_reduced_data_view, Instrument, Observatory, BHTomFits, BHTomData
+from bhtom.utils.data_product_hash import file_sha256, find_duplicate_upload
+from bhtom.utils.target_names import AmbiguousTargetNameError, get_target_by_name
+from bhtom.utils.upload_parse_context import UploadParseContext
+from datatools.processors.data_processor import run_data_processor
 
 logger = logging.getLogger(__name__)
 
@@ -45,16 +48,26 @@ class PhotometryUpload(APIView):
         comment: str = request.data.get('comment')
 
         file = request.FILES.get('files')
+        if file is None:
+            return Response({'error': 'No file given'}, status=400)
 
-        time_threshold = timezone.now() - timedelta(days=1)
-        fits_quantity = BHTomFits.objects.filter(start_time__gte=time_threshold).count()
-        fits_quantity = fits_quantity * 10
+        force_str: str = request.data.get('force', 'False')
+        force = True if force_str == 'True' else False
 
         try:
-            target: Target = Target.objects.get(name=target_name)
-        except Target.DoesNotExist:
+            target: Optional[Target] = get_target_by_name(target_name)
+        except AmbiguousTargetNameError as e:
+            return Response({'error': str(e)}, status=400)
+        if target is None:
             return Response({'error': f'Target {target_name} does not exist'}, status=400)
 
+        content_hash: str = file_sha256(file)
+        if not force:
+            duplicate = find_duplicate_upload(content_hash, target, data_product_type,
+                                              instrument=instrument, user=user)
+            if duplicate is not None:
+                return duplicate_upload_response(duplicate, filter)
+
         dp: DataProduct = DataProduct(
             target=target,
             data=file,
@@ -63,22 +76,64 @@ class PhotometryUpload(APIView):
         )
         dp.save()
 
-        try:
-            run_hook('data_product_post_upload',
-                     dp, target, observatory,
-                     filter, mjd, exp_time,
-                     dry_run, matching_radius, comment,
-                     user, fits_quantity,
-                     hashtag=hashtag)
-
-            run_data_processor(dp)
-
-            # successful_uploads.append(str(dp).split('/')[-1])
-            refresh_reduced_data_view()
-        except Exception as e:
-            ReducedDatum.objects.filter(data_product=dp).delete()
-            dp.delete()
-            return Response({'exception': str(e)}, status=500)
-
-        return Response({'target': target_name,
-                         'filter': filter})
+        return process_uploaded_data_product(dp, observatory, user, hashtag,
+                                             filter, mjd, exp_time,
+                                             dry_run, matching_radius, comment,
+                                             content_hash=content_hash)
+
+
+def duplicate_upload_response(duplicate: Union[BHTomFits, BHTomData], filter: str) -> Response:
+    """
+    Response for a file that has already been uploaded: points to the existing job instead of reprocessing it.
+    """
+    logger.info('Duplicate upload of %s, content hash: %s' % (str(duplicate.dataproduct_id), duplicate.content_hash))
+
+    response = {'target': duplicate.dataproduct_id.target.name,
+                'filter': filter,
+                'duplicate': True}
+    if isinstance(duplicate, BHTomFits):
+        response['job_id'] = duplicate.file_id
+        response['status'] = duplicate.status
+    return Response(response, status=status.HTTP_200_OK)
+
+
+def process_uploaded_data_product(dp: DataProduct, observatory: Observatory, user, hashtag: str,
+                                  filter: str, mjd, exp_time, dry_run: bool,
+                                  matching_radius: str, comment: str,
+                                  content_hash: Optional[str] = None) -> Response:
+    """
+    Runs the post upload hook for an already stored DataProduct. FITS files are processed by the
+    background worker and a 202 with the job id is returned, other data is processed right away.
+    """
+    target: Target = dp.target
+    parse_context = UploadParseContext(dp)
+
+    try:
+        instance = run_hook('data_product_post_upload',
+                            dp, target, observatory,
+                            filter, mjd, exp_time,
+                            dry_run, matching_radius, comment,
+                            user, 0,
+                            hashtag=hashtag,
+                            content_hash=content_hash,
+                            parse_context=parse_context)
+
+        if isinstance(instance, BHTomFits):
+            # Photometry is done by the background worker, see FitsStatus for the job progress
+            return Response({'target': target.name,
+                             'filter': filter,
+                             'job_id': instance.file_id,
+                             'status': instance.status},
+                            status=status.HTTP_202_ACCEPTED)
+
+        run_data_processor(dp, parse_context)
+
+        # successful_uploads.append(str(dp).split('/')[-1])
+        refresh_reduced_data_view()
+    except Exception as e:
+        ReducedDatum.objects.filter(data_product=dp).delete()
+        dp.delete()
+        return Response({'exception': str(e)}, status=500)
+
+    return Response({'target': target.name,
+                     'filter': filter})
@@ -0,0 +1,54 @@
+import logging
+import time
+
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from bhtom.middleware.hashtag_authentication_middleware import HashtagAuthentication
+from bhtom.models import BHTomFits
+from bhtom.serializers import BHTomFitsStatusSerializer
+
+logger = logging.getLogger(__name__)
+
+
+class FitsStatus(APIView):
+    """
+    Returns the processing status of an uploaded file (one of BHTomFits.FITS_STATUS).
+
+    Supports long polling: with ?wait=<seconds> the request is held until the status
+    differs from ?status=<last seen status> (or is final), or until the timeout passes.
+    """
+    authentication_classes = [HashtagAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    FINAL_STATUSES = ['F', 'E', 'U']
+    MAX_WAIT: int = 30
+    POLL_INTERVAL: float = 1.0
+
+    def get(self, request, job_id: int):
+        try:
+            fits: BHTomFits = BHTomFits.objects.select_related('instrument_id').get(file_id=job_id)
+        except BHTomFits.DoesNotExist:
+            return Response({'error': f'Job {job_id} does not exist'}, status=status.HTTP_404_NOT_FOUND)
+
+        if fits.instrument_id.user_id_id != request.user.id and not request.user.is_staff:
+            return Response({'error': f'Job {job_id} does not exist'}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            wait: float = min(max(float(request.query_params.get('wait', 0)), 0), self.MAX_WAIT)
+        except ValueError:
+            return Response({'error': 'wait must be a number of seconds'}, status=status.HTTP_400_BAD_REQUEST)
+
+        last_status: str = request.query_params.get('status', fits.status)
+        deadline: float = time.monotonic() + wait
+
+        while fits.status == last_status \
+                and fits.status not in self.FINAL_STATUSES \
+                and time.monotonic() < deadline:
+            time.sleep(self.POLL_INTERVAL)
+            fits.refresh_from_db(fields=['status', 'status_message', 'cpcs_time', 'mjd', 'expTime',
+                                         'mag', 'mag_err', 'cpcs_plot'])
+
+        return Response(BHTomFitsStatusSerializer(fits).data)
@@ -1,11 +1,12 @@
-from math import radians
-
 import django_filters
 from django.conf import settings
-from django.db.models import ExpressionWrapper, FloatField, Q
-from django.db.models.functions.math import ACos, Cos, Radians, Pi, Sin
+from django.db.models import Q
 from tom_targets.models import Target, TargetList
 
+from bhtom.utils.cone_search import cone_search
+from bhtom.utils.target_names import MAX_SEARCH_IDS, MIN_SEARCH_LENGTH, resolve_target_ids, search_target_ids
+from bhtom.utils.target_summary import is_summary_field
+
 def filter_for_field(field):
     if field['type'] == 'number':
         return django_filters.NumericRangeFilter(field_name=field['name'], method=filter_number)
@@ -21,41 +22,45 @@ def filter_for_field(field):
         )
 
 
+def range_lookups(field: str, value) -> dict:
+    lookups = {}
+    if value.start:
+        lookups[field + '__gte'] = value.start
+    if value.stop:
+        lookups[field + '__lte'] = value.stop
+    return lookups
+
+
+# Extra fields with a column in the target summary are filtered there,
+# the other ones on their TargetExtra rows
+
 def filter_number(queryset, name, value):
-    if value.start and value.stop:
-        return queryset.filter(
-            targetextra__key=name, targetextra__float_value__gte=value.start, targetextra__float_value__lte=value.stop
-        )
-    elif value.start:
-        return queryset.filter(
-            targetextra__key=name, targetextra__float_value__gte=value.start
-        )
-    elif value.stop:
-        return queryset.filter(
-            targetextra__key=name, targetextra__float_value__lte=value.stop
-        )
+    if is_summary_field(name):
+        return queryset.filter(**range_lookups('summary__' + name, value))
+    lookups = range_lookups('targetextra__float_value', value)
+    if not lookups:
+        return queryset
+    return queryset.filter(targetextra__key=name, **lookups)
 
 
 def filter_datetime(queryset, name, value):
-    if value.start and value.stop:
-        return queryset.filter(
-            targetextra__key=name, targetextra__time_value__gte=value.start, targetextra__time_value__lte=value.stop
-        )
-    elif value.start:
-        return queryset.filter(
-            targetextra__key=name, targetextra__time_value__gte=value.start
-        )
-    elif value.stop:
-        return queryset.filter(
-            targetextra__key=name, targetextra__time_value__lte=value.stop
-        )
+    if is_summary_field(name):
+        return queryset.filter(**range_lookups('summary__' + name, value))
+    lookups = range_lookups('targetextra__time_value', value)
+    if not lookups:
+        return queryset
+    return queryset.filter(targetextra__key=name, **lookups)
 
 
 def filter_boolean(queryset, name, value):
+    if is_summary_field(name):
+        return queryset.filter(**{'summary__' + name: value})
     return queryset.filter(targetextra__key=name, targetextra__bool_value=value)
 
 
 def filter_text(queryset, name, value):
+    if is_summary_field(name):
+        return queryset.filter(**{'summary__' + name + '__icontains': value})
     return queryset.filter(targetextra__key=name, targetextra__value__icontains=value)
 
 
@@ -73,7 +78,11 @@ class TargetFilter(django_filters.FilterSet):
     name = django_filters.CharFilter(method='filter_name', label='Name')
 
     def filter_name(self, queryset, name, value):
-        return queryset.filter(Q(name__icontains=value) | Q(aliases__name__icontains=value)).distinct()
+        # Broad searches match most of the targets, they are done by the database rather than with a list of ids
+        target_ids = search_target_ids(value) if len(value.strip()) >= MIN_SEARCH_LENGTH else None
+        if target_ids is None or len(target_ids) > MAX_SEARCH_IDS:
+            return queryset.filter(Q(name__icontains=value) | Q(aliases__name__icontains=value)).distinct()
+        return queryset.filter(pk__in=target_ids)
 
     cone_search = django_filters.CharFilter(method='filter_cone_search', label='Cone Search',
                                             help_text='RA, Dec, Search Radius (degrees)')
@@ -103,41 +112,21 @@ class TargetFilter(django_filters.FilterSet):
 
     def filter_cone_search(self, queryset, name, value):
         """
-        Executes cone search by annotating each target with separation distance from either the specified RA/Dec or
-        the RA/Dec of the specified target. Formula is from Wikipedia: https://en.wikipedia.org/wiki/Angular_distance
-        The result is converted to radians.
-
-        Cone search is preceded by a square search to reduce the search radius before annotating the queryset, in
-        order to make the query faster.
+        Executes cone search around either the specified RA/Dec or the RA/Dec of the specified target,
+        annotating each target with its separation in degrees. See bhtom.utils.cone_search.
         """
         if name == 'cone_search':
             ra, dec, radius = value.split(',')
         elif name == 'target_cone_search':
             target_name, radius = value.split(',')
-            targets = Target.objects.filter(
-                Q(name__icontains=target_name) | Q(aliases__name__icontains=target_name)
-            ).distinct()
-            if len(targets) == 1:
-                ra = targets[0].ra
-                dec = targets[0].dec
-            else:
+            target_ids = resolve_target_ids(target_name.strip()) or search_target_ids(target_name.strip())
+            target = Target.objects.filter(pk=target_ids.pop()).first() if len(target_ids) == 1 else None
+            if target is None:
                 return queryset.filter(name=None)
+            ra = target.ra
+            dec = target.dec
 
-        ra = float(ra)
-        dec = float(dec)
-
-        double_radius = float(radius) * 2
-        queryset = queryset.filter(ra__gte=ra - double_radius, ra__lte=ra + double_radius,
-                                   dec__gte=dec - double_radius, dec__lte=dec + double_radius)
-
-        separation = ExpressionWrapper(
-            180 * ACos(
-                (Sin(radians(dec)) * Sin(Radians('dec'))) +
-                (Cos(radians(dec)) * Cos(Radians('dec')) * Cos(radians(ra) - Radians('ra')))
-            ) / Pi(), FloatField()
-        )
-
-        return queryset.annotate(separation=separation).filter(separation__lte=radius)
+        return cone_search(queryset, float(ra), float(dec), float(radius))
 
     # hide target grouping list if user not logged in
     def get_target_list_queryset(request):
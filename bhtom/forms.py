@@ -99,6 +99,11 @@ class DataProductUploadForm(forms.Form):
         required=False
     )
 
+    force = forms.BooleanField(
+        label='Force re-upload (process the file again even if it has already been uploaded)',
+        required=False
+    )
+
     referrer = forms.CharField(
         widget=forms.HiddenInput()
     )
@@ -482,6 +487,7 @@ class SiderealTargetCreateForm(TargetForm):
         self.fields['maglast'].widget = HiddenInput()
         self.fields['dicovery_date'].widget = HiddenInput()
         self.fields['Sun_separation'].widget = HiddenInput()
+        self.fields['Moon_separation'].widget = HiddenInput()
         self.fields['dont_update_me'].widget = HiddenInput()
 
     class Meta(TargetForm.Meta):
@@ -517,6 +523,7 @@ class NonSiderealTargetCreateForm(TargetForm):
         self.fields['maglast'].widget = HiddenInput()
         self.fields['dicovery_date'].widget = HiddenInput()
         self.fields['Sun_separation'].widget = HiddenInput()
+        self.fields['Moon_separation'].widget = HiddenInput()
         self.fields['dont_update_me'].widget = HiddenInput()
 
     def clean(self):
@@ -1,6 +1,84 @@
+from typing import Dict, List, Tuple
+
+from django.contrib import messages
+from django.db import transaction
+from django.db.models import QuerySet
+
 from .filters import TargetFilter
 from .models import Target
-from django.contrib import messages
+
+
+def grouping_membership(target_queryset: QuerySet, grouping_object) -> Tuple[Dict[int, str], set]:
+    """
+    Returns the names of the targets by id and the ids of those already in the grouping, one query each
+    """
+    targets: Dict[int, str] = dict(target_queryset.order_by().values_list('pk', 'name'))
+    member_ids: set = set(grouping_object.targets.filter(pk__in=target_queryset.values('pk'))
+                          .values_list('pk', flat=True))
+    return targets, member_ids
+
+
+def add_targets_to_grouping(target_queryset: QuerySet, grouping_object) -> Tuple[List[str], List[str]]:
+    """
+    Adds the targets which are not in the grouping yet in one transaction
+
+    :returns: names of the added targets and of the targets already in the grouping
+    """
+    with transaction.atomic():
+        targets, member_ids = grouping_membership(target_queryset, grouping_object)
+        new_ids: List[int] = [pk for pk in targets if pk not in member_ids]
+        grouping_object.targets.add(*new_ids)
+
+    return [targets[pk] for pk in new_ids], [targets[pk] for pk in targets if pk in member_ids]
+
+
+def remove_targets_from_grouping(target_queryset: QuerySet, grouping_object) -> Tuple[List[str], List[str]]:
+    """
+    Removes the targets which are in the grouping in one transaction
+
+    :returns: names of the removed targets and of the targets not in the grouping
+    """
+    with transaction.atomic():
+        targets, member_ids = grouping_membership(target_queryset, grouping_object)
+        grouping_object.targets.remove(*member_ids)
+
+    return [targets[pk] for pk in targets if pk in member_ids], [targets[pk] for pk in targets if pk not in member_ids]
+
+
+def selected_targets(targets_ids) -> Tuple[QuerySet, List[Tuple[str, str]]]:
+    """
+    Returns the selected targets and the ids which don't match any target, with the reason
+    """
+    valid_ids: List[int] = []
+    failure_targets: List[Tuple[str, str]] = []
+    for target_id in targets_ids:
+        try:
+            valid_ids.append(int(target_id))
+        except (TypeError, ValueError):
+            failure_targets.append((target_id, 'Invalid target id.'))
+
+    target_queryset: QuerySet = Target.objects.filter(pk__in=valid_ids)
+    existing_ids: set = set(target_queryset.values_list('pk', flat=True))
+    failure_targets += [(target_id, 'Target matching query does not exist.') for target_id in valid_ids
+                        if target_id not in existing_ids]
+
+    return target_queryset, failure_targets
+
+
+def report_added(request, grouping_object, success_targets: List[str], warning_targets: List[str]):
+    messages.success(request, "{} target(s) successfully added to group '{}'."
+                              .format(len(success_targets), grouping_object.name))
+    if warning_targets:
+        messages.warning(request, "{} target(s) already in group '{}': {}"
+                                  .format(len(warning_targets), grouping_object.name, ', '.join(warning_targets)))
+
+
+def report_removed(request, grouping_object, success_targets: List[str], warning_targets: List[str]):
+    messages.success(request, "{} target(s) successfully removed from group '{}'."
+                              .format(len(success_targets), grouping_object.name))
+    if warning_targets:
+        messages.warning(request, "{} target(s) not in group '{}': {}"
+                                  .format(len(warning_targets), grouping_object.name, ', '.join(warning_targets)))
 
 
 def add_all_to_grouping(filter_data, grouping_object, request):
@@ -17,34 +95,18 @@ def add_all_to_grouping(filter_data, grouping_object, request):
     :param request: request object passed to the calling view
     :type request: HTTPRequest
     """
-    success_targets = []
-    warning_targets = []  # targets that are already in the grouping
-    failure_targets = []
     try:
         target_queryset = TargetFilter(request=request, data=filter_data, queryset=Target.objects.all()).qs
     except Exception as e:
         messages.error(request, "Error with filter parameters. No target(s) were added to group '{}'."
                                 .format(grouping_object.name))
         return
-    for target_object in target_queryset:
-        try:
-            #if not request.user.has_perm('tom_targets.view_target'):
-            #    failure_targets.append((target_object.name, 'Permission denied.',))
-            if target_object in grouping_object.targets.all():
-                warning_targets.append(target_object.name)
-            else:
-                grouping_object.targets.add(target_object)
-                success_targets.append(target_object.name)
-        except Exception as e:
-            failure_targets.append((target_object.pk, e,))
-    messages.success(request, "{} target(s) successfully added to group '{}'."
-                              .format(len(success_targets), grouping_object.name))
-    if warning_targets:
-        messages.warning(request, "{} target(s) already in group '{}': {}"
-                                  .format(len(warning_targets), grouping_object.name, ', '.join(warning_targets)))
-    for failure_target in failure_targets:
-        messages.error(request, "Failed to add target with id={} to group '{}'; {}"
-                                .format(failure_target[0], grouping_object.name, failure_target[1]))
+    try:
+        success_targets, warning_targets = add_targets_to_grouping(target_queryset, grouping_object)
+    except Exception as e:
+        messages.error(request, "Failed to add targets to group '{}'; {}".format(grouping_object.name, e))
+        return
+    report_added(request, grouping_object, success_targets, warning_targets)
 
 
 def add_selected_to_grouping(targets_ids, grouping_object, request):
@@ -61,26 +123,13 @@ def add_selected_to_grouping(targets_ids, grouping_object, request):
     :param request: request object passed to the calling view
     :type request: HTTPRequest
     """
-    success_targets = []
-    warning_targets = []
-    failure_targets = []
-    for target_id in targets_ids:
-        try:
-            target_object = Target.objects.get(pk=target_id)
-            #if not request.user.has_perm('tom_targets.view_target'):
-            #    failure_targets.append((target_object.name, 'Permission denied.',))
-            if target_object in grouping_object.targets.all():
-                warning_targets.append(target_object.name)
-            else:
-                grouping_object.targets.add(target_object)
-                success_targets.append(target_object.name)
-        except Exception as e:
-            failure_targets.append((target_object.pk, e,))
-    messages.success(request, "{} target(s) successfully added to group '{}'."
-                              .format(len(success_targets), grouping_object.name))
-    if warning_targets:
-        messages.warning(request, "{} target(s) already in group '{}': {}"
-                                  .format(len(warning_targets), grouping_object.name, ', '.join(warning_targets)))
+    target_queryset, failure_targets = selected_targets(targets_ids)
+    try:
+        success_targets, warning_targets = add_targets_to_grouping(target_queryset, grouping_object)
+    except Exception as e:
+        messages.error(request, "Failed to add targets to group '{}'; {}".format(grouping_object.name, e))
+        return
+    report_added(request, grouping_object, success_targets, warning_targets)
     for failure_target in failure_targets:
         messages.error(request, "Failed to add target with id={} to group '{}'; {}"
                                 .format(failure_target[0], grouping_object.name, failure_target[1]))
@@ -100,34 +149,18 @@ def remove_all_from_grouping(filter_data, grouping_object, request):
     :param request: request object passed to the calling view
     :type request: HTTPRequest
     """
-    success_targets = []
-    warning_targets = []
-    failure_targets = []
     try:
         target_queryset = TargetFilter(request=request, data=filter_data, queryset=Target.objects.all()).qs
     except Exception as e:
         messages.error(request, "Error with filter parameters. No target(s) were removed from group '{}'."
                                 .format(grouping_object.name))
         return
-    for target_object in target_queryset:
-        try:
-           # if not request.user.has_perm('tom_targets.view_target'):
-           #     failure_targets.append((target_object.name, 'Permission denied.',))
-            if target_object not in grouping_object.targets.all():
-                warning_targets.append(target_object.name)
-            else:
-                grouping_object.targets.remove(target_object)
-                success_targets.append(target_object.name)
-        except Exception as e:
-            failure_targets.append({'name': target_object.name, 'error': e})
-    messages.success(request, "{} target(s) successfully removed from group '{}'."
-                              .format(len(success_targets), grouping_object.name))
-    if warning_targets:
-        messages.warning(request, "{} target(s) not in group '{}': {}"
-                                  .format(len(warning_targets), grouping_object.name, ', '.join(warning_targets)))
-    for failure_target in failure_targets:
-        messages.error(request, "Failed to remove target with id={} from group '{}'; {}"
-                                .format(failure_target['id'], grouping_object.name, failure_target['error']))
+    try:
+        success_targets, warning_targets = remove_targets_from_grouping(target_queryset, grouping_object)
+    except Exception as e:
+        messages.error(request, "Failed to remove targets from group '{}'; {}".format(grouping_object.name, e))
+        return
+    report_removed(request, grouping_object, success_targets, warning_targets)
 
 
 def remove_selected_from_grouping(targets_ids, grouping_object, request):
@@ -144,26 +177,13 @@ def remove_selected_from_grouping(targets_ids, grouping_object, request):
     :param request: request object passed to the calling view
     :type request: HTTPRequest
     """
-    success_targets = []
-    warning_targets = []
-    failure_targets = []
-    for target_id in targets_ids:
-        try:
-            target_object = Target.objects.get(pk=target_id)
-           # if not request.user.has_perm('tom_targets.view_target'):
-           #     failure_targets.append((target_object.name, 'Permission denied.',))
-            if target_object not in grouping_object.targets.all():
-                warning_targets.append(target_object.name)
-            else:
-                grouping_object.targets.remove(target_object)
-                success_targets.append(target_object.name)
-        except Exception as e:
-            failure_targets.append({'id': target_id, 'error': e})
-    messages.success(request, "{} target(s) successfully removed from group '{}'."
-                              .format(len(success_targets), grouping_object.name))
-    if warning_targets:
-        messages.warning(request, "{} target(s) not in group '{}': {}"
-                                  .format(len(warning_targets), grouping_object.name, ', '.join(warning_targets)))
+    target_queryset, failure_targets = selected_targets(targets_ids)
+    try:
+        success_targets, warning_targets = remove_targets_from_grouping(target_queryset, grouping_object)
+    except Exception as e:
+        messages.error(request, "Failed to remove targets from group '{}'; {}".format(grouping_object.name, e))
+        return
+    report_removed(request, grouping_object, success_targets, warning_targets)
     for failure_target in failure_targets:
         messages.error(request, "Failed to remove target with id={} from group '{}'; {}"
-                                .format(failure_target['id'], grouping_object.name, failure_target['error']))
+                                .format(failure_target[0], grouping_object.name, failure_target[1]))
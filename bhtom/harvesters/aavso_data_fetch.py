@@ -10,8 +10,9 @@ from django.core.cache import cache
 from tom_dataproducts.models import ReducedDatum
 from tom_targets.models import Target
 
-from bhtom.models import ReducedDatumExtraData, refresh_reduced_data_view
+from bhtom.models import refresh_reduced_data_view
 from bhtom.utils.observation_data_extra_data_utils import ObservationDatapointExtraData
+from bhtom.utils.provenance import save_reduced_datum_extra_data
 
 logger = logging.getLogger(__name__)
 
@@ -80,11 +81,8 @@ def save_row_to_db(target_id: int,
 
     if obs_affil or obs_name:
 
-        rd_extra_data, _ = ReducedDatumExtraData.objects.update_or_create(
-            reduced_datum=rd,
-            defaults={'extra_data': ObservationDatapointExtraData(facility_name=obs_affil,
-                                                                  owner=obs_name).to_json_str()}
-        )
+        save_reduced_datum_extra_data(rd, ObservationDatapointExtraData(facility_name=obs_affil,
+                                                                        owner=obs_name))
         logger.info('ReducedDatumExtraData from AAVSO ' + obs_name)
     return rd
 
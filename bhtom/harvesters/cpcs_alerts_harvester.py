@@ -1,6 +1,6 @@
 import json
 import logging
-from typing import Optional, Any, Dict
+from typing import Optional, Any, Dict, Tuple
 import urllib.parse
 
 import numpy as np
@@ -10,8 +10,9 @@ from tom_dataproducts.models import ReducedDatum
 
 from .utils.external_service import query_external_service
 from .utils.last_jd import update_last_jd
-from ..models import ReducedDatumExtraData, refresh_reduced_data_view
+from ..models import refresh_reduced_data_view
 from ..utils.observation_data_extra_data_utils import ObservationDatapointExtraData
+from ..utils.provenance import save_reduced_datum_extra_data
 
 try:
     from settings import local_settings as secret
@@ -46,6 +47,65 @@ cpcs_base_url = settings.CPCS_DATA_FETCH_URL
 logger = logging.getLogger(__name__)
 
 
+def cpcs_source_location(cpcs_name: str, followup_id) -> str:
+    '''
+        Source location of a CPCS point, the same for harvested points and the ones calibrated
+        for our uploads, so that a point is stored only once. cpcs_name is the URL-quoted calib_server_name.
+    '''
+    return f'{cpcs_base_url}get_alert_lc_data?alert_name={cpcs_name}&{followup_id}'
+
+
+def save_cpcs_datapoint(target,
+                        cpcs_name: str,
+                        followup_id,
+                        mjd: float,
+                        mag: float,
+                        magerr: float,
+                        filter: str,
+                        extra_data: ObservationDatapointExtraData,
+                        data_product=None) -> Tuple[ReducedDatum, bool]:
+    '''
+        Stores the CPCS point as a ReducedDatum, or updates the value of the one already stored
+        (e.g. by the calibration of an upload, before the calibration error was known).
+        Extra data is only saved with a new point.
+    '''
+    jd: float = mjd + 2400000.5
+    timestamp: Time = Time(jd, format='jd', scale='utc')
+
+    value: str = json.dumps({
+        'magnitude': mag,
+        'filter': filter,
+        'error': magerr,
+        'jd': timestamp.jd
+    })
+
+    rd: Optional[ReducedDatum] = ReducedDatum.objects.filter(
+        source_name='CPCS',
+        source_location=cpcs_source_location(cpcs_name, followup_id),
+        data_type='photometry',
+        target=target
+    ).first()
+
+    if rd is not None:
+        if rd.value != value:
+            rd.value = value
+            rd.timestamp = timestamp.to_datetime(timezone=TimezoneInfo())
+            rd.save(update_fields=['value', 'timestamp'])
+        return rd, False
+
+    rd = ReducedDatum.objects.create(
+        timestamp=timestamp.to_datetime(timezone=TimezoneInfo()),
+        value=value,
+        source_name='CPCS',
+        source_location=cpcs_source_location(cpcs_name, followup_id),
+        data_type='photometry',
+        data_product=data_product,
+        target=target
+    )
+    save_reduced_datum_extra_data(rd, extra_data)
+    return rd, True
+
+
 def update_cpcs_lc(target):
     try:
         cpcs_name: Optional[str] = urllib.parse.quote(target.targetextra_set.get(key='calib_server_name').value)
@@ -68,40 +128,13 @@ def update_cpcs_lc(target):
                 if float(magerr) == -1:
                     continue
 
-                jd: float = float(mjd) + 2400000.5
-                timestamp: Time = Time(jd, format='jd', scale='utc')
-
                 # Adding calibration error in quad
                 magerr_with_caliberr: float = mag_error_with_calib_error(float(magerr),
                                                                          float(caliberr))
 
-                value: str = json.dumps({
-                    'magnitude': float(mag),
-                    'filter': filter_name(filter, catalog),
-                    'error': magerr_with_caliberr,
-                    'jd': timestamp.jd
-                })
-
-                rd, created = ReducedDatum.objects.get_or_create(
-                    timestamp=timestamp.to_datetime(timezone=TimezoneInfo()),
-                    value=value,
-                    source_name='CPCS',
-                    source_location=f'{cpcs_base_url}get_alert_lc_data?alert_name={cpcs_name}&{id}',
-                    data_type='photometry',
-                    target=target
-                )
-
-                rd.save()
-
-                rd_extra_data, _ = ReducedDatumExtraData.objects.update_or_create(
-                    reduced_datum=rd,
-                    defaults={'extra_data': ObservationDatapointExtraData(
-                        facility_name=observatory,
-                        owner=observatory
-                    ).to_json_str()}
-                )
-
-                rd_extra_data.save()
+                save_cpcs_datapoint(target, cpcs_name, id, float(mjd), float(mag), magerr_with_caliberr,
+                                    filter_name(filter, catalog),
+                                    ObservationDatapointExtraData(facility_name=observatory, owner=observatory))
 
                 # Updating the last observation JD
                 latest_jd: float = np.max(np.array(lc_data['mjd']).astype(np.float)) + 2400000.5
@@ -10,8 +10,9 @@ from tom_dataproducts.models import ReducedDatum
 from tom_targets.models import Target
 
 ### how to pass those variables from settings?
-from bhtom.models import ReducedDatumExtraData, refresh_reduced_data_view
+from bhtom.models import refresh_reduced_data_view
 from bhtom.utils.observation_data_extra_data_utils import ObservationDatapointExtraData
+from bhtom.utils.provenance import save_reduced_datum_extra_data
 
 try:
     from settings import local_settings as secret
@@ -201,12 +202,8 @@ def update_gaia_lc(target, requesting_user_id):
                     data_type='photometry',
                     target=target)
                 rd.save()
-                rd_extra_data, _ = ReducedDatumExtraData.objects.update_or_create(
-                    reduced_datum=rd,
-                    defaults={'extra_data': ObservationDatapointExtraData(facility_name="Gaia",
-                                                                          owner="Gaia").to_json_str()
-                              }
-                )
+                save_reduced_datum_extra_data(rd, ObservationDatapointExtraData(facility_name="Gaia",
+                                                                                owner="Gaia"))
             except Exception as e:
                 logger.error(f'Error while updating LC for target {target}: {e}')
 
@@ -7,8 +7,9 @@ import requests
 from astropy.time import Time, TimezoneInfo
 from tom_dataproducts.models import ReducedDatum
 
-from bhtom.models import ReducedDatumExtraData, refresh_reduced_data_view
+from bhtom.models import refresh_reduced_data_view
 from bhtom.utils.observation_data_extra_data_utils import ObservationDatapointExtraData
+from bhtom.utils.provenance import save_reduced_datum_extra_data
 
 
 def read_secret(secret_key: str, default_value: Any = '') -> str:
@@ -91,12 +92,8 @@ def update_ztf_lc(target, requesting_user_id):
                     data_type='photometry',
                     target=target)
                 rd.save()
-                rd_extra_data, _ = ReducedDatumExtraData.objects.update_or_create(
-                    reduced_datum=rd,
-                    defaults={'extra_data': ObservationDatapointExtraData(facility_name=ZTF_OBSERVATORY_NAME,
-                                                                          owner='ZTF').to_json_str()
-                              }
-                )
+                save_reduced_datum_extra_data(rd, ObservationDatapointExtraData(facility_name=ZTF_OBSERVATORY_NAME,
+                                                                                owner='ZTF'))
 
         refresh_reduced_data_view()
 
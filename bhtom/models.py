@@ -3,7 +3,7 @@ from datetime import datetime
 from astroplan import Observer
 from django.db import models
 from django.contrib.auth.models import User
-from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.fields import ArrayField, JSONField
 from tom_targets.models import Target
 from tom_dataproducts.models import DataProduct, ReducedDatum
 from django_pgviews import view as pg
@@ -73,6 +73,7 @@ def photometry_name(instance, filename):
 class BHTomFits(models.Model):
     FITS_STATUS = [
         ('C', 'Created'),
+        ('D', 'Sending to photometry'),
         ('S', 'Sent to photometry'),
         ('I', 'Photometry in progress'),
         ('R', 'Photometry result'),
@@ -116,12 +117,52 @@ class BHTomFits(models.Model):
     survey = models.CharField(max_length=255, null=True, blank=True)
     cpsc_filter = models.CharField(max_length=10, null=True, blank=True)
     priority = models.IntegerField(null=True, blank=True, editable=False)
+    # Time the file was claimed by a CCDPHOTD dispatcher (status 'D'), see bhtom.utils.ccdphotd_scheduler
+    claimed_at = models.DateTimeField(null=True, blank=True, editable=False)
+    content_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True, editable=False)
 
     comment = models.TextField(null=True, blank=True)
 
     class Meta:
         verbose_name = 'BHTomFile'
         verbose_name_plural = "BHTomFiles"
+        indexes = [
+            # Used by the retention sweep (delete_expired_fits)
+            models.Index(fields=['data_stored', 'start_time']),
+        ]
+
+
+class BHTomUploadSession(models.Model):
+    """
+    Resumable, chunked upload of a single file. Chunks are written straight to ``path``
+    (relative to MEDIA_ROOT) and the file is turned into a DataProduct once the whole
+    file has been received and its checksum verified.
+    """
+    SESSION_STATUS = [
+        ('O', 'Open'),
+        ('F', 'Finished'),
+        ('E', 'Error'),
+        ('X', 'Expired'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    instrument = models.ForeignKey(Instrument, on_delete=models.CASCADE)
+    target = models.ForeignKey(Target, on_delete=models.CASCADE)
+    data_product = models.ForeignKey(DataProduct, on_delete=models.SET_NULL, null=True, blank=True)
+    data_product_type = models.CharField(max_length=50)
+    path = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, null=True, blank=True)
+    status = models.CharField(max_length=1, choices=SESSION_STATUS, default='O')
+    filter = models.CharField(max_length=255, null=True, blank=True)
+    mjd = models.FloatField(null=True, blank=True)
+    exp_time = models.FloatField(null=True, blank=True)
+    dry_run = models.BooleanField(default=False)
+    matching_radius = models.CharField(max_length=10, default='2')
+    comment = models.TextField(null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
 
 
 class Catalogs(models.Model):
@@ -140,15 +181,44 @@ class BHTomUser(models.Model):
 
 
 class BHTomData(models.Model):
+    DATA_STATUS = [
+        ('W', 'Waiting for processing'),
+        ('P', 'Processing'),
+        ('D', 'Processed'),
+        ('E', 'Error'),
+    ]
+
     user_id = models.ForeignKey(User, on_delete=models.CASCADE)
     dataproduct_id = models.ForeignKey(DataProduct, on_delete=models.CASCADE)
     data_stored = models.BooleanField(default='False')
     comment = models.TextField(null=True, blank=True)
+    content_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+    # Progress of the files parsed in the background (see bhtom.utils.asynch.taskUploadProcessing)
+    status = models.CharField(max_length=1, choices=DATA_STATUS, default='D', editable=False)
+    status_message = models.TextField(default='', blank=True, editable=False)
+
+
+class ReducedDatumProvenance(models.Model):
+    """
+    Interned (facility, owner, source) triple shared by all reduced data points coming from the same origin,
+    so that e.g. every Gaia point references one row instead of storing its own copy of the same JSON.
+    Empty strings are used instead of NULLs, so that the unique constraint also covers missing values.
+    """
+    facility = models.CharField(max_length=255, blank=True, default='')
+    owner = models.CharField(max_length=255, blank=True, default='')
+    source = models.CharField(max_length=100, blank=True, default='')
+
+    def __str__(self):
+        return '{} ({}, {})'.format(self.facility, self.owner, self.source)
+
+    class Meta:
+        unique_together = ('facility', 'owner', 'source')
 
 
 class ReducedDatumExtraData(models.Model):
     reduced_datum = models.ForeignKey(ReducedDatum, on_delete=models.CASCADE, primary_key=True)
     extra_data = models.TextField(null=True, blank=True)
+    provenance = models.ForeignKey(ReducedDatumProvenance, on_delete=models.PROTECT, null=True, blank=True)
 
 
 class ViewReducedDatum(pg.MaterializedView):
@@ -157,10 +227,13 @@ class ViewReducedDatum(pg.MaterializedView):
         SELECT rd.id AS id,
         rd.target_id, rd.data_product_id, rd.data_type, rd.source_name, rd.timestamp, rd.value,
         rdd.extra_data AS rd_extra_data,
+        rdp.facility AS rd_facility,
+        rdp.owner AS rd_owner,
         dpobr.extra_data AS dp_extra_data,
         dpobr.obr_facility AS observation_record_facility
         FROM tom_dataproducts_reduceddatum AS rd
             LEFT JOIN bhtom_reduceddatumextradata AS rdd ON rd.id=rdd.reduced_datum_id
+            LEFT JOIN bhtom_reduceddatumprovenance AS rdp ON rdd.provenance_id=rdp.id
             LEFT JOIN (SELECT dp.id AS dp_id, dp.extra_data AS extra_data, obr.facility AS obr_facility
                 FROM tom_dataproducts_dataproduct AS dp
                 LEFT JOIN tom_observations_observationrecord AS obr ON dp.observation_record_id=obr.id) dpobr
@@ -178,6 +251,8 @@ class ViewReducedDatum(pg.MaterializedView):
     timestamp = models.DateTimeField(null=False, blank=False, default=datetime.now, db_index=True)
     value = models.TextField(null=False, blank=False)
     rd_extra_data = models.TextField(null=True, blank=True)
+    rd_facility = models.CharField(max_length=255, null=True, blank=True)
+    rd_owner = models.CharField(max_length=255, null=True, blank=True)
     dp_extra_data = models.TextField(null=True, blank=True)
     observation_record_facility = models.TextField(null=True, blank=True)
 
@@ -197,6 +272,80 @@ class BHTomCpcsTaskAsynch(models.Model):
     data_send = models.DateField()
     data_created = models.DateField(null=False, editable=False)
     number_tries = models.IntegerField(null=False)
+    # Time of the scheduled retry, or the end of the current worker's claim while IN_PROGRESS
+    next_attempt = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(null=True, blank=True)
+
+
+class BHTomOutboxMessage(models.Model):
+    """
+    Network side effect (CPCS call, email) recorded in the transaction of the change that caused it
+    and delivered afterwards by the outbox_queue workers, see bhtom.utils.asynch.taskOutbox.
+    """
+    MESSAGE_STATUS = [
+        ('P', 'Pending'),
+        ('R', 'In progress'),
+        ('D', 'Delivered'),
+        ('F', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50)
+    payload = JSONField(default=dict)
+    status = models.CharField(max_length=1, choices=MESSAGE_STATUS, default='P')
+    attempts = models.IntegerField(default=0)
+    # Time of the next delivery attempt, or the end of the current worker's claim while in progress
+    next_attempt = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    delivered = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt']),
+        ]
+
+
+class BHTomDispatchBucket(models.Model):
+    """
+    Fair-share state of an instrument (i.e. of a user at an observatory) for dispatching FITS files
+    to CCDPHOTD, see bhtom.utils.ccdphotd_scheduler.
+    """
+    instrument = models.OneToOneField(Instrument, on_delete=models.CASCADE)
+    # Token bucket, tokens may go negative while the instrument is over its share
+    tokens = models.FloatField()
+    updated = models.DateTimeField()
+    # Files of the instrument waiting for dispatch
+    queued = models.IntegerField(default=0)
+
+
+class BHTomTargetSummary(models.Model):
+    """
+    Typed copy of the target's extra fields (settings.EXTRA_FIELDS) and its position, one row per target,
+    used to filter and sort the target list without a join on TargetExtra per field. Kept up to date from
+    Target and TargetExtra saves, see bhtom.signals.
+    """
+    target = models.OneToOneField(Target, on_delete=models.CASCADE, primary_key=True, related_name='summary')
+    gaia_alert_name = models.TextField(null=True, blank=True)
+    calib_server_name = models.TextField(null=True, blank=True)
+    ztf_alert_name = models.TextField(null=True, blank=True)
+    aavso_name = models.TextField(null=True, blank=True)
+    gaiadr2_id = models.TextField(null=True, blank=True)
+    TNS_ID = models.TextField(null=True, blank=True)
+    classification = models.TextField(null=True, blank=True, db_index=True)
+    tweet = models.BooleanField(null=True, blank=True)
+    jdlastobs = models.FloatField(null=True, blank=True, db_index=True)
+    maglast = models.FloatField(null=True, blank=True, db_index=True)
+    priority = models.FloatField(null=True, blank=True, db_index=True)
+    dicovery_date = models.DateTimeField(null=True, blank=True)
+    cadence = models.FloatField(null=True, blank=True)
+    Sun_separation = models.FloatField(null=True, blank=True, db_index=True)
+    Moon_separation = models.FloatField(null=True, blank=True, db_index=True)
+    dont_update_me = models.BooleanField(null=True, blank=True)
+    # Unit vector of the target's position, the spatial index of cone searches (see bhtom.utils.cone_search)
+    cx = models.FloatField(null=True, blank=True, db_index=True)
+    cy = models.FloatField(null=True, blank=True, db_index=True)
+    cz = models.FloatField(null=True, blank=True, db_index=True)
+
 
 def refresh_reduced_data_view():
     ViewReducedDatum.refresh(concurrently=True)
\ No newline at end of file
@@ -17,5 +17,6 @@ class BHTomFitsResultSerializer(serializers.ModelSerializer):
 class BHTomFitsStatusSerializer(serializers.ModelSerializer):
     class Meta:
         model = BHTomFits
-        fields = '__all__'
+        fields = ('file_id', 'status', 'status_message', 'start_time', 'cpcs_time', 'mjd', 'expTime',
+                  'mag', 'mag_err', 'cpcs_plot')
 
@@ -0,0 +1,66 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from tom_targets.models import Target, TargetExtra, TargetName
+
+from .utils.crossmatch import invalidate_target_index
+from .utils.target_names import SURVEY_NAME_KEYS, invalidate_name_index
+from .utils.target_summary import clear_target_summary_field, update_target_position, update_target_summary
+
+
+# Fields of the target kept in the crossmatch index, the name is also kept in the name index
+INDEXED_TARGET_FIELDS = ('name', 'ra', 'dec')
+
+
+@receiver(pre_save, sender=Target)
+def target_indexed_fields_pre_save(sender, instance, update_fields=None, **kwargs):
+    """
+    Keeps the indexed fields as they are stored, so that post_save can tell whether they change
+    """
+    instance._stored_indexed_fields = None
+    if instance.pk is None:
+        return
+    if update_fields is not None and not set(update_fields) & set(INDEXED_TARGET_FIELDS):
+        instance._stored_indexed_fields = {field: getattr(instance, field) for field in INDEXED_TARGET_FIELDS}
+        return
+    instance._stored_indexed_fields = Target.objects.filter(pk=instance.pk).values(*INDEXED_TARGET_FIELDS).first()
+
+
+@receiver(post_save, sender=Target)
+def target_post_save(sender, instance, created, **kwargs):
+    stored = getattr(instance, '_stored_indexed_fields', None)
+    changed = {field for field in INDEXED_TARGET_FIELDS
+               if created or stored is None or stored[field] != getattr(instance, field)}
+
+    if changed & {'ra', 'dec'}:
+        update_target_position(instance)
+    if changed:
+        transaction.on_commit(invalidate_target_index)
+    if 'name' in changed:
+        transaction.on_commit(invalidate_name_index)
+
+
+@receiver(post_delete, sender=Target)
+def target_post_delete(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_target_index)
+    transaction.on_commit(invalidate_name_index)
+
+
+@receiver(post_save, sender=TargetName)
+@receiver(post_delete, sender=TargetName)
+def target_name_changed(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_name_index)
+
+
+@receiver(post_save, sender=TargetExtra)
+def target_extra_post_save(sender, instance, **kwargs):
+    update_target_summary(instance)
+    if instance.key in SURVEY_NAME_KEYS:
+        transaction.on_commit(invalidate_name_index)
+
+
+@receiver(post_delete, sender=TargetExtra)
+def target_extra_post_delete(sender, instance, **kwargs):
+    clear_target_summary_field(instance)
+    if instance.key in SURVEY_NAME_KEYS:
+        transaction.on_commit(invalidate_name_index)
@@ -1,41 +1,66 @@
-#!/usr/bin/env python3 
+#!/usr/bin/env python3
 
 ### BHTOM system script
 ### Script allows to upload bulk FITS data to BHTOM server.
+### Files are sent concurrently over a pooled connection, failed uploads are retried,
+### and every uploaded file is recorded in a manifest, so an interrupted run can simply be restarted.
 ### Last modified: Feb 22, 2022
 ### Authors: PM, PT
 
-import os
-import subprocess
-import requests
-import time
 import argparse
+import hashlib
+import json
+import os
+import shutil
+import statistics
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
 
 bhtom_url = "https://bh-tom.astrolabs.pl/photometry-upload/"
 
-def input_arguments(): 
-    global indir, inhash, inobject, infilter, intype, dryrun, inmjd, matching_radius
+MANIFEST_NAME = ".bhtom_upload_manifest.json"
+SUCCESS_CODES = (200, 201, 202)
+# Server-side problems worth retrying; other errors (e.g. wrong hashtag or target) won't go away
+RETRY_CODES = (429, 500, 502, 503, 504)
+
+manifest_lock = threading.Lock()
+
+
+def input_arguments():
+    global indir, inhash, inobject, infilter, dryrun, matching_radius, workers, retries, bhtom_url, manifest_path
     des = ">>> " + os.path.basename(sys.argv[0]) + " <<<\n" + \
           "Sends image data to BHTOM system\n" + \
-          "Requires: Python3 with os,subprocess,requests,time,\n" + \
-          "          argparse,sys packages\n" + \
+          "Requires: Python3 with the requests package\n" + \
           "Example: send_to_bhtom.py -d ./files_to_be_sent -o Gaia18dif -ht bhtom_LCOGT-SS-1m_4K_peteruk2_88d7c27083cfb51af71\n" + \
-          "[-f filter] [-r matching_radius] --dryrun"
+          "[-f filter] [-r matching_radius] [-w workers] [--retries n] --dryrun"
     parser = argparse.ArgumentParser(description = des, formatter_class = argparse.RawTextHelpFormatter)
     parser.add_argument("-d", "--dir", type=str, help="directory containing FITS images or a PHOT filepath", required=True)
     parser.add_argument("-ht", "--hashtag", type=str, help="your dedicated hashtag", required=True)
     parser.add_argument("-o", "--object", type=str, help="object name", required=True)
-    parser.add_argument("-f", "--filter", type=str, help="matching catalogue filter name", default=False)
+    parser.add_argument("-f", "--filter", type=str, help="matching catalogue filter name", default=None)
     parser.add_argument("-r", "--radius", type=float, help="matching radius size", default=2.0)
-    parser.add_argument("--dryrun", help="sends data, but does not store datapoints in BHTOM database", action="store_true") 
+    parser.add_argument("-w", "--workers", type=int, help="number of concurrent uploads", default=4)
+    parser.add_argument("--retries", type=int, help="number of retries of a failed upload", default=5)
+    parser.add_argument("--url", type=str, help="upload endpoint (e.g. a local test server)", default=bhtom_url)
+    parser.add_argument("--manifest", type=str, help="resume manifest path (default: <dir>/" + MANIFEST_NAME + ")",
+                        default=None)
+    parser.add_argument("--dryrun", help="sends data, but does not store datapoints in BHTOM database", action="store_true")
     args = parser.parse_args()
     indir       = str(args.dir)
     inhash      = str(args.hashtag)
-    inobject    = str(args.object) 
-    infilter    = str(args.filter)
+    inobject    = str(args.object)
+    infilter    = args.filter
     dryrun      = True if args.dryrun else False
     matching_radius = float(args.radius)
+    workers     = max(1, args.workers)
+    retries     = max(0, args.retries)
+    bhtom_url   = args.url
+    manifest_path = args.manifest if args.manifest else os.path.join(indir, MANIFEST_NAME)
 
 def show_arguments():
     print("$ Directory              :", indir)
@@ -43,82 +68,160 @@ def show_arguments():
     print("$ Object name            :", inobject)
     print("$ Matching filter        :", infilter)
     print("$ Dry run                :", dryrun)
+    print("$ Concurrent uploads     :", workers)
+    print("$ Manifest               :", manifest_path)
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_manifest(path, manifest):
+    # Written to a temporary file first, so that an interrupted run never leaves a broken manifest
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
 
-def send_fits_file(filename,hashtag,target,flter,m_radius,dry_run):
-    with open(os.path.join(indir, filename), 'rb') as f:
-        if flter == False:
-            response = requests.post(
-            url = bhtom_url,
-                headers={
-                'hashtag': hashtag
-                },
-                data={
-                'target': target,
-                'data_product_type':  'fits_file',
-                'matching_radius': str(m_radius),
-                'dry_run': dry_run
-                 },
-                 files={'files': f}
-              )
-        else:
-            response = requests.post(
-            url = bhtom_url,
-                headers={
-                'hashtag': hashtag
-                },
-                data={
-                'target': target,
-                'filter': flter,
-                'data_product_type':  'fits_file',
-                'matching_radius': str(m_radius),
-                'dry_run': dry_run
-                 },
-                 files={'files': f}
-              )
-        server_response = response.status_code
-        ## print(response, server_response)
-        return response, server_response
+def create_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({'hashtag': inhash})
+    return session
+
+def send_fits_file(session, filename, target, flter, m_radius, dry_run):
+    data = {
+        'target': target,
+        'data_product_type': 'fits_file',
+        'matching_radius': str(m_radius),
+        'dry_run': dry_run
+    }
+    if flter:
+        data['filter'] = flter
+
+    delay = 1.0
+    for attempt in range(retries + 1):
+        try:
+            with open(os.path.join(indir, filename), 'rb') as f:
+                response = session.post(url=bhtom_url, data=data, files={'files': f}, timeout=(10, 300))
+            if response.status_code not in RETRY_CODES or attempt == retries:
+                return response, response.status_code
+        except requests.RequestException as e:
+            if attempt == retries:
+                return e, None
+        # Exponential backoff before the next attempt
+        time.sleep(delay)
+        delay *= 2
+
+def manifest_key(content_hash, target, url, dry_run):
+    # A file is only skipped when it was sent to the same target on the same server,
+    # and dry runs are recorded separately, so that a real run after a dry run still sends the files
+    key = '%s:%s:%s' % (content_hash, target, url)
+    return key + ':dryrun' if dry_run else key
+
+def upload_file(session, filename, manifest):
+    path = os.path.join(indir, filename)
+    try:
+        key = manifest_key(file_sha256(path), inobject, bhtom_url, dryrun)
+    except OSError as e:
+        return filename, 'error (%s)' % e, None, 0
+
+    with manifest_lock:
+        if key in manifest:
+            return filename, 'skipped', None, 0
+
+    start = time.perf_counter()
+    response, code = send_fits_file(session, filename, inobject, infilter, matching_radius, dryrun)
+    latency = time.perf_counter() - start
+
+    if code in SUCCESS_CODES:
+        try:
+            job_id = response.json().get('job_id')
+        except ValueError:
+            job_id = None
+        with manifest_lock:
+            manifest[key] = {'file': filename, 'job_id': job_id, 'status_code': code, 'dry_run': dryrun,
+                             'sent': time.strftime('%Y-%m-%dT%H:%M:%S')}
+            save_manifest(manifest_path, manifest)
+        return filename, 'success', latency, os.path.getsize(path)
+
+    return filename, 'error (%s)' % (code if code is not None else response), latency, 0
 
 if __name__ == '__main__':
     print("")
     input_arguments()
-    show_arguments()   
+    show_arguments()
 
-    number_of_files = len(os.listdir(indir))
+    filenames = sorted(f for f in os.listdir(indir)
+                       if os.path.isfile(os.path.join(indir, f)) and not f.startswith(MANIFEST_NAME))
+    number_of_files = len(filenames)
     if number_of_files > 0:
-        print("\n$$$ NOW SENDING DATA TO BHTOM (https://bh-tom.astrolabs.pl) $$$\n")
+        print("\n$$$ NOW SENDING DATA TO BHTOM (" + bhtom_url + ") $$$\n")
     else:
         print("\n# No files present inside '" + str(indir) + "'")
         print("  Program is terminating.\n")
         sys.exit(1)
-        
-    i       = 0
+
+    manifest = load_manifest(manifest_path)
+    session = create_session(workers)
+
     success = 0
+    skipped = 0
     error   = 0
-    total   = number_of_files
-    for filename in os.listdir(indir):
-        i += 1
-        total -= 1
-        prompt = "$ LEFT: " + str(total + 1) + " | SUCCESS: " + str(success) + " | ERROR: " + str(error) + " | " + \
-                 "> Now uploading '" + str(filename) + "' (" + str(i) + "/" + str(number_of_files) + ")               "
-        print(prompt, end="\r")
-        msg, code = send_fits_file(filename, inhash, inobject, infilter, matching_radius, dryrun)
-        if code == 200:
-            success += 1
-            subprocess.call('mkdir success 2>/dev/null', shell=True)
-            subprocess.call("mv %s/%s %s " % (indir, filename, "./success/"), shell=True)
-        else:
-            error += 1
-            subprocess.call('mkdir error 2>/dev/null', shell=True)
-            subprocess.call("cp %s/%s %s " % (indir, filename, "./error/"), shell=True)
-        time.sleep(0.01)
-    print("$ LEFT: " + str(total) + " | SUCCESS: " + str(success) + " | ERROR: " + str(error) + \
-          "                                                              ")
+    sent_bytes = 0
+    latencies = []
+    t0 = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(upload_file, session, filename, manifest) for filename in filenames]
+        for i, future in enumerate(as_completed(futures), start=1):
+            filename, result, latency, size = future.result()
+            if result == 'success':
+                success += 1
+                sent_bytes += size
+                latencies.append(latency)
+                os.makedirs('success', exist_ok=True)
+                shutil.move(os.path.join(indir, filename), os.path.join('success', filename))
+            elif result == 'skipped':
+                skipped += 1
+            else:
+                error += 1
+                os.makedirs('error', exist_ok=True)
+                try:
+                    shutil.copy(os.path.join(indir, filename), os.path.join('error', filename))
+                except OSError:
+                    # An unreadable file can't be copied, it is only reported
+                    pass
+            print("$ LEFT: " + str(number_of_files - i) + " | SUCCESS: " + str(success) + " | SKIPPED: " +
+                  str(skipped) + " | ERROR: " + str(error) + " | '" + str(filename) + "': " + result +
+                  "               ", end="\r")
+
+    elapsed = time.perf_counter() - t0
+    print("")
     print("$ All files have been processed.")
+    print("$ Sent %d files (%.1f MB) in %.1f s: %.2f files/s, %.2f MB/s" %
+          (success, sent_bytes / 1e6, elapsed, success / elapsed, sent_bytes / 1e6 / elapsed))
+    if latencies:
+        latencies.sort()
+        print("$ Upload latency: mean %.2f s, median %.2f s, p95 %.2f s, max %.2f s" %
+              (statistics.mean(latencies), statistics.median(latencies),
+               latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], latencies[-1]))
+    if skipped > 0:
+        print("  %d files were already uploaded according to the manifest and have been skipped." % skipped)
     if success > 0:
         print("  Files processed successfully have been moved to 'success' directory.")
     if error > 0:
-        print("  Files with errors have been copied to 'error' directory.")
+        print("  Files with errors have been copied to 'error' directory. Run the script again to retry them.")
     print("$ Thank you for using BHTOM!")
     print("  Program is terminating.\n")
-    sys.exit(0)
\ No newline at end of file
+    sys.exit(0)
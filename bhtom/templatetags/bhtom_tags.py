@@ -3,19 +3,20 @@ import plotly.graph_objs as go
 from django import template
 
 from tom_targets.models import Target
-from tom_observations import utils, facility
 from tom_dataproducts.models import DataProduct, ReducedDatum, ObservationRecord
 
-from astroplan import Observer, FixedTarget, AtNightConstraint, time_grid_from_range, moon_illumination
 import datetime
 import json
 from astropy.time import Time
 
 from astropy import units as u
-from astropy.coordinates import get_moon, get_sun, SkyCoord, AltAz
+from astropy.coordinates import SkyCoord
 import numpy as np
 import math
 
+from bhtom.utils.airmass import target_airmass
+from bhtom.utils.ephemeris import moon_illumination, moon_position, sun_position
+
 import logging
 logger = logging.getLogger(__name__)
 
@@ -26,13 +27,7 @@ def airmass_collapse(target):
     interval = 30 #min
     airmass_limit = 3.0
 
-    obj = Target
-    obj.ra = target.ra
-    obj.dec = target.dec
-    obj.epoch = 2000
-    obj.type = 'SIDEREAL' 
-
-    plot_data = get_24hr_airmass(obj, interval, airmass_limit)
+    plot_data = get_24hr_airmass(target, interval, airmass_limit)
     layout = go.Layout(
         yaxis=dict(range=[airmass_limit,1.0]),
         margin=dict(l=20,r=10,b=30,t=40),
@@ -71,71 +66,13 @@ def airmass_plot(context):
     }
 
 def get_24hr_airmass(target, interval, airmass_limit):
+    if target.ra is None or target.dec is None:
+        return []
 
-    plot_data = []
-    
-    start = Time(datetime.datetime.utcnow())
-    end = Time(start.datetime + datetime.timedelta(days=1))
-    time_range = time_grid_from_range(
-        time_range = [start, end],
-        time_resolution = interval*u.minute)
-    time_plot = time_range.datetime
-    
-    fixed_target = FixedTarget(name = target.name, 
-        coord = SkyCoord(
-            target.ra,
-            target.dec,
-            unit = 'deg'
-        )
-    )
-
-    #Hack to speed calculation up by factor of ~3
-    sun_coords = get_sun(time_range[int(len(time_range)/2)])
-    fixed_sun = FixedTarget(name = 'sun',
-        coord = SkyCoord(
-            sun_coords.ra,
-            sun_coords.dec,
-            unit = 'deg'
-        )
-    )
-
-    for observing_facility in facility.get_service_classes():
-
-        #        if observing_facility != 'LCO':
-        #            continue
-
-        observing_facility_class = facility.get_service_class(observing_facility)
-        sites = observing_facility_class().get_observing_sites()
+    time_plot, airmass_by_site = target_airmass(target.ra, target.dec, interval, airmass_limit)
 
-        for site, site_details in sites.items():
-
-            observer = Observer(
-                longitude = site_details.get('longitude')*u.deg,
-                latitude = site_details.get('latitude')*u.deg,
-                elevation = site_details.get('elevation')*u.m
-            )
-            
-            sun_alt = observer.altaz(time_range, fixed_sun).alt
-            obj_airmass = observer.altaz(time_range, fixed_target).secz
-
-            bad_indices = np.argwhere(
-                (obj_airmass >= airmass_limit) |
-                (obj_airmass <= 1) |
-                (sun_alt > -18*u.deg)  #between astro twilights
-            )
-
-            obj_airmass = [np.nan if i in bad_indices else float(x)
-                for i, x in enumerate(obj_airmass)]
-
-            label = '({facility}) {site}'.format(
-                facility = observing_facility, site = site
-            )
-
-            plot_data.append(
-                go.Scatter(x=time_plot, y=obj_airmass, mode='lines', name=label, )
-            )
-
-    return plot_data
+    return [go.Scatter(x=time_plot, y=obj_airmass, mode='lines', name=label, )
+            for label, obj_airmass in airmass_by_site.items()]
 
 @register.inclusion_tag('settings/lightcurve.html')
 def lightcurve(target):
@@ -208,7 +145,7 @@ def moon_vis(target):
     )
     
     obj_pos = SkyCoord(target.ra, target.dec, unit=u.deg)
-    moon_pos = get_moon(times)
+    moon_pos = moon_position(times)
 
     separations = moon_pos.separation(obj_pos).deg
     phases = moon_illumination(times)
@@ -308,8 +245,11 @@ def bh_target_distribution(targets):
     from astropy.time import Time
     jd_now = Time(datetime.datetime.utcnow()).jd
 
-    alpha_sun, delta_sun = get_sun_ra_dec()
-    moon_pos = get_moon(Time(datetime.datetime.utcnow()))
+    now = Time(datetime.datetime.utcnow())
+    sun_pos = sun_position(now)
+    alpha_sun = sun_pos.ra.deg
+    delta_sun = sun_pos.dec.deg
+    moon_pos = moon_position(now)
     alpha_moon = moon_pos.ra.deg
     delta_moon = moon_pos.dec.deg
 
@@ -401,23 +341,6 @@ def bh_target_distribution(targets):
     return {'figure': figure}
 
 
-def get_sun_ra_dec():
-        #computing Sun's position, https://en.wikipedia.org/wiki/Position_of_the_Sun
-    jd_now = Time(datetime.datetime.utcnow()).jd
-    n = jd_now - 2451545.0
-    L = 280.460 + 0.9856474*n #mean longitude of the Sun, in deg
-    g = 357.528 + 0.9856003*n #mean anomaly
-    while (L>360 and L>0): L-=360.
-    while (L<0 and L<360): L+=360. 
-    lam = L + 1.915*np.sin(np.deg2rad(g)) + 0.020*np.sin(np.deg2rad(2*g))
-    bet = 0.0
-    eps = 23.439-0.0000004*n
-    alpha_sun_rad = np.arctan2(np.cos(np.deg2rad(eps))*np.sin(np.deg2rad(lam)), np.cos(np.deg2rad(lam)))
-    delta_sun_rad = np.arcsin(np.sin(np.deg2rad(eps))*np.sin(np.deg2rad(lam)))
-    alpha_sun = np.rad2deg(alpha_sun_rad)
-    delta_sun = np.rad2deg(delta_sun_rad)
-    return alpha_sun, delta_sun
-
 #computes the angular separation in degrees from the SUN
 #returns truncated string
 #after https://www.skythisweek.info/angsep.pdf
@@ -51,6 +51,7 @@ def dataproduct_list(context, target):
                 if bhtomData is not None:
                     data_user = bhtomData.user_id
                     data_stored = bhtomData.data_stored
+                    status_message = bhtomData.status_message or None
                 else:
                     data_user = -1
 
@@ -50,8 +50,12 @@ def microlensing_for_target(context, target, slevel, clevel):
         else:
             values = json.loads(datum.value)
 
-        extra_data = json.loads(datum.rd_extra_data) if datum.rd_extra_data is not None else {}
-        if str(extra_data.get('facility')) == "Gaia":
+        if datum.rd_facility:
+            facility = datum.rd_facility
+        else:
+            extra_data = json.loads(datum.rd_extra_data) if datum.rd_extra_data is not None else {}
+            facility = extra_data.get('facility')
+        if str(facility) == "Gaia":
             try:
                 X.append(float(values.get('jd')))
                 X_timestamp.append(datum.timestamp)
@@ -29,6 +29,22 @@ def load_datum_json(json_values):
         return {}
 
 
+def datum_owner_and_facility(datum: ViewReducedDatum):
+    """
+    Returns the owner and facility of the datum. The interned provenance columns are used directly,
+    the JSON extra data is decoded only for the data which has no provenance.
+    """
+    owner = datum.rd_owner
+    facility = datum.rd_facility
+    if owner and facility:
+        return owner, facility
+
+    rd_extra_data = load_datum_json(datum.rd_extra_data)
+    dp_extra_data = load_datum_json(datum.dp_extra_data)
+    return (owner or rd_extra_data.get(OWNER_KEY, dp_extra_data.get(OWNER_KEY, '')),
+            facility or rd_extra_data.get(FACILITY_KEY, dp_extra_data.get(FACILITY_KEY, '')))
+
+
 def photometry_plot_data(target_id, user_id):
     photometry_data = {}
 
@@ -53,28 +69,23 @@ def photometry_plot_data(target_id, user_id):
 
         try:
             values = load_datum_json(datum.value)
-            rd_extra_data = load_datum_json(datum.rd_extra_data)
-            dp_extra_data = load_datum_json(datum.dp_extra_data)
+            owner, facility = datum_owner_and_facility(datum)
 
             if values.get('error', 0.0) < 99.0 and values.get('magnitude') < 99.0:
                 photometry_data.setdefault(values['filter'], {})
                 photometry_data[values['filter']].setdefault('time', []).append(datum.timestamp)
                 photometry_data[values['filter']].setdefault('magnitude', []).append(values.get('magnitude'))
                 photometry_data[values['filter']].setdefault('error', []).append(values.get('error', 0.0))
-                photometry_data[values['filter']].setdefault('owner', []).append(
-                    rd_extra_data.get(OWNER_KEY, dp_extra_data.get(OWNER_KEY, '')))
-                photometry_data[values['filter']].setdefault('facility', []).append(
-                    rd_extra_data.get(FACILITY_KEY, dp_extra_data.get(FACILITY_KEY, '')))
+                photometry_data[values['filter']].setdefault('owner', []).append(owner)
+                photometry_data[values['filter']].setdefault('facility', []).append(facility)
             # Non-detection
             elif values.get('magnitude') < 99.0:
                 non_detection_data.setdefault(values['filter'], {})
                 non_detection_data[values['filter']].setdefault('time', []).append(datum.timestamp)
                 non_detection_data[values['filter']].setdefault('magnitude', []).append(values.get('magnitude'))
                 non_detection_data[values['filter']].setdefault('error', []).append(values.get('error', 0.0))
-                non_detection_data[values['filter']].setdefault('owner', []).append(
-                    rd_extra_data.get(OWNER_KEY, dp_extra_data.get(OWNER_KEY, '')))
-                non_detection_data[values['filter']].setdefault('facility', []).append(
-                    rd_extra_data.get(FACILITY_KEY, dp_extra_data.get(FACILITY_KEY, '')))
+                non_detection_data[values['filter']].setdefault('owner', []).append(owner)
+                non_detection_data[values['filter']].setdefault('facility', []).append(facility)
         except Exception as e:
             logger.error(f'Exception when loading reduced data for target_id {target_id}: {e}')
             continue
@@ -137,24 +148,23 @@ def photometry_for_target(context, target):
 
         try:
             values = load_datum_json(datum.value)
-            rd_extra_data = load_datum_json(datum.rd_extra_data)
-            dp_extra_data = load_datum_json(datum.dp_extra_data)
+            owner, facility = datum_owner_and_facility(datum)
 
             if values.get('error', 0.0) < 99.0 and values.get('magnitude') < 99.0:
                 photometry_data.setdefault(values['filter'], {})
                 photometry_data[values['filter']].setdefault('time', []).append(datum.timestamp)
                 photometry_data[values['filter']].setdefault('magnitude', []).append(values.get('magnitude'))
                 photometry_data[values['filter']].setdefault('error', []).append(values.get('error', 0.0))
-                photometry_data[values['filter']].setdefault('owner', []).append(rd_extra_data.get(OWNER_KEY, dp_extra_data.get(OWNER_KEY, '')))
-                photometry_data[values['filter']].setdefault('facility', []).append(rd_extra_data.get(FACILITY_KEY, dp_extra_data.get(FACILITY_KEY, '')))
+                photometry_data[values['filter']].setdefault('owner', []).append(owner)
+                photometry_data[values['filter']].setdefault('facility', []).append(facility)
             # Non-detection
             elif values.get('magnitude') < 99.0:
                 non_detection_data.setdefault(values['filter'], {})
                 non_detection_data[values['filter']].setdefault('time', []).append(datum.timestamp)
                 non_detection_data[values['filter']].setdefault('magnitude', []).append(values.get('magnitude'))
                 non_detection_data[values['filter']].setdefault('error', []).append(values.get('error', 0.0))
-                non_detection_data[values['filter']].setdefault('owner', []).append(rd_extra_data.get(OWNER_KEY, dp_extra_data.get(OWNER_KEY, '')))
-                non_detection_data[values['filter']].setdefault('facility', []).append(rd_extra_data.get(FACILITY_KEY, dp_extra_data.get(FACILITY_KEY, '')))
+                non_detection_data[values['filter']].setdefault('owner', []).append(owner)
+                non_detection_data[values['filter']].setdefault('facility', []).append(facility)
         except Exception as e:
             logger.error(f'Exception when loading reduced data for target {target.name}: {e}')
             continue
@@ -32,7 +32,10 @@ from bhtom.views import DeleteObservatory, UpdateObservatory, ObservatoryList, C
 from bhtom.views import RegisterUser, DataProductFeatureView, UserUpdateView, photometry_download, fits_download
 from bhtom.views import TargetCreateView, TargetUpdateView, TargetDeleteView, TargetGroupingView
 from bhtom.views import data_download, CommentDeleteView, TargetAddRemoveGroupingView
+from .data_rest_api.chunked_upload import UploadSessionCreate, UploadSessionDetail, UploadSessionFinalize
+from .data_rest_api.crossmatch import Crossmatch
 from .data_rest_api.data_upload import PhotometryUpload
+from .data_rest_api.fits_status import FitsStatus
 from .views import BlackHoleListView
 
 router = routers.DefaultRouter()
@@ -72,6 +75,12 @@ urlpatterns = [
     path('api-auth/', include('rest_framework.urls', namespace='rest_framework')),
     path('dataUpload/', DataProductUploadView.as_view(), name='data_upload'),
     path('photometry-upload/', PhotometryUpload.as_view(), name='photometry_upload'),
+    path('upload-status/<int:job_id>/', FitsStatus.as_view(), name='upload_status'),
+    path('upload-session/', UploadSessionCreate.as_view(), name='upload_session_create'),
+    path('upload-session/<int:session_id>/', UploadSessionDetail.as_view(), name='upload_session_detail'),
+    path('upload-session/<int:session_id>/finalize/', UploadSessionFinalize.as_view(),
+         name='upload_session_finalize'),
+    path('crossmatch/', Crossmatch.as_view(), name='crossmatch'),
     path('instrument/create/', CreateInstrument.as_view(), name='instrument_create'),
     path('instrument/<int:pk>/delete/', DeleteInstrument.as_view(), name='instrument_delete'),
     path('instrument/<int:pk>/update/', UpdateInstrument.as_view(), name='instrument_update'),
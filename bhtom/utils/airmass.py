@@ -0,0 +1,98 @@
+import logging
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import List, Tuple
+
+import numpy as np
+from astropy import units as u
+from astropy.coordinates import AltAz, EarthLocation, SkyCoord
+from astropy.time import Time
+from django.core.cache import cache
+from tom_observations import facility
+
+from .ephemeris import sun_position
+
+logger = logging.getLogger(__name__)
+
+# Sun altitude above which the target is not observable (astronomical twilight)
+TWILIGHT_ALTITUDE: float = -18.
+
+
+@lru_cache(maxsize=1)
+def observing_sites() -> Tuple[Tuple[str, ...], EarthLocation]:
+    """
+    Labels and locations (one array) of the sites of all the facilities, loaded once per process
+    """
+    labels: List[str] = []
+    longitudes, latitudes, elevations = [], [], []
+
+    for observing_facility in facility.get_service_classes():
+        sites = facility.get_service_class(observing_facility)().get_observing_sites()
+        for site, site_details in sites.items():
+            labels.append('({facility}) {site}'.format(facility=observing_facility, site=site))
+            longitudes.append(site_details.get('longitude'))
+            latitudes.append(site_details.get('latitude'))
+            elevations.append(site_details.get('elevation'))
+
+    locations: EarthLocation = EarthLocation.from_geodetic(np.array(longitudes, dtype=float) * u.deg,
+                                                           np.array(latitudes, dtype=float) * u.deg,
+                                                           np.array(elevations, dtype=float) * u.m)
+    return tuple(labels), locations
+
+
+def time_bucket(interval: int) -> datetime:
+    """
+    Start of the current interval (minutes), shared by all the targets plotted in it
+    """
+    now: datetime = datetime.utcnow()
+    return now.replace(second=0, microsecond=0) - timedelta(minutes=now.minute % interval)
+
+
+def time_grid(start: datetime, interval: int) -> Time:
+    return Time(start) + np.arange(0, 24 * 60 + interval, interval) * u.minute
+
+
+def sites_altaz_frame(start: datetime, interval: int) -> AltAz:
+    """
+    AltAz frame of all the sites (first axis) at all the times of the grid (second axis)
+    """
+    _, locations = observing_sites()
+    return AltAz(obstime=time_grid(start, interval)[np.newaxis, :], location=locations[:, np.newaxis])
+
+
+@lru_cache(maxsize=8)
+def sun_altitudes(start: datetime, interval: int) -> np.ndarray:
+    """
+    Altitudes (degrees) of the Sun at all the sites and times of the grid, shared by all the targets
+    """
+    times: Time = time_grid(start, interval)
+    return sun_position(times).transform_to(sites_altaz_frame(start, interval)).alt.deg
+
+
+def target_airmass(ra: float, dec: float, interval: int, airmass_limit: float) -> Tuple[List[datetime], dict]:
+    """
+    Airmass of the target at each site over the next 24 hours, NaN where the target is not observable.
+    The target is transformed to the frames of all the sites at once, and the results are cached
+    for the time bucket.
+
+    :returns: times of the grid and the airmass by site label
+    """
+    start: datetime = time_bucket(interval)
+    labels, _ = observing_sites()
+    if not labels:
+        return time_grid(start, interval).datetime.tolist(), {}
+
+    cache_key: str = 'airmass_%s_%s_%s_%s_%s' % (ra, dec, start.isoformat(), interval, airmass_limit)
+
+    airmass_by_site = cache.get(cache_key)
+    if airmass_by_site is None:
+        airmass: np.ndarray = SkyCoord(ra, dec, unit=u.deg) \
+            .transform_to(sites_altaz_frame(start, interval)).secz.value
+
+        bad = (airmass >= airmass_limit) | (airmass <= 1) | (sun_altitudes(start, interval) > TWILIGHT_ALTITUDE)
+        airmass = np.where(bad, np.nan, airmass)
+
+        airmass_by_site = dict(zip(labels, airmass.tolist()))
+        cache.set(cache_key, airmass_by_site, interval * 60)
+
+    return time_grid(start, interval).datetime.tolist(), airmass_by_site
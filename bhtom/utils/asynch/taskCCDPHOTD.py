@@ -0,0 +1,122 @@
+import logging
+from typing import Any
+
+import requests
+from background_task import background
+from django.conf import settings
+from django.db import connection
+
+from bhtom.models import BHTomFits, Observatory
+from bhtom.utils.ccdphotd_scheduler import claim_next_fits, reclaim_stale_fits
+
+try:
+    from settings import local_settings as secret
+except ImportError:
+    secret = None
+
+logger = logging.getLogger(__name__)
+
+# Namespace of the PostgreSQL advisory locks held by the running dispatchers, one lock per slot
+DISPATCH_LOCK_NAMESPACE: int = 3770
+
+# Seconds to wait for CCDPHOTD to accept a file, well below CCDPHOTD_CLAIM_TIMEOUT_MINUTES so that
+# a file isn't put back in the queue while it is still being sent
+CCDPHOTD_REQUEST_TIMEOUT: int = 300
+
+
+def read_secret(secret_key: str, default_value: Any = '') -> str:
+    return getattr(secret, secret_key, default_value) if secret else default_value
+
+
+def send_fits_to_ccdphotd(fits: BHTomFits):
+    """
+    Sends one FITS file claimed by the dispatcher to CCDPHOTD and records the result in its status.
+    """
+    dp = fits.dataproduct_id
+    target = dp.target
+    instrument = fits.instrument_id
+    user = instrument.user_id
+
+    try:
+        observatory = Observatory.objects.get(id=instrument.observatory_id_id)
+
+        with open('data/' + format(dp), 'rb') as file:
+            response = requests.post(read_secret('CCDPHOTD_URL'),
+                                     {'job_id': fits.file_id,
+                                      'instrument': observatory.obsName,
+                                      'webhook_id': read_secret('CCDPHOTD_WEBHOOK_ID'),
+                                      'priority': fits.priority,
+                                      'instrument_prefix': observatory.prefix,
+                                      'target_name': target.name,
+                                      'target_ra': target.ra,
+                                      'target_dec': target.dec,
+                                      'username': user.username,
+                                      'hashtag': instrument.hashtag,
+                                      'dry_run': fits.allow_upload,
+                                      'fits_id': fits.file_id},
+                                     files={'fits_file': file},
+                                     timeout=CCDPHOTD_REQUEST_TIMEOUT)
+
+        if response.status_code == 201:
+            logger.info('successfull send to CCDPHOTD, fits id: ' + str(fits.file_id))
+            fits.status = 'S'
+            fits.status_message = 'Sent to photometry'
+        else:
+            error_message = 'CCDPHOTD error: %s' % response.status_code
+            logger.info(error_message)
+            fits.status = 'E'
+            fits.status_message = error_message
+
+    except Exception as e:
+        logger.error('send_fits_to_ccdphotd error: ' + str(e))
+        fits.status = 'E'
+        fits.status_message = 'Error: %s' % str(e)
+
+    fits.save(update_fields=['status', 'status_message'])
+
+
+def try_lock_slot(slot: int) -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_lock(%s, %s)', [DISPATCH_LOCK_NAMESPACE, slot])
+        return cursor.fetchone()[0]
+
+
+def unlock_slot(slot: int):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_unlock(%s, %s)', [DISPATCH_LOCK_NAMESPACE, slot])
+
+
+def schedule_ccdphotd_dispatch():
+    """
+    Makes sure that CCDPHOTD_DISPATCH_CONCURRENCY dispatchers are going to look at the waiting files.
+    A dispatcher already queued for a slot is replaced, so the queue doesn't grow with the uploads.
+    """
+    for slot in range(settings.CCDPHOTD_DISPATCH_CONCURRENCY):
+        dispatch_ccdphotd(slot, remove_existing_tasks=True)
+
+
+@background(queue='ccdphotd_queue')
+def dispatch_ccdphotd(slot: int):
+    """
+    Sends up to CCDPHOTD_DISPATCH_BATCH waiting FITS files to CCDPHOTD in fair-share order (see ccdphotd_scheduler),
+    one at a time, then queues itself again if files are still waiting. A dispatcher thus holds a worker thread
+    only for one batch, and the tasks of the other queues run in between.
+    At most one dispatcher runs per slot, so at most CCDPHOTD_DISPATCH_CONCURRENCY files are being sent at once.
+    """
+    reclaim_stale_fits()
+
+    # The dispatcher holding the slot queues the next batch when it's done
+    if not try_lock_slot(slot):
+        return
+
+    try:
+        for _ in range(settings.CCDPHOTD_DISPATCH_BATCH):
+            fits = claim_next_fits()
+            if fits is None:
+                break
+            send_fits_to_ccdphotd(fits)
+    finally:
+        unlock_slot(slot)
+
+    if BHTomFits.objects.filter(status='C').exists():
+        dispatch_ccdphotd(slot, remove_existing_tasks=True)
@@ -1,20 +1,101 @@
-import time
+from datetime import timedelta
+import urllib.parse
 
-from background_task import background, tasks
+from background_task import background
+from django.db.models import Q
+from django.utils import timezone
 import requests
 
-from bhtom.models import BHTomFits, Instrument, BHTomCpcsTaskAsynch
+from bhtom.harvesters.cpcs_alerts_harvester import filter_name, save_cpcs_datapoint
+from bhtom.harvesters.utils.last_jd import update_last_jd
+from bhtom.models import BHTomFits, Instrument, BHTomCpcsTaskAsynch, refresh_reduced_data_view
+from bhtom.utils.observation_data_extra_data_utils import ObservationDatapointExtraData
 from settings import settings
 import json
 import logging
 
 logger = logging.getLogger(__name__)
 
+# A task left IN_PROGRESS longer than this (e.g. the worker was killed) can be claimed again
+CLAIM_TIMEOUT = timedelta(minutes=15)
+
+
+def claim_cpcs_task(instanceID) -> bool:
+    """
+    Atomically moves the task to IN_PROGRESS, so that only one queue worker processes it,
+    even if the task has been enqueued more than once (e.g. resent from the admin while a retry was scheduled).
+    """
+    now = timezone.now()
+    return BHTomCpcsTaskAsynch.objects \
+        .filter(Q(status='TODO') | Q(status='IN_PROGRESS', next_attempt__lt=now), id=instanceID) \
+        .update(status='IN_PROGRESS', next_attempt=now + CLAIM_TIMEOUT) == 1
+
+
+def retry_or_fail(instance, fits, error):
+    """
+    Reschedules the task with an exponential backoff instead of waiting in the worker,
+    or marks it as failed after CPCS_MAX_TRIES attempts.
+    """
+    max_tries = getattr(settings, 'CPCS_MAX_TRIES', 5)
+
+    instance.last_error = error
+
+    if instance.number_tries >= max_tries:
+        logger.info('Cpcs task %s failed after %s tries' % (str(instance.id), str(instance.number_tries)))
+        instance.status = 'FAILED'
+        instance.next_attempt = None
+        instance.save(update_fields=['status', 'next_attempt', 'last_error'])
+        fits.status_message = 'Cpcs error'
+        fits.status = 'E'
+        fits.save(update_fields=['status', 'status_message'])
+        return
+
+    delay = getattr(settings, 'CPCS_RETRY_DELAY', 10) * 2 ** (instance.number_tries - 1)
+    logger.info('Cpcs task %s: retry %s in %s s' % (str(instance.id), str(instance.number_tries), str(delay)))
+
+    instance.number_tries += 1
+    instance.status = 'TODO'
+    instance.next_attempt = timezone.now() + timedelta(seconds=delay)
+    instance.save(update_fields=['status', 'number_tries', 'next_attempt', 'last_error'])
+
+    add_task_to_cpcs_queue(instance.id, schedule=delay)
+
+
+def save_calibrated_datapoint(instance, fits, instrument):
+    """
+    Adds the calibrated point to the target's light curve right away, under the same source location
+    as update_cpcs_lc uses, so the next CPCS harvest updates this point instead of adding another one.
+    """
+    target = fits.dataproduct_id.target
+
+    save_cpcs_datapoint(target, urllib.parse.quote(instance.target), fits.followupId,
+                        float(fits.mjd), float(fits.mag), float(fits.mag_err),
+                        filter_name(fits.cpsc_filter, fits.survey),
+                        ObservationDatapointExtraData(facility_name=instrument.observatory_id.obsName,
+                                                      owner=instrument.user_id.username),
+                        data_product=fits.dataproduct_id)
+    update_last_jd(target, jdmax=float(fits.mjd) + 2400000.5)
+    refresh_reduced_data_view()
+
+
+def fail(instance, fits, error):
+    instance.status = 'FAILED'
+    instance.next_attempt = None
+    instance.last_error = error
+    instance.save(update_fields=['status', 'next_attempt', 'last_error'])
+    fits.status = 'E'
+    fits.status_message = error
+    fits.save(update_fields=['status', 'status_message'])
+
 
 @background(queue='cpcs_file_queue')
 def add_task_to_cpcs_queue(instanceID):
     url_cpcs = settings.CPCS_BASE_URL + 'upload'
 
+    if not claim_cpcs_task(instanceID):
+        logger.info('Cpcs task %s already processed or claimed by another worker' % str(instanceID))
+        return
+
     try:
         instance = BHTomCpcsTaskAsynch.objects.get(id=instanceID)
         fits = BHTomFits.objects.get(file_id=instance.bhtomFits_id)
@@ -23,80 +104,75 @@ def add_task_to_cpcs_queue(instanceID):
         logger.error('instanceID: ' + str(instanceID) + ', ' + str(e))
         raise Exception(str(e))
 
-    if instance.status == 'TODO':
-        instance.status = 'IN_PROGRESS'
-        instance.save()
+    try:
+        logger.info('Start processing file: ' + str(instanceID))
+        with open(format(instance.url), 'rb') as file:
+
+            response = requests.post(url_cpcs,
+                                     {'MJD': fits.mjd, 'EventID': instance.target, 'expTime': fits.expTime,
+                                      'matchDist': fits.matchDist, 'dryRun': int(fits.allow_upload),
+                                      'forceFilter': fits.filter,
+                                      'fits_id': fits.file_id,
+                                      'hashtag': instrument.hashtag,
+                                      'outputFormat': 'json'}, files={'sexCat': file})
+
+    except requests.RequestException as e:
+        # CPCS unreachable, try again later
+        logger.error('send_to_cpcs error: ' + str(e))
+        retry_or_fail(instance, fits, str(e))
+        return
+    except Exception as e:
+        logger.error('send_to_cpcs error: ' + str(e))
+        fail(instance, fits, 'Error: %s' % str(e))
+        return
 
-    if instance.status == 'IN_PROGRESS':
+    if response.status_code == 201 or response.status_code == 200:
 
         try:
-            logger.info('Start processing file: ' + str(instanceID))
-            with open(format(instance.url), 'rb') as file:
-
-                response = requests.post(url_cpcs,
-                                         {'MJD': fits.mjd, 'EventID': instance.target, 'expTime': fits.expTime,
-                                          'matchDist': fits.matchDist, 'dryRun': int(fits.allow_upload),
-                                          'forceFilter': fits.filter,
-                                          'fits_id': fits.file_id,
-                                          'hashtag': instrument.hashtag,
-                                          'outputFormat': 'json'}, files={'sexCat': file})
-
-                if response.status_code == 201 or response.status_code == 200:
-
-                    json_data = json.loads(response.text)
-                    fits.status = 'F'
-                    fits.status_message = 'Finished'
-                    fits.cpcs_plot = json_data['image_link']
-                    fits.mag = json_data['mag']
-                    fits.mag_err = json_data['mag_err']
-                    fits.ra = json_data['ra']
-                    fits.dec = json_data['dec']
-                    fits.zeropoint = json_data['zeropoint']
-                    fits.outlier_fraction = json_data['outlier_fraction']
-                    fits.scatter = json_data['scatter']
-                    fits.npoints = json_data['npoints']
-                    fits.followupId = json_data['followup_id']
-                    fits.cpsc_filter = json_data['filter']
-                    fits.survey = json_data['survey']
-                    fits.save()
-
-                    instance.status = 'SUCCESS'
-                    instance.save()
-
-                    logger.info('Response status from cpcs: success, mag: ' + str(fits.mag) + ', mag_err: ' + str(
-                        fits.mag_err) + 'ra: ' + str(fits.ra)
-                                + ', dec:' + str(fits.dec) + ', zeropoint: ' + str(fits.zeropoint)
-                                + ', npoints: ' + str(fits.npoints) + ', scatter: ' + str(fits.scatter))
-                else:
-
-                    logger.info('Response status from cpcs: error, number of tries: ' + str(instance.number_tries))
-                    logger.error(str(response.content.decode()))
-
-                    if len(response.content.decode()) > 100:
-                        if instance.number_tries > 1:
-                            instance.status = 'FAILED'
-                            instance.save()
-                            fits.status_message = 'Cpcs error'
-                            fits.status = 'E'
-                            fits.save()
-                        else:
-                            instance.number_tries += 1
-                            instance.save()
-
-                            # czekamy 10 sekund na ponowne wyslanie
-                            time.sleep(10)
-                            add_task_to_cpcs_queue(instance.id)
-                    else:
-                        fits.status_message = 'Cpcs error: %s' % response.content.decode()
-                        fits.status = 'E'
-                        fits.save()
-                        instance.status = 'FAILED'
-                        instance.save()
-
+            json_data = json.loads(response.text)
+            fits.status = 'F'
+            fits.status_message = 'Finished'
+            fits.cpcs_plot = json_data['image_link']
+            fits.mag = json_data['mag']
+            fits.mag_err = json_data['mag_err']
+            fits.ra = json_data['ra']
+            fits.dec = json_data['dec']
+            fits.zeropoint = json_data['zeropoint']
+            fits.outlier_fraction = json_data['outlier_fraction']
+            fits.scatter = json_data['scatter']
+            fits.npoints = json_data['npoints']
+            fits.followupId = json_data['followup_id']
+            fits.cpsc_filter = json_data['filter']
+            fits.survey = json_data['survey']
+            fits.save()
         except Exception as e:
             logger.error('send_to_cpcs error: ' + str(e))
-            fits.status = 'E'
-            fits.status_message = 'Error: %s' % str(e)
-            fits.save()
-            instance.status = 'FAILED'
-            instance.save()
+            fail(instance, fits, 'Error: %s' % str(e))
+            return
+
+        instance.status = 'SUCCESS'
+        instance.next_attempt = None
+        instance.last_error = None
+        instance.save(update_fields=['status', 'next_attempt', 'last_error'])
+
+        if not fits.allow_upload:
+            try:
+                save_calibrated_datapoint(instance, fits, instrument)
+            except Exception as e:
+                # The point is still added by the next CPCS harvest
+                logger.error('Error while saving the calibrated point of fits %s: %s' % (str(fits.file_id), str(e)))
+
+        logger.info('Response status from cpcs: success, mag: ' + str(fits.mag) + ', mag_err: ' + str(
+            fits.mag_err) + 'ra: ' + str(fits.ra)
+                    + ', dec:' + str(fits.dec) + ', zeropoint: ' + str(fits.zeropoint)
+                    + ', npoints: ' + str(fits.npoints) + ', scatter: ' + str(fits.scatter))
+    else:
+
+        logger.info('Response status from cpcs: error, number of tries: ' + str(instance.number_tries))
+        logger.error(str(response.content.decode()))
+
+        if len(response.content.decode()) > 100:
+            # A long response is a server side error page, the request may succeed later
+            retry_or_fail(instance, fits, response.content.decode())
+        else:
+            fail(instance, fits, 'Cpcs error: %s' % response.content.decode())
@@ -0,0 +1,194 @@
+import logging
+import unicodedata
+from datetime import timedelta
+from typing import Any, Callable, Dict, List
+
+import requests
+from background_task import background
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import send_mail
+from django.db.models import F, Q
+from django.utils import timezone
+from tom_targets.models import Target
+
+from bhtom.models import BHTomOutboxMessage, Instrument
+
+try:
+    from settings import local_settings as secret
+except ImportError:
+    secret = None
+
+logger = logging.getLogger(__name__)
+
+# A message left in progress longer than this (e.g. the worker was killed) can be claimed again
+CLAIM_TIMEOUT = timedelta(minutes=15)
+
+CPCS_NEW_USER = 'cpcs_new_user'
+CPCS_NEW_EVENT = 'cpcs_new_event'
+CPCS_DELETE_POINT = 'cpcs_delete_point'
+EMAIL = 'email'
+
+
+def read_secret(secret_key: str, default_value: Any = '') -> Any:
+    return getattr(secret, secret_key, default_value) if secret else default_value
+
+
+class CpcsUnavailable(Exception):
+    pass
+
+
+def post_to_cpcs(endpoint: str, data: Dict[str, Any]) -> requests.Response:
+    response = requests.post(settings.CPCS_BASE_URL + endpoint, data, timeout=60)
+    if response.status_code >= 500:
+        # Worth retrying, other errors are reported by the caller
+        raise CpcsUnavailable('Cpcs error %s: %s' % (response.status_code, response.content.decode()[:1000]))
+    return response
+
+
+def enqueue_message(kind: str, **payload) -> BHTomOutboxMessage:
+    """
+    Records the message and queues its delivery. Both are plain database writes, so inside a transaction
+    (e.g. an admin save) they are committed or rolled back together with the change that caused the message,
+    and no HTTP call is made while the transaction holds its locks.
+    """
+    message = BHTomOutboxMessage.objects.create(kind=kind, payload=payload, next_attempt=timezone.now())
+    deliver_outbox_message(message.id)
+    return message
+
+
+def enqueue_email(subject: str, message: str, recipient_list: List[str]) -> BHTomOutboxMessage:
+    return enqueue_message(EMAIL, subject=subject, message=message, recipient_list=list(recipient_list))
+
+
+def deliver_cpcs_new_user(payload: Dict[str, Any]):
+    try:
+        instrument = Instrument.objects.select_related('observatory_id', 'user_id').get(id=payload['instrument_id'])
+    except Instrument.DoesNotExist:
+        logger.info('Instrument %s has been deleted' % str(payload['instrument_id']))
+        return
+
+    if instrument.hashtag:
+        logger.info('Hastag exist')
+        return
+
+    observatory = instrument.observatory_id
+    user = instrument.user_id
+
+    obsName = observatory.obsName + ', ' + user.first_name + ' ' + user.last_name
+    obsName = unicodedata.normalize('NFD', obsName).encode('ascii', 'ignore')
+
+    response = post_to_cpcs('newuser',
+                            {'obsName': obsName, 'lon': observatory.lon, 'lat': observatory.lat,
+                             'allow_upload': 1,
+                             'prefix': read_secret('CPCS_PREFIX_HASTAG') + observatory.prefix + '_' + str(user) + '_',
+                             'hashtag': 'ac643e2c196e144ef7758d5d225735f2'})
+
+    if response.status_code == 200:
+        # update() doesn't send pre/post_save, so the instrument is not queued for a hashtag again
+        Instrument.objects.filter(id=instrument.id).update(hashtag=response.content.decode('utf-8').split(': ')[1])
+        logger.info('Create_cpcs_user' + str(obsName))
+
+        enqueue_email('Wygenerowano hastag',
+                      read_secret('EMAILTEXT_CREATE_HASTAG') + str(observatory.obsName) + ', ' + str(user),
+                      read_secret('RECIPIENTEMAIL'))
+    else:
+        logger.error('Error from hastag' + str(obsName) + ': ' + response.content.decode('utf-8'))
+
+        Instrument.objects.filter(id=instrument.id).update(isActive=False)
+        enqueue_email('Blad przy generowaniu hastagu',
+                      read_secret('EMAILTEXT_ERROR_CREATE_HASTAG') + str(observatory.obsName) + ', ' + str(user),
+                      read_secret('RECIPIENTEMAIL'))
+
+
+def deliver_cpcs_new_event(payload: Dict[str, Any]):
+    user = User.objects.get(id=payload['user_id'])
+    target = Target.objects.get(id=payload['target_id'])
+    calib_server_name = target.extra_fields.get('calib_server_name')
+
+    instrument = Instrument.objects.filter(user_id=user.id).exclude(hashtag__isnull=True).first()
+    hastag = instrument.hashtag if instrument is not None else None
+    url = read_secret('url') + 'bhlist/' + str(target.id) + '/'
+
+    if hastag is not None and hastag != '' and calib_server_name:
+        response = post_to_cpcs('newevent', {'EventID': calib_server_name,
+                                             'ra': target.ra, 'dec': target.dec,
+                                             'hashtag': hastag, 'url': url,
+                                             'outputFormat': 'json'})
+
+        if response.status_code == 201 or response.status_code == 200:
+            logger.info('Successfully created target, user: %s' % str(user))
+        else:
+            logger.info('Cpcs error: %s' % str(response.content.decode()))
+    else:
+        logger.info('Hastag or calib_server_name is none')
+
+
+def deliver_cpcs_delete_point(payload: Dict[str, Any]):
+    response = post_to_cpcs('delpoint', {'followupid': payload['followupid'],
+                                         'hashtag': payload['hashtag'],
+                                         'outputFormat': 'json'})
+
+    if response.status_code == 201 or response.status_code == 200:
+        logger.info('Successfully deleted ')
+    else:
+        logger.info('Cpcs error: %s' % str(response.content.decode()))
+
+
+def deliver_email(payload: Dict[str, Any]):
+    send_mail(payload['subject'], payload['message'], settings.EMAIL_HOST_USER, payload['recipient_list'],
+              fail_silently=False)
+    logger.info('Send mail: ' + str(payload['recipient_list']))
+
+
+MESSAGE_HANDLERS: Dict[str, Callable[[Dict[str, Any]], None]] = {
+    CPCS_NEW_USER: deliver_cpcs_new_user,
+    CPCS_NEW_EVENT: deliver_cpcs_new_event,
+    CPCS_DELETE_POINT: deliver_cpcs_delete_point,
+    EMAIL: deliver_email,
+}
+
+
+def claim_outbox_message(message_id: int) -> bool:
+    now = timezone.now()
+    return BHTomOutboxMessage.objects \
+        .filter(Q(status='P') | Q(status='R', next_attempt__lt=now), id=message_id) \
+        .update(status='R', next_attempt=now + CLAIM_TIMEOUT, attempts=F('attempts') + 1) == 1
+
+
+@background(queue='outbox_queue')
+def deliver_outbox_message(message_id: int):
+    """
+    Delivers one outbox message. A failed delivery is rescheduled with an exponential backoff,
+    OUTBOX_RETRY_DELAY * 2^(n-1) seconds after the n-th attempt, up to OUTBOX_MAX_ATTEMPTS attempts.
+    """
+    if not claim_outbox_message(message_id):
+        logger.info('Outbox message %s already delivered or claimed by another worker' % str(message_id))
+        return
+
+    message = BHTomOutboxMessage.objects.get(id=message_id)
+
+    try:
+        MESSAGE_HANDLERS[message.kind](message.payload)
+    except Exception as e:
+        logger.error('Outbox message %s (%s), attempt %s: %s' % (str(message.id), message.kind,
+                                                                str(message.attempts), str(e)))
+        message.last_error = str(e)
+
+        if message.attempts >= getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 8):
+            message.status = 'F'
+            message.next_attempt = None
+            message.save(update_fields=['status', 'next_attempt', 'last_error'])
+            return
+
+        delay = getattr(settings, 'OUTBOX_RETRY_DELAY', 30) * 2 ** (message.attempts - 1)
+        message.status = 'P'
+        message.next_attempt = timezone.now() + timedelta(seconds=delay)
+        message.save(update_fields=['status', 'next_attempt', 'last_error'])
+        deliver_outbox_message(message.id, schedule=delay)
+        return
+
+    message.status = 'D'
+    message.next_attempt = None
+    message.delivered = timezone.now()
+    message.save(update_fields=['status', 'next_attempt', 'delivered'])
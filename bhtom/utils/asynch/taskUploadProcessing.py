@@ -0,0 +1,46 @@
+import logging
+from typing import List
+
+from background_task import background
+from tom_dataproducts.exceptions import InvalidFileFormatException
+from tom_dataproducts.models import DataProduct, ReducedDatum
+
+from bhtom.models import BHTomData, refresh_reduced_data_view
+from datatools.processors.data_processor import write_reduced_data
+from datatools.processors.process_pool import process_data_products
+
+logger = logging.getLogger(__name__)
+
+
+def set_upload_status(dp: DataProduct, status: str, status_message: str):
+    BHTomData.objects.filter(dataproduct_id=dp).update(status=status, status_message=status_message)
+
+
+@background(queue='upload_queue')
+def process_uploaded_data(data_product_ids: List[int]):
+    """
+    Parses the data files of one web upload and writes their data, one file at a time.
+    The files are parsed concurrently by the process pool of this worker, so that neither the pool nor
+    the parsing runs in the web request. The progress of each file is kept in the status of its BHTomData.
+    A file which can't be processed keeps its DataProduct, marked with the error, but none of its data.
+    """
+    data_products = list(DataProduct.objects.filter(id__in=data_product_ids).select_related('target'))
+    BHTomData.objects.filter(dataproduct_id__in=data_products).update(status='P', status_message='Processing')
+
+    for dp, result in process_data_products([(dp, None) for dp in data_products]):
+        try:
+            if isinstance(result, Exception):
+                raise result
+            write_reduced_data(dp, result)
+            set_upload_status(dp, 'D', 'Processed')
+            logger.info('Processed the uploaded file %s' % str(dp))
+        except Exception as e:
+            ReducedDatum.objects.filter(data_product=dp).delete()
+            if isinstance(e, InvalidFileFormatException):
+                set_upload_status(dp, 'E', 'File format invalid: %s' % str(e))
+            else:
+                logger.error('Error processing the uploaded file %s: %s' % (str(dp), str(e)))
+                set_upload_status(dp, 'E', 'There was a problem processing the file')
+
+    if data_products:
+        refresh_reduced_data_view()
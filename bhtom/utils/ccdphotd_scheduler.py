@@ -0,0 +1,109 @@
+import logging
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import DateTimeField, DurationField, ExpressionWrapper, F, IntegerField, QuerySet, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from tom_targets.models import Target
+
+from bhtom.models import BHTomDispatchBucket, BHTomFits, Instrument
+
+logger = logging.getLogger(__name__)
+
+
+def get_bucket_for_update(instrument: Instrument) -> BHTomDispatchBucket:
+    try:
+        bucket, _ = BHTomDispatchBucket.objects.select_for_update().get_or_create(
+            instrument=instrument,
+            defaults={'tokens': float(settings.CCDPHOTD_BUCKET_CAPACITY), 'updated': timezone.now()})
+    except IntegrityError:
+        # Created by another upload in the meantime
+        bucket = BHTomDispatchBucket.objects.select_for_update().get(instrument=instrument)
+    return bucket
+
+
+def target_priority(target: Target) -> float:
+    try:
+        return float(target.extra_fields.get('priority') or 0)
+    except (TypeError, ValueError):
+        return 0.
+
+
+def assign_dispatch_priority(instrument: Instrument, target: Target, offset: int = 0) -> int:
+    """
+    Takes a token from the instrument's bucket and returns the priority of the new file: the number of
+    seconds its dispatch is deferred (lower is dispatched first). Files within the instrument's share
+    are not deferred, each file over it is deferred by the time the bucket needs to refill one more token,
+    so a burst from one instrument doesn't hold back the files of the others.
+    Files of high priority targets are moved ahead by CCDPHOTD_TARGET_PRIORITY_SECONDS per priority point.
+    """
+    capacity: float = float(settings.CCDPHOTD_BUCKET_CAPACITY)
+    refill_per_second: float = settings.CCDPHOTD_BUCKET_REFILL_PER_MINUTE / 60.
+
+    with transaction.atomic():
+        bucket: BHTomDispatchBucket = get_bucket_for_update(instrument)
+        now = timezone.now()
+
+        bucket.tokens = min(capacity, bucket.tokens + (now - bucket.updated).total_seconds() * refill_per_second)
+        bucket.tokens -= 1.
+        bucket.updated = now
+        bucket.queued += 1
+        bucket.save(update_fields=['tokens', 'updated', 'queued'])
+
+    deferral: float = max(0., -bucket.tokens) / refill_per_second
+    boost: float = target_priority(target) * settings.CCDPHOTD_TARGET_PRIORITY_SECONDS
+
+    return int(deferral - boost) + offset
+
+
+def dispatch_order(queryset: QuerySet) -> QuerySet:
+    """
+    Orders the waiting files by the time they become due: upload time plus their priority in seconds.
+    Files uploaded before the priorities were assigned (priority NULL) are due at their upload time.
+    """
+    return queryset \
+        .annotate(due=ExpressionWrapper(F('start_time') + ExpressionWrapper(
+            Coalesce('priority', Value(0), output_field=IntegerField()) * Value(timedelta(seconds=1)),
+            output_field=DurationField()),
+            output_field=DateTimeField())) \
+        .order_by('due', 'file_id')
+
+
+def claim_next_fits() -> Optional[BHTomFits]:
+    """
+    Takes the next waiting file in fair-share order and marks it as being sent ('D'). Rows claimed by other
+    dispatchers are skipped, so any number of dispatchers can run concurrently.
+    """
+    with transaction.atomic():
+        fits: Optional[BHTomFits] = dispatch_order(BHTomFits.objects.select_for_update(skip_locked=True)
+                                                   .filter(status='C')).first()
+        if fits is None:
+            return None
+
+        fits.status = 'D'
+        fits.status_message = 'Sending to photometry'
+        fits.claimed_at = timezone.now()
+        fits.save(update_fields=['status', 'status_message', 'claimed_at'])
+
+        BHTomDispatchBucket.objects.filter(instrument_id=fits.instrument_id_id, queued__gt=0) \
+            .update(queued=F('queued') - 1)
+
+    return fits
+
+
+def reclaim_stale_fits() -> int:
+    """
+    Puts back in the queue the files claimed longer than CCDPHOTD_CLAIM_TIMEOUT_MINUTES ago,
+    whose dispatcher died or was stopped while sending them
+
+    :returns: number of files put back
+    """
+    stale_time = timezone.now() - timedelta(minutes=settings.CCDPHOTD_CLAIM_TIMEOUT_MINUTES)
+    reclaimed: int = BHTomFits.objects.filter(status='D', claimed_at__lt=stale_time) \
+        .update(status='C', status_message='Waiting for photometry', claimed_at=None)
+    if reclaimed:
+        logger.warning('Put back %d files claimed by stopped CCDPHOTD dispatchers' % reclaimed)
+    return reclaimed
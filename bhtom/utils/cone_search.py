@@ -0,0 +1,55 @@
+from math import cos, radians, sin
+from typing import Tuple
+
+from django.db.models import ExpressionWrapper, F, FloatField, Q, QuerySet, Value
+from django.db.models.functions import ACos, Coalesce, Cos, Degrees, Greatest, Least, Radians, Sin
+
+from .coordinate_utils import unit_vector
+
+
+def chord_length(radius: float) -> float:
+    """
+    Length of the chord between two points on the unit sphere separated by the given angle
+    @param radius: angle in degrees
+    """
+    return 2 * sin(radians(radius) / 2)
+
+
+def cone_search(queryset: QuerySet, ra: float, dec: float, radius: float) -> QuerySet:
+    """
+    Filters the targets within the radius (degrees) from ra, dec (degrees) and annotates them with the
+    separation in degrees.
+
+    The target positions are kept as unit vectors (cx, cy, cz) in the target summary, so the targets
+    within the cone lie in a cube around the unit vector of the center, with half-edge equal to the chord
+    of the radius. The cube is an indexed range lookup on each of the coordinates, and unlike a RA/Dec box
+    it is correct across RA=0/360 and at the poles. The exact check is a dot product of the unit vectors.
+
+    Targets without a position in the summary (e.g. before rebuild_target_summary has been run) are checked
+    with the spherical law of cosines on their RA and Dec instead, without the index.
+    """
+    center: Tuple[float, float, float] = unit_vector(ra, dec)
+    chord: float = chord_length(radius)
+
+    box = {}
+    for field, value in zip(('cx', 'cy', 'cz'), center):
+        box['summary__%s__gte' % field] = value - chord
+        box['summary__%s__lte' % field] = value + chord
+
+    summary_cos_separation = F('summary__cx') * Value(center[0]) + F('summary__cy') * Value(center[1]) + \
+        F('summary__cz') * Value(center[2])
+    coordinates_cos_separation = Sin(Radians('dec')) * Value(sin(radians(dec))) + \
+        Cos(Radians('dec')) * Value(cos(radians(dec))) * Cos(Radians('ra') - Value(radians(ra)))
+
+    cos_separation = ExpressionWrapper(Coalesce(summary_cos_separation, coordinates_cos_separation),
+                                       output_field=FloatField())
+
+    # Rounding can put the dot product of close positions slightly over 1
+    separation = ExpressionWrapper(
+        Degrees(ACos(Least(Greatest(cos_separation, Value(-1.)), Value(1.)))), output_field=FloatField())
+
+    return queryset \
+        .filter(Q(**box) | Q(summary__cx__isnull=True)) \
+        .annotate(cos_separation=cos_separation) \
+        .filter(cos_separation__gte=cos(radians(radius))) \
+        .annotate(separation=separation)
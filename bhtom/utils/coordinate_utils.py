@@ -1,21 +1,25 @@
-from datetime import datetime
+from math import cos, radians, sin
+from typing import Optional, Tuple
 
+import numpy as np
 from astropy import units as u
-from astropy.coordinates import get_sun, SkyCoord
+from astropy.coordinates import SkyCoord
 from astropy.time import Time
 from tom_targets.models import Target
 
+from .ephemeris import moon_position, sun_position
 
-def update_sun_separation(target: Target):
+
+def sun_moon_separations(ra: np.ndarray, dec: np.ndarray, time: Time) -> Tuple[np.ndarray, np.ndarray]:
     """
-    Update the sun separation using astropy
-    @param target: Observation target
+    Separations of the positions from the Sun and the Moon, computed for all the positions at once
+    @param ra: right ascensions in degrees
+    @param dec: declinations in degrees
+    @param time: time of the Sun and Moon positions
+    @return: Sun and Moon separations in degrees
     """
-    sun_pos = get_sun(Time(datetime.utcnow()))
-    obj_pos = SkyCoord(target.ra, target.dec, unit=u.deg)
-    Sun_sep = sun_pos.separation(obj_pos).deg
-    target.save(extras={'Sun_separation': Sun_sep})
-    print("DEBUG: new Sun separation: ", Sun_sep)
+    positions: SkyCoord = SkyCoord(ra, dec, unit=u.deg)
+    return sun_position(time).separation(positions).deg, moon_position(time).separation(positions).deg
 
 
 def fill_galactic_coordinates(target: Target) -> Target:
@@ -41,3 +45,17 @@ def fill_galactic_coordinates(target: Target) -> Target:
     target.galactic_lat = coordinates.galactic.b.degree
     target.galactic_lng = coordinates.galactic.l.degree
     return target
+
+
+def unit_vector(ra: Optional[float], dec: Optional[float]) -> Optional[Tuple[float, float, float]]:
+    """
+    Cartesian unit vector of the position on the celestial sphere
+    @param ra: right ascension in degrees
+    @param dec: declination in degrees
+    @return: (x, y, z), None if the position is unknown
+    """
+    if ra is None or dec is None:
+        return None
+
+    ra, dec = radians(ra), radians(dec)
+    return cos(dec) * cos(ra), cos(dec) * sin(ra), sin(dec)
@@ -0,0 +1,187 @@
+import csv
+import io
+import itertools
+import logging
+from typing import Any, Dict, IO, List, Optional, Tuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+from tom_targets.models import Target
+
+from .index_version import index_version, invalidate_index
+
+logger = logging.getLogger(__name__)
+
+# Changed whenever a target is saved or deleted
+INDEX_VERSION_CACHE_KEY: str = 'target_crossmatch_index_version'
+
+# Largest accepted match radius (degrees), which bounds the number of candidates of each position
+MAX_RADIUS: float = 5.
+# Positions are queried in groups whose radii differ at most twice, radii below this (degrees) form one group
+MIN_GROUP_RADIUS: float = 1. / 3600
+# Number of positions queried at once, which bounds the candidate lists held in memory
+QUERY_CHUNK_SIZE: int = 10000
+
+
+def unit_vectors(ra: np.ndarray, dec: np.ndarray) -> np.ndarray:
+    ra, dec = np.radians(ra), np.radians(dec)
+    return np.column_stack((np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra), np.sin(dec)))
+
+
+class TargetIndex:
+    """
+    KD-tree over the unit vectors of all the target positions
+    """
+
+    def __init__(self, version: str, rows: List[Tuple[int, str, float, float]]):
+        """
+        :param rows: id, name, ra and dec of the targets
+        """
+        self.version: str = version
+        self.ids: np.ndarray = np.array([row[0] for row in rows], dtype=np.int64)
+        self.names: List[str] = [row[1] for row in rows]
+        self.vectors: np.ndarray = unit_vectors(np.array([row[2] for row in rows], dtype=float),
+                                                np.array([row[3] for row in rows], dtype=float))
+        self.tree: Optional[cKDTree] = cKDTree(self.vectors) if rows else None
+
+    @classmethod
+    def build(cls, version: str) -> 'TargetIndex':
+        return cls(version, list(Target.objects.filter(ra__isnull=False, dec__isnull=False)
+                                 .order_by('id').values_list('id', 'name', 'ra', 'dec')))
+
+    def match(self, ra: np.ndarray, dec: np.ndarray, radius: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Finds the targets within radius of each position (all in degrees)
+
+        :returns: indices of the positions, indices of the matched targets and the separations in degrees
+        """
+        if self.tree is None or not len(ra):
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([])
+
+        points: np.ndarray = unit_vectors(ra, dec)
+
+        # Each group of positions of similar radius is searched with the chord of its largest radius,
+        # so that a few large radii don't widen the search of all the positions
+        groups: np.ndarray = np.floor(np.log2(np.maximum(radius, MIN_GROUP_RADIUS)))
+        matches = [self.match_points(points, radius, chunk)
+                   for group in np.unique(groups)
+                   for chunk in chunks(np.flatnonzero(groups == group), QUERY_CHUNK_SIZE)]
+
+        return tuple(np.concatenate(arrays) for arrays in zip(*matches))
+
+    def match_points(self, points: np.ndarray, radius: np.ndarray, indices: np.ndarray) \
+            -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Finds the targets within radius of the given positions, whose candidates are found with the chord
+        of their largest radius and then checked against the radius of their own position
+        """
+        chord: float = 2 * np.sin(np.radians(radius[indices].max()) / 2)
+        candidates = self.tree.query_ball_point(points[indices], chord)
+
+        counts: np.ndarray = np.fromiter((len(c) for c in candidates), dtype=np.int64, count=len(candidates))
+        position_index: np.ndarray = np.repeat(indices, counts)
+        target_index: np.ndarray = np.fromiter((i for c in candidates for i in c), dtype=np.int64,
+                                               count=counts.sum())
+
+        cos_separation = np.einsum('ij,ij->i', points[position_index], self.vectors[target_index])
+        separation: np.ndarray = np.degrees(np.arccos(np.clip(cos_separation, -1., 1.)))
+
+        within: np.ndarray = separation <= radius[position_index]
+        return position_index[within], target_index[within], separation[within]
+
+
+def chunks(indices: np.ndarray, size: int) -> List[np.ndarray]:
+    return [indices[i:i + size] for i in range(0, len(indices), size)]
+
+
+_target_index: Optional[TargetIndex] = None
+
+
+def invalidate_target_index():
+    invalidate_index(INDEX_VERSION_CACHE_KEY)
+
+
+def get_target_index() -> TargetIndex:
+    """
+    Returns the index of this process, built again if any target has changed since it was built
+    """
+    global _target_index
+
+    version: str = index_version(INDEX_VERSION_CACHE_KEY)
+
+    if _target_index is None or _target_index.version != version:
+        _target_index = TargetIndex.build(version)
+        logger.info('Built the crossmatch index of %d targets' % len(_target_index.ids))
+
+    return _target_index
+
+
+def crossmatch(ra: np.ndarray, dec: np.ndarray, radius: np.ndarray) -> List[Dict[str, Any]]:
+    """
+    Matches the positions against the target catalogue
+
+    :returns: one entry per matched pair, ordered by position and separation
+    """
+    index: TargetIndex = get_target_index()
+    position_index, target_index, separation = index.match(ra, dec, radius)
+
+    order: np.ndarray = np.lexsort((separation, position_index))
+
+    return [{'index': int(p),
+             'ra': float(ra[p]),
+             'dec': float(dec[p]),
+             'target_id': int(index.ids[t]),
+             'target': index.names[t],
+             'separation': float(s)}
+            for p, t, s in zip(position_index[order], target_index[order], separation[order])]
+
+
+def read_positions(rows: List[Dict[str, Any]], default_radius: Optional[float],
+                   max_positions: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Reads the positions from rows with 'ra', 'dec' and optionally 'radius' (degrees)
+
+    :raises ValueError: if there are more than max_positions rows or a row has no valid position or radius
+    """
+    check_position_count(len(rows), max_positions)
+
+    ra: np.ndarray = np.empty(len(rows))
+    dec: np.ndarray = np.empty(len(rows))
+    radius: np.ndarray = np.empty(len(rows))
+
+    for i, row in enumerate(rows):
+        try:
+            ra[i] = float(row['ra'])
+            dec[i] = float(row['dec'])
+            row_radius = row.get('radius')
+            radius[i] = float(row_radius if row_radius not in (None, '') else default_radius)
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f'Row {i}: ra, dec and radius must be numbers')
+
+        if not -90 <= dec[i] <= 90 or not 0 <= radius[i] <= MAX_RADIUS:
+            raise ValueError(f'Row {i}: dec must be within [-90, 90] and radius within [0, {MAX_RADIUS}] degrees')
+
+    return ra, dec, radius
+
+
+def read_positions_csv(file: IO, default_radius: Optional[float],
+                       max_positions: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Reads the positions from a CSV file with a header row naming the ra, dec and optionally radius columns.
+    At most max_positions + 1 rows are read, so that a longer file is rejected before being converted.
+    """
+    content = file.read()
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+
+    reader = csv.DictReader(io.StringIO(content))
+    if reader.fieldnames:
+        reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+
+    rows = list(itertools.islice(reader, max_positions + 1)) if max_positions is not None else list(reader)
+    return read_positions(rows, default_radius, max_positions)
+
+
+def check_position_count(count: int, max_positions: Optional[int]):
+    if max_positions is not None and count > max_positions:
+        raise ValueError(f'At most {max_positions} positions can be matched at once')
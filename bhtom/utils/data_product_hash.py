@@ -0,0 +1,67 @@
+import hashlib
+from typing import Optional, Union
+
+from django.contrib.auth.models import User
+from django.core.files import File
+from tom_targets.models import Target
+
+from bhtom.models import BHTomData, BHTomFits, Instrument
+
+READ_SIZE: int = 1024 * 1024
+
+# Data product types processed by CCDPHOTD/CPCS, tracked with BHTomFits
+FITS_DATA_PRODUCT_TYPES = ['fits_file', 'photometry_cpcs']
+
+
+def file_sha256(file: Union[str, File]) -> str:
+    """
+    Streams the file (a path or a Django File, e.g. an UploadedFile) through sha256
+    without loading it into memory at once.
+    """
+    sha256 = hashlib.sha256()
+
+    if isinstance(file, str):
+        with open(file, 'rb') as f:
+            for block in iter(lambda: f.read(READ_SIZE), b''):
+                sha256.update(block)
+    else:
+        for block in file.chunks(READ_SIZE):
+            sha256.update(block)
+        file.seek(0)
+
+    return sha256.hexdigest()
+
+
+def find_duplicate_upload(content_hash: str,
+                          target: Target,
+                          data_product_type: str,
+                          instrument: Optional[Instrument] = None,
+                          user: Optional[User] = None) -> Optional[Union[BHTomFits, BHTomData]]:
+    """
+    Returns the earlier upload of the same file for the target, if there is one.
+    FITS files are compared per instrument, other data per uploading user.
+    Uploads that ended with an error don't count, so that they can simply be sent again.
+    """
+    if not content_hash:
+        return None
+
+    if data_product_type in FITS_DATA_PRODUCT_TYPES:
+        if instrument is None:
+            return None
+        return BHTomFits.objects.filter(content_hash=content_hash,
+                                        dataproduct_id__target=target,
+                                        dataproduct_id__data_product_type=data_product_type,
+                                        instrument_id=instrument) \
+            .exclude(status='E') \
+            .order_by('-file_id') \
+            .first()
+
+    if user is None:
+        return None
+    return BHTomData.objects.filter(content_hash=content_hash,
+                                    dataproduct_id__target=target,
+                                    dataproduct_id__data_product_type=data_product_type,
+                                    user_id=user) \
+        .exclude(status='E') \
+        .order_by('-id') \
+        .first()
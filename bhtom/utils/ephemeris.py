@@ -0,0 +1,144 @@
+import logging
+import os
+import zipfile
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+import numpy as np
+from astroplan import moon_illumination as compute_moon_illumination
+from astropy import units as u
+from astropy.coordinates import GCRS, SkyCoord, get_moon, get_sun
+from astropy.time import Time
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Each daily table starts at 0 UT and covers this many days, so that it serves the plots of the next month
+EPHEMERIS_DAYS: int = 32
+EPHEMERIS_STEP_MINUTES: int = 30
+
+
+def unit_vectors(coordinates: SkyCoord) -> np.ndarray:
+    xyz: np.ndarray = coordinates.cartesian.xyz.value.T
+    return xyz / np.linalg.norm(xyz, axis=1)[:, np.newaxis]
+
+
+class EphemerisTable:
+    """
+    Geocentric (GCRS) directions of the Sun and the Moon and the Moon illumination on a fixed time grid,
+    interpolated for the times in between
+    """
+
+    def __init__(self, day: date, mjd: np.ndarray, sun: np.ndarray, moon: np.ndarray, moon_phase: np.ndarray):
+        self.day: date = day
+        self.mjd: np.ndarray = mjd
+        self.sun: np.ndarray = sun
+        self.moon: np.ndarray = moon
+        self.moon_phase: np.ndarray = moon_phase
+
+    @classmethod
+    def compute(cls, day: date) -> 'EphemerisTable':
+        start: Time = Time(datetime(day.year, day.month, day.day))
+        times: Time = start + np.arange(0, EPHEMERIS_DAYS * 24 * 60 + 1, EPHEMERIS_STEP_MINUTES) * u.minute
+
+        return cls(day, times.mjd, unit_vectors(get_sun(times)), unit_vectors(get_moon(times)),
+                   np.asarray(compute_moon_illumination(times), dtype=float))
+
+    @classmethod
+    def load(cls, day: date, path: str) -> 'EphemerisTable':
+        with np.load(path) as data:
+            return cls(day, data['mjd'], data['sun'], data['moon'], data['moon_phase'])
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path: str = path + '.%d.tmp.npz' % os.getpid()
+        np.savez(temp_path, mjd=self.mjd, sun=self.sun, moon=self.moon, moon_phase=self.moon_phase)
+        os.replace(temp_path, path)
+
+    def covers(self, times: Time) -> bool:
+        mjd = np.atleast_1d(times.mjd)
+        return bool(mjd.min() >= self.mjd[0] and mjd.max() <= self.mjd[-1])
+
+    def interpolate(self, values: np.ndarray, times: Time) -> np.ndarray:
+        mjd = times.mjd
+        if values.ndim == 1:
+            return np.interp(mjd, self.mjd, values)
+        return np.stack([np.interp(mjd, self.mjd, values[:, axis]) for axis in range(values.shape[1])], axis=-1)
+
+    def position(self, vectors: np.ndarray, times: Time) -> SkyCoord:
+        x, y, z = np.moveaxis(self.interpolate(vectors, times), -1, 0)
+        return SkyCoord(np.arctan2(y, x) * u.rad, np.arctan2(z, np.hypot(x, y)) * u.rad, frame=GCRS(obstime=times))
+
+
+def ephemeris_path(day: date) -> str:
+    return os.path.join(settings.EPHEMERIS_DIR, 'ephemeris-%s.npz' % day.isoformat())
+
+
+_ephemeris: Optional[EphemerisTable] = None
+
+
+def get_ephemeris(day: Optional[date] = None) -> EphemerisTable:
+    """
+    Returns the table of the day (today by default), read from disk or computed and saved there
+    by the first process asking for it
+    """
+    global _ephemeris
+
+    day = day or datetime.utcnow().date()
+    if _ephemeris is not None and _ephemeris.day == day:
+        return _ephemeris
+
+    path: str = ephemeris_path(day)
+    try:
+        table: EphemerisTable = EphemerisTable.load(day, path)
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        logger.info('Computing the ephemeris of %s' % day)
+        table = EphemerisTable.compute(day)
+        try:
+            table.save(path)
+        except OSError as e:
+            logger.error('Cannot save the ephemeris to %s: %s' % (path, e))
+
+    _ephemeris = table
+    return table
+
+
+def sun_position(times: Time) -> SkyCoord:
+    table: EphemerisTable = get_ephemeris()
+    if not table.covers(times):
+        return get_sun(times)
+    return table.position(table.sun, times)
+
+
+def moon_position(times: Time) -> SkyCoord:
+    table: EphemerisTable = get_ephemeris()
+    if not table.covers(times):
+        return get_moon(times)
+    return table.position(table.moon, times)
+
+
+def moon_illumination(times: Time) -> np.ndarray:
+    table: EphemerisTable = get_ephemeris()
+    if not table.covers(times):
+        return compute_moon_illumination(times)
+    return table.interpolate(table.moon_phase, times)
+
+
+def remove_old_ephemerides(keep_days: int = 2) -> int:
+    """
+    Removes the tables older than keep_days
+
+    :returns: number of removed files
+    """
+    oldest: str = 'ephemeris-%s.npz' % (datetime.utcnow().date() - timedelta(days=keep_days)).isoformat()
+    removed: int = 0
+    try:
+        names = os.listdir(settings.EPHEMERIS_DIR)
+    except OSError:
+        return 0
+
+    for name in names:
+        if name.startswith('ephemeris-') and name.endswith('.npz') and name < oldest:
+            os.remove(os.path.join(settings.EPHEMERIS_DIR, name))
+            removed += 1
+    return removed
@@ -0,0 +1,26 @@
+import uuid
+
+from django.core.cache import caches
+
+
+# The in-memory indices (crossmatch, target names) are kept by each process. Their version keys
+# are in the cache shared by all the processes, so each of them knows when its index is out of date.
+# The cache only holds these keys, so they aren't culled by other entries.
+
+def version_cache():
+    return caches['index_versions']
+
+
+def invalidate_index(version_key: str):
+    version_cache().set(version_key, uuid.uuid4().hex, None)
+
+
+def index_version(version_key: str) -> str:
+    cache = version_cache()
+    version = cache.get(version_key)
+    if version is None:
+        # Without a cached version the index is built again
+        version = uuid.uuid4().hex
+        cache.add(version_key, version, None)
+        version = cache.get(version_key) or version
+    return version
@@ -1,10 +1,10 @@
 import json
 from typing import Any, Dict, Optional, List
 
-from astropy.io import ascii
-from tom_dataproducts.exceptions import InvalidFileFormatException
 from tom_dataproducts.models import DataProduct
 
+from .upload_parse_context import UploadParseContext, get_parse_context
+
 FACILITY_NAME_KEY: str = "facility"
 OBSERVATION_TIME_KEY: str = "observation_time"
 OWNER_KEY: str = "owner"
@@ -47,6 +47,16 @@ class ObservationDatapointExtraData:
 
         return json.dumps(data)
 
+    def to_non_provenance_json_str(self) -> Optional[str]:
+        """
+            Returns the extra data without the facility and owner, which are stored
+            in ReducedDatumProvenance. None if nothing is left.
+        """
+        if not self.__observation_time:
+            return None
+
+        return json.dumps({OBSERVATION_TIME_KEY: self.__observation_time})
+
 
 def decode_datapoint_extra_data(data: Dict[str, Any]) -> ObservationDatapointExtraData:
     return ObservationDatapointExtraData(facility_name=data.get(FACILITY_NAME_KEY, None),
@@ -56,44 +66,49 @@ def decode_datapoint_extra_data(data: Dict[str, Any]) -> ObservationDatapointExt
 
 def get_comments_extra_info_for_spectroscopy_file(data_product: DataProduct,
                                                   facility_name: Optional[str],
-                                                  observer_name: Optional[str]) -> Optional[ObservationDatapointExtraData]:
+                                                  observer_name: Optional[str],
+                                                  parse_context: Optional[UploadParseContext] = None) \
+        -> Optional[ObservationDatapointExtraData]:
     """
         Returns the facility name, observer's name and observation time if provided in the comment section
         of the file
     """
-    return get_comments_extra_info_for_ascii_file(data_product, facility_name, observer_name, include_obs_time=True)
+    return get_comments_extra_info_for_ascii_file(data_product, facility_name, observer_name, include_obs_time=True,
+                                                  parse_context=parse_context)
 
 
 def get_comments_extra_info_for_photometry_file(data_product: DataProduct,
                                                 facility_name: Optional[str],
-                                                observer_name: Optional[str]) -> Optional[ObservationDatapointExtraData]:
+                                                observer_name: Optional[str],
+                                                parse_context: Optional[UploadParseContext] = None) \
+        -> Optional[ObservationDatapointExtraData]:
     """
         Returns the facility name and observer's if provided in the comment section
         of the file
     """
-    return get_comments_extra_info_for_ascii_file(data_product, facility_name, observer_name)
+    return get_comments_extra_info_for_ascii_file(data_product, facility_name, observer_name,
+                                                  parse_context=parse_context)
 
 
 def get_comments_extra_info_for_ascii_file(data_product: DataProduct,
                                            facility_name: Optional[str],
                                            observer_name: Optional[str],
-                                           include_obs_time: bool = False) -> Optional[ObservationDatapointExtraData]:
+                                           include_obs_time: bool = False,
+                                           parse_context: Optional[UploadParseContext] = None) \
+        -> Optional[ObservationDatapointExtraData]:
     """
         Returns the facility name and observer's if provided in the comment section
-        of the file
+        of the file. The file is read through the parse context, so that it isn't parsed again by the data processor.
     """
-    try:
-        data = ascii.read(data_product.data.path)
-    except InvalidFileFormatException:
-        return None
-
-    info: Dict[str, Optional[str]] = {}
+    parse_context = get_parse_context(data_product, parse_context)
 
     try:
-        comments = data.meta.get('comments', [])
+        comments = parse_context.comments
     except Exception as e:
         return None
 
+    info: Dict[str, Optional[str]] = {}
+
     include_info: List[str] = [COMMENTS_OBSERVATION_TIME_KEY] if include_obs_time else []
 
     for comment in comments:
@@ -36,6 +36,10 @@ def get_observation_facility(datum: ViewReducedDatum) -> Optional[str]:
         if datum.observation_record_facility:
             return datum.observation_record_facility
 
+        # Interned provenance of the reduced datum
+        if datum.rd_facility:
+            return datum.rd_facility
+
         # Then, check in reduced datum extra data
         # Some sources might save additional data, such as
         # the facility name, in the reduced datum extra data
@@ -49,7 +53,11 @@ def get_observation_facility(datum: ViewReducedDatum) -> Optional[str]:
 
 def get_observer_name(datum: ViewReducedDatum) -> Optional[str]:
     try:
-        # First, check in reduced datum extra data
+        # Interned provenance of the reduced datum
+        if datum.rd_owner:
+            return datum.rd_owner
+
+        # Then, check in reduced datum extra data
         # Some sources might save additional data, such as
         # the facility name, in the reduced datum extra data
         # There should be just one extra data object, as
@@ -0,0 +1,128 @@
+import ast
+import json
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from django.db import transaction
+from tom_dataproducts.models import DataProduct, ReducedDatum
+
+from bhtom.models import ReducedDatumExtraData, ReducedDatumProvenance
+from .observation_data_extra_data_utils import ObservationDatapointExtraData, decode_datapoint_extra_data
+
+logger = logging.getLogger(__name__)
+
+ProvenanceKey = Tuple[str, str, str]
+
+# Process-wide interning cache: (facility, owner, source) -> ReducedDatumProvenance id.
+# Provenance rows are never updated, so cached ids stay valid for the lifetime of the process.
+_provenance_ids: Dict[ProvenanceKey, int] = {}
+
+
+def provenance_key(facility: Optional[str],
+                   owner: Optional[str],
+                   source: Optional[str] = None) -> ProvenanceKey:
+    return (str(facility or '')[:255],
+            str(owner or '')[:255],
+            str(source or '')[:100])
+
+
+def intern_provenance(facility: Optional[str],
+                      owner: Optional[str],
+                      source: Optional[str] = None) -> int:
+    """
+        Returns the id of the ReducedDatumProvenance row for the given facility, owner and source,
+        creating it on the first use. Subsequent calls are served from the in-process cache.
+    """
+    key: ProvenanceKey = provenance_key(facility, owner, source)
+
+    provenance_id: Optional[int] = _provenance_ids.get(key)
+    if provenance_id is not None:
+        return provenance_id
+
+    provenance, _ = ReducedDatumProvenance.objects.get_or_create(facility=key[0], owner=key[1], source=key[2])
+
+    # Inside a transaction the row might have been created by it and still be rolled back,
+    # so it is only cached once committed (right away outside of a transaction)
+    provenance_id = provenance.id
+    transaction.on_commit(lambda: _provenance_ids.__setitem__(key, provenance_id))
+    return provenance_id
+
+
+def intern_extra_data(extra_data: ObservationDatapointExtraData,
+                      source: Optional[str] = None) -> Tuple[int, Optional[str]]:
+    """
+        Splits the extra data into the interned provenance id
+        and the JSON string of the remaining (per-datum) fields
+    """
+    return (intern_provenance(extra_data.facility_name, extra_data.owner, source),
+            extra_data.to_non_provenance_json_str())
+
+
+def intern_extra_data_json(extra_data_json: Optional[str],
+                           source: Optional[str] = None) -> Tuple[Optional[int], Optional[str]]:
+    """
+        Same as intern_extra_data, but for the legacy JSON strings stored in ReducedDatumExtraData.
+        Returns (None, extra_data_json) if the string can't be decoded.
+    """
+    try:
+        decoded: ObservationDatapointExtraData = decode_datapoint_extra_data(json.loads(extra_data_json))
+    except (TypeError, ValueError, AttributeError):
+        return None, extra_data_json
+
+    return intern_extra_data(decoded, source)
+
+
+def save_reduced_datum_extra_data(reduced_datum: ReducedDatum,
+                                  extra_data: ObservationDatapointExtraData) -> ReducedDatumExtraData:
+    provenance_id, extra_data_json = intern_extra_data(extra_data, reduced_datum.source_name)
+
+    rd_extra_data, _ = ReducedDatumExtraData.objects.update_or_create(
+        reduced_datum=reduced_datum,
+        defaults={'provenance_id': provenance_id,
+                  'extra_data': extra_data_json}
+    )
+    return rd_extra_data
+
+
+def parse_extra_data(extra_data: str) -> dict:
+    """
+        Parses the extra_data of a DataProduct, stored as JSON or, for older uploads, as the repr of a dict
+    """
+    try:
+        return json.loads(extra_data)
+    except ValueError:
+        return ast.literal_eval(extra_data)
+
+
+def data_product_provenance_id(data_product: DataProduct) -> Optional[int]:
+    """
+        Returns the interned provenance of the facility and owner given for an uploaded DataProduct
+        (kept in its extra_data), None if neither is known.
+    """
+    extra_data = data_product.extra_data
+    if not extra_data:
+        return None
+
+    try:
+        if not isinstance(extra_data, dict):
+            extra_data = parse_extra_data(extra_data)
+        decoded: ObservationDatapointExtraData = decode_datapoint_extra_data(extra_data)
+    except (TypeError, ValueError, AttributeError, SyntaxError) as e:
+        logger.warning('Cannot read the extra data of DataProduct %s: %s' % (str(data_product.pk), str(e)))
+        return None
+
+    if not decoded.facility_name and not decoded.owner:
+        return None
+
+    return intern_provenance(decoded.facility_name, decoded.owner)
+
+
+def bulk_create_reduced_datum_extra_data(reduced_data: List[ReducedDatum],
+                                         provenance_id: int) -> List[ReducedDatumExtraData]:
+    """
+        Attaches the same provenance to all given (already saved) reduced data with one INSERT
+    """
+    return ReducedDatumExtraData.objects.bulk_create([
+        ReducedDatumExtraData(reduced_datum=reduced_datum, provenance_id=provenance_id)
+        for reduced_datum in reduced_data
+    ])
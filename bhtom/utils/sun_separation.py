@@ -0,0 +1,64 @@
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+from astropy.time import Time
+from django.db import transaction
+from tom_targets.models import Target, TargetExtra
+
+from .coordinate_utils import sun_moon_separations
+from .target_summary import bulk_set_summary_field, is_summary_field
+
+logger = logging.getLogger(__name__)
+
+
+def bulk_set_extra_field(key: str, values: Dict[int, float], batch_size: int = 1000):
+    """
+    Sets the numeric extra field of many targets with one bulk update and one bulk insert.
+    The typed values are set as TargetExtra.save() would set them, which isn't called here.
+    """
+    extras: Dict[int, TargetExtra] = {extra.target_id: extra for extra in TargetExtra.objects.filter(key=key)}
+    to_update: List[TargetExtra] = []
+    to_create: List[TargetExtra] = []
+
+    for target_id, value in values.items():
+        extra: Optional[TargetExtra] = extras.get(target_id)
+        if extra is None:
+            extra = TargetExtra(target_id=target_id, key=key)
+            to_create.append(extra)
+        else:
+            to_update.append(extra)
+
+        extra.value = str(value)
+        extra.float_value = value
+        extra.bool_value = True
+        extra.time_value = None
+
+    with transaction.atomic():
+        TargetExtra.objects.bulk_update(to_update, ['value', 'float_value', 'bool_value', 'time_value'],
+                                        batch_size=batch_size)
+        TargetExtra.objects.bulk_create(to_create, batch_size=batch_size)
+        if is_summary_field(key):
+            bulk_set_summary_field(key, values, batch_size=batch_size)
+
+
+def update_sun_moon_separations(time: Optional[Time] = None) -> int:
+    """
+    Updates the Sun and Moon separations of all the sidereal targets, computed in one vectorized call
+
+    :returns: number of updated targets
+    """
+    rows = list(Target.objects.filter(type=Target.SIDEREAL, ra__isnull=False, dec__isnull=False)
+                .values_list('id', 'ra', 'dec'))
+    if not rows:
+        return 0
+
+    target_ids = [row[0] for row in rows]
+    sun_separations, moon_separations = sun_moon_separations(np.array([row[1] for row in rows], dtype=float),
+                                                             np.array([row[2] for row in rows], dtype=float),
+                                                             time or Time.now())
+
+    bulk_set_extra_field('Sun_separation', dict(zip(target_ids, sun_separations.tolist())))
+    bulk_set_extra_field('Moon_separation', dict(zip(target_ids, moon_separations.tolist())))
+
+    return len(rows)
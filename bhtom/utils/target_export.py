@@ -0,0 +1,61 @@
+import csv
+from typing import Dict, Iterator, List
+
+from django.db.models import Count, OuterRef, QuerySet, Subquery
+from tom_targets.models import Target, TargetExtra, TargetName
+
+
+class Echo:
+    """
+    File-like object returning the written line instead of buffering it
+    """
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def export_columns(queryset: QuerySet) -> Dict[str, Subquery]:
+    """
+    Returns the columns exported in addition to the target fields, as tom_targets.utils.export_targets:
+    the extra fields of the exported targets and one column per alias (name2, name3, ...).
+    Each column is an indexed subquery, so they are pivoted in the query of the targets.
+    """
+    target_ids = queryset.order_by().values('pk')
+
+    extra_keys: List[str] = sorted(TargetExtra.objects.filter(target__in=target_ids).order_by()
+                                   .values_list('key', flat=True).distinct())
+    max_alias_count: int = max(TargetName.objects.filter(target__in=target_ids).order_by()
+                               .values('target_id').annotate(count=Count('id')).values_list('count', flat=True),
+                               default=0)
+
+    columns: Dict[str, Subquery] = {
+        key: Subquery(TargetExtra.objects.filter(target=OuterRef('pk'), key=key).values('value')[:1])
+        for key in extra_keys
+    }
+    for index in range(max_alias_count):
+        columns[f'name{index + 2}'] = Subquery(TargetName.objects.filter(target=OuterRef('pk'))
+                                               .order_by('pk').values('name')[index:index + 1])
+    return columns
+
+
+def stream_targets_csv(queryset: QuerySet, chunk_size: int = 2000) -> Iterator[str]:
+    """
+    Yields the CSV of the targets line by line. The rows are read from a server-side cursor,
+    so the memory used doesn't grow with the number of targets.
+    """
+    target_fields: List[str] = [field.name for field in Target._meta.concrete_fields if field.name != 'id']
+    columns: Dict[str, Subquery] = export_columns(queryset)
+
+    # Annotated under other names, so that the extra fields can't clash with the target fields
+    annotations: Dict[str, Subquery] = {f'export_{index}': column for index, column in enumerate(columns.values())}
+    column_names: Dict[str, str] = dict(zip(annotations, columns))
+
+    rows = queryset.order_by('pk').annotate(**annotations) \
+        .values(*target_fields, *annotations) \
+        .iterator(chunk_size=chunk_size)
+
+    fields: List[str] = target_fields + list(columns)
+    writer = csv.DictWriter(Echo(), fieldnames=fields)
+    yield writer.writerow(dict(zip(fields, fields)))
+    for row in rows:
+        yield writer.writerow({column_names.get(key, key): value for key, value in row.items()})
@@ -0,0 +1,140 @@
+import logging
+from bisect import bisect_left
+from typing import Dict, List, Optional, Set, Tuple
+
+from django.conf import settings
+from tom_targets.models import Target, TargetExtra, TargetName
+
+from .index_version import index_version, invalidate_index
+
+logger = logging.getLogger(__name__)
+
+# Changed whenever a target, alias or survey name is saved or deleted
+INDEX_VERSION_CACHE_KEY: str = 'target_name_index_version'
+
+# Shorter searches, or searches matching more targets, are left to the database instead of
+# being sent to it as a list of ids
+MIN_SEARCH_LENGTH: int = 3
+MAX_SEARCH_IDS: int = 1000
+
+# Extra fields holding the names of the target in the surveys
+SURVEY_NAME_KEYS: List[str] = list(settings.ALERT_NAME_KEYS.values())
+
+
+class AmbiguousTargetNameError(Exception):
+    """
+    Raised when a name given instead of the primary name belongs to more than one target
+    """
+
+    def __init__(self, name: str):
+        super().__init__(f'Target name {name} is ambiguous, use the primary name of the target')
+
+
+def normalize_name(name: str) -> str:
+    return ' '.join(str(name).split()).casefold()
+
+
+class TargetNameIndex:
+    """
+    Index of the primary names, aliases and survey names of all the targets
+    """
+
+    def __init__(self, version: str):
+        self.version: str = version
+        self.primary: Dict[str, int] = {}
+        self.normalized: Dict[str, Set[int]] = {}
+
+        names: List[Tuple[int, str]] = list(Target.objects.values_list('id', 'name'))
+        for target_id, name in names:
+            self.primary[name] = target_id
+
+        names += list(TargetName.objects.values_list('target_id', 'name'))
+        names += list(TargetExtra.objects.filter(key__in=SURVEY_NAME_KEYS).exclude(value='')
+                      .values_list('target_id', 'value'))
+
+        for target_id, name in names:
+            self.normalized.setdefault(normalize_name(name), set()).add(target_id)
+
+        # Sorted for prefix lookups
+        self.keys: List[str] = sorted(self.normalized)
+
+    def exact(self, name: str) -> Set[int]:
+        """
+        Targets of the given primary name, or else of the given name, alias or survey name ignoring case
+        """
+        target_id: Optional[int] = self.primary.get(name)
+        if target_id is not None:
+            return {target_id}
+        return set(self.normalized.get(normalize_name(name), ()))
+
+    def prefix(self, prefix: str) -> Set[int]:
+        prefix = normalize_name(prefix)
+        target_ids: Set[int] = set()
+        for i in range(bisect_left(self.keys, prefix), len(self.keys)):
+            if not self.keys[i].startswith(prefix):
+                break
+            target_ids |= self.normalized[self.keys[i]]
+        return target_ids
+
+    def contains(self, part: str) -> Set[int]:
+        part = normalize_name(part)
+        target_ids: Set[int] = set()
+        for key, ids in self.normalized.items():
+            if part in key:
+                target_ids |= ids
+        return target_ids
+
+
+_name_index: Optional[TargetNameIndex] = None
+
+
+def invalidate_name_index():
+    invalidate_index(INDEX_VERSION_CACHE_KEY)
+
+
+def get_name_index() -> TargetNameIndex:
+    """
+    Returns the index of this process, built again if any name has changed since it was built
+    """
+    global _name_index
+
+    version: str = index_version(INDEX_VERSION_CACHE_KEY)
+
+    if _name_index is None or _name_index.version != version:
+        _name_index = TargetNameIndex(version)
+        logger.info('Built the name index of %d names' % len(_name_index.keys))
+
+    return _name_index
+
+
+def resolve_target_ids(name: str) -> Set[int]:
+    return get_name_index().exact(name)
+
+
+def prefix_target_ids(prefix: str) -> Set[int]:
+    return get_name_index().prefix(prefix)
+
+
+def search_target_ids(query: str) -> Set[int]:
+    """
+    Targets with a primary name, alias or survey name containing the query, ignoring case
+    """
+    return get_name_index().contains(query)
+
+
+def get_target_by_name(name: Optional[str]) -> Optional[Target]:
+    """
+    Returns the target of the given primary name, alias or survey name, None if there is no such target
+
+    :raises AmbiguousTargetNameError: if the name belongs to more than one target
+    """
+    if not name:
+        return None
+
+    target_ids: Set[int] = resolve_target_ids(name)
+    if len(target_ids) > 1:
+        raise AmbiguousTargetNameError(name)
+    if not target_ids:
+        return None
+
+    return Target.objects.filter(id=target_ids.pop()).first()
@@ -0,0 +1,114 @@
+import logging
+from typing import Any, Dict, Iterable, Set, Tuple
+
+from django.db import IntegrityError, models, transaction
+from tom_targets.models import Target, TargetExtra
+
+from bhtom.models import BHTomTargetSummary
+from .coordinate_utils import unit_vector
+
+logger = logging.getLogger(__name__)
+
+POSITION_FIELDS: Tuple[str, ...] = ('cx', 'cy', 'cz')
+
+# Extra fields with a column in BHTomTargetSummary
+SUMMARY_FIELDS: Dict[str, models.Field] = {field.name: field for field in BHTomTargetSummary._meta.fields
+                                           if field.name != 'target' and field.name not in POSITION_FIELDS}
+
+
+def is_summary_field(key: str) -> bool:
+    return key in SUMMARY_FIELDS
+
+
+def summary_value(target_extra: TargetExtra) -> Any:
+    """
+    Returns the value of the extra field converted to the type of its summary column,
+    as TargetExtra.save() converted it
+    """
+    field: models.Field = SUMMARY_FIELDS[target_extra.key]
+    if isinstance(field, models.FloatField):
+        return target_extra.float_value
+    if isinstance(field, models.BooleanField):
+        return target_extra.bool_value
+    if isinstance(field, models.DateTimeField):
+        return target_extra.time_value
+    return target_extra.value
+
+
+def set_summary_fields(target_id: int, **values):
+    if BHTomTargetSummary.objects.filter(target_id=target_id).update(**values):
+        return
+
+    try:
+        with transaction.atomic():
+            BHTomTargetSummary.objects.create(target_id=target_id, **values)
+    except IntegrityError:
+        # Created by another write in the meantime
+        BHTomTargetSummary.objects.filter(target_id=target_id).update(**values)
+
+
+def position_fields(ra: float, dec: float) -> Dict[str, float]:
+    return dict(zip(POSITION_FIELDS, unit_vector(ra, dec) or (None, None, None)))
+
+
+def update_target_position(target: Target):
+    set_summary_fields(target.id, **position_fields(target.ra, target.dec))
+
+
+def bulk_set_summary_field(key: str, values: Dict[int, Any], batch_size: int = 1000):
+    """
+    Sets the field of many targets at once, for bulk updates of TargetExtra which don't send signals
+    """
+    existing: Set[int] = set(BHTomTargetSummary.objects.filter(target_id__in=list(values))
+                             .values_list('target_id', flat=True))
+
+    with transaction.atomic():
+        BHTomTargetSummary.objects.bulk_update(
+            [BHTomTargetSummary(target_id=target_id, **{key: value})
+             for target_id, value in values.items() if target_id in existing],
+            [key], batch_size=batch_size)
+        BHTomTargetSummary.objects.bulk_create(
+            [BHTomTargetSummary(target_id=target_id, **{key: value})
+             for target_id, value in values.items() if target_id not in existing],
+            batch_size=batch_size, ignore_conflicts=True)
+
+
+def update_target_summary(target_extra: TargetExtra):
+    if is_summary_field(target_extra.key):
+        set_summary_fields(target_extra.target_id, **{target_extra.key: summary_value(target_extra)})
+
+
+def clear_target_summary_field(target_extra: TargetExtra):
+    if is_summary_field(target_extra.key):
+        BHTomTargetSummary.objects.filter(target_id=target_extra.target_id).update(**{target_extra.key: None})
+
+
+def summary_fields_of(extras: Iterable[TargetExtra]) -> Dict[str, Any]:
+    return {extra.key: summary_value(extra) for extra in extras if is_summary_field(extra.key)}
+
+
+def rebuild_target_summaries(target_ids: Iterable[int]) -> int:
+    """
+    Recreates the summary rows of the given targets from their positions and TargetExtra rows
+
+    :returns: number of written rows
+    """
+    target_ids: Set[int] = set(target_ids)
+    extras_by_target: Dict[int, list] = {target_id: [] for target_id in target_ids}
+
+    for extra in TargetExtra.objects.filter(target_id__in=target_ids, key__in=list(SUMMARY_FIELDS)):
+        extras_by_target[extra.target_id].append(extra)
+
+    positions: Dict[int, Tuple[float, float]] = {target_id: (ra, dec) for target_id, ra, dec in
+                                                  Target.objects.filter(id__in=target_ids)
+                                                  .values_list('id', 'ra', 'dec')}
+
+    with transaction.atomic():
+        BHTomTargetSummary.objects.filter(target_id__in=target_ids).delete()
+        BHTomTargetSummary.objects.bulk_create([
+            BHTomTargetSummary(target_id=target_id, **summary_fields_of(extras),
+                               **position_fields(*positions[target_id]))
+            for target_id, extras in extras_by_target.items() if target_id in positions
+        ])
+
+    return len(positions)
@@ -0,0 +1,58 @@
+import mimetypes
+from typing import List, Optional
+
+from astropy.io import ascii
+from astropy.table import Table
+from tom_dataproducts.models import DataProduct
+
+
+class UploadParseContext:
+    """
+        Parsing state of one uploaded DataProduct, shared between data_product_post_upload
+        and the data processor, so that the file is resolved, typed and read at most once.
+        The table is read lazily, on first access.
+    """
+
+    PLAINTEXT_MIMETYPES: List[str] = ['text/plain', 'text/csv']
+
+    def __init__(self, data_product: DataProduct):
+        self.__data_product: DataProduct = data_product
+        self.__path: str = data_product.data.path
+        self.__mimetype: Optional[str] = mimetypes.guess_type(self.__path)[0]
+        self.__table: Optional[Table] = None
+
+    @property
+    def data_product(self) -> DataProduct:
+        return self.__data_product
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    @property
+    def mimetype(self) -> Optional[str]:
+        return self.__mimetype
+
+    @property
+    def is_plaintext(self) -> bool:
+        return self.__mimetype in self.PLAINTEXT_MIMETYPES
+
+    @property
+    def table(self) -> Table:
+        if self.__table is None:
+            self.__table = ascii.read(self.__path, fast_reader=True)
+        return self.__table
+
+    @property
+    def comments(self) -> List[str]:
+        return self.table.meta.get('comments', [])
+
+
+def get_parse_context(data_product: DataProduct,
+                      parse_context: Optional[UploadParseContext] = None) -> UploadParseContext:
+    """
+        Returns the given context if it belongs to the data product, otherwise creates a new one
+    """
+    if parse_context is not None and parse_context.data_product is data_product:
+        return parse_context
+    return UploadParseContext(data_product)
@@ -0,0 +1,60 @@
+import logging
+import os
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from bhtom.models import BHTomUploadSession
+
+logger = logging.getLogger(__name__)
+
+
+def session_expiry_time() -> datetime:
+    """
+    Open sessions not modified since this time are abandoned
+    """
+    return timezone.now() - timedelta(hours=settings.UPLOAD_SESSION_EXPIRY_HOURS)
+
+
+def is_expired(session: BHTomUploadSession) -> bool:
+    return session.status == 'X' or (session.status == 'O' and session.modified < session_expiry_time())
+
+
+def expire_upload_session(session: BHTomUploadSession) -> bool:
+    """
+    Marks the abandoned session as expired and removes the file reserved for it.
+    The session is only expired if it hasn't been modified in the meantime.
+
+    :returns: True if the session has been expired by this call
+    """
+    expired: bool = BHTomUploadSession.objects \
+        .filter(id=session.id, status='O', modified__lt=session_expiry_time()) \
+        .update(status='X') == 1
+    if not expired:
+        return False
+
+    session.status = 'X'
+    try:
+        os.remove(default_storage.path(session.path))
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.error('Cannot remove the file of the upload session %s: %s' % (str(session.id), str(e)))
+
+    logger.info('Upload session %s expired' % str(session.id))
+    return True
+
+
+def expire_upload_sessions() -> int:
+    """
+    Expires all the abandoned sessions
+
+    :returns: number of expired sessions
+    """
+    expired: int = 0
+    for session in BHTomUploadSession.objects.filter(status='O', modified__lt=session_expiry_time()).iterator():
+        if expire_upload_session(session):
+            expired += 1
+    return expired
@@ -1,12 +1,11 @@
 from urllib.parse import urlencode
 
 from astropy.time import Time
-from datetime import datetime, timedelta
+from datetime import datetime
 from io import StringIO
 import json
 import os
 import os.path
-import numpy as np
 import logging
 import requests
 import base64
@@ -20,15 +19,12 @@ from django.utils.text import slugify
 from jsonschema.exceptions import ValidationError
 from tom_catalogs.forms import CatalogQueryForm
 from tom_catalogs.harvester import MissingDataException
-from tom_targets.utils import export_targets
 from tom_targets.views import TargetCreateView, TargetListView
-from tom_targets.templatetags.targets_extras import target_extra_field
 from tom_targets.models import Target, TargetList
 from bhtom.forms import (SiderealTargetCreateForm, NonSiderealTargetCreateForm, TargetExtraFormset, TargetNamesFormset)
 from tom_common.hooks import run_hook
 from tom_common.hints import add_hint
 
-from tom_dataproducts.data_processor import run_data_processor
 from tom_dataproducts.exceptions import InvalidFileFormatException
 from tom_dataproducts.models import ReducedDatum, DataProduct
 
@@ -59,10 +55,10 @@ from django.contrib.auth import update_session_auth_hash
 from django.core.management import call_command
 from django.core.mail import send_mail
 from django.db import transaction
+from django.db.models import Case, F, FloatField, Q, Value, When
 from django.shortcuts import redirect
 from django.urls import reverse_lazy, reverse
 from django.utils.safestring import mark_safe
-from django.utils import timezone
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 from django.views.generic.detail import DetailView
 from django.views.generic.list import ListView
@@ -72,6 +68,12 @@ from django.http import HttpResponseRedirect, QueryDict
 from django.contrib.auth.mixins import PermissionRequiredMixin, LoginRequiredMixin
 from guardian.shortcuts import get_objects_for_user
 
+from bhtom.utils.data_product_hash import file_sha256, find_duplicate_upload
+from bhtom.utils.target_export import stream_targets_csv
+from bhtom.utils.target_names import AmbiguousTargetNameError, get_target_by_name
+from bhtom.utils.upload_parse_context import UploadParseContext
+from datatools.processors.data_processor import run_data_processor
+from bhtom.utils.asynch.taskUploadProcessing import process_uploaded_data
 from bhtom.utils.photometry_and_spectroscopy_data_utils import save_photometry_data_for_target_to_csv_file, \
     get_photometry_data_stats, save_spectroscopy_data_for_target_to_csv_file, \
     get_photometry_stats_latex
@@ -106,20 +108,30 @@ def make_magrecent(all_phot, jd_now):
     return mag_recent
 
 
-# computes priority based on dt and expected cadence
-# if observed within the cadence, then returns just the pure target priority
-# if not, then priority increases
-def computePriority(dt, priority, cadence):
-    ret = 0
-    # if (dt<cadence): ret = 1 #ok
-    # else:
-    #     if (cadence!=0 and dt/cadence>1 and dt/cadence<2): ret = 2
-    #     if (cadence!=0 and dt/cadence>2): ret = 3
+def annotate_cadence_priority(qs, jd_now):
+    """
+    Annotates the targets with dt (days since the last observation, -1 if unknown) and cadencepriority,
+    computed from the jdlastobs, priority and cadence columns of the target summary.
+    If observed within the cadence, the priority is at most the pure target priority, if not, it increases
+    linearly: dt / cadence * priority (0 for no cadence).
+    A target without the last observation gets dt=10 in the priority, without priority or cadence 1 for both.
+    """
+    jd_now = Value(jd_now, output_field=FloatField())
+    has_priority_and_cadence = Q(priority_value__isnull=False, cadence_value__isnull=False)
+
+    return qs \
+        .annotate(jdlastobs_value=F('summary__jdlastobs'),
+                  priority_value=F('summary__priority'),
+                  cadence_value=F('summary__cadence')) \
+        .annotate(dt=Case(When(jdlastobs_value__isnull=False, then=jd_now - F('jdlastobs_value')),
+                          default=Value(-1.), output_field=FloatField()),
+                  dt_for_priority=Case(When(jdlastobs_value__isnull=False, then=jd_now - F('jdlastobs_value')),
+                                       default=Value(10.), output_field=FloatField())) \
+        .annotate(cadencepriority=Case(
+            When(has_priority_and_cadence & Q(cadence_value=0), then=Value(0.)),
+            When(has_priority_and_cadence, then=F('dt_for_priority') / F('cadence_value') * F('priority_value')),
+            default=F('dt_for_priority'), output_field=FloatField()))
 
-    # alternative - linear scale
-    if (cadence != 0):
-        ret = dt / cadence
-    return ret * priority
 
 def deleteFits(dp):
     try:
@@ -159,41 +171,10 @@ class BlackHoleListView(PermissionRequiredMixin, FilterView):
     def get_queryset(self, *args, **kwargs):
 
         qs = super().get_queryset(*args, **kwargs)
-        jd_now = Time(datetime.utcnow()).jd
-        prioritylist = []
-        pklist = []
-
-        for target in qs:
-            try:
-                # if empty
-                last = float(target_extra_field(target=target, name='jdlastobs'))
-                target.dt = (jd_now - last)
-                dt = (jd_now - last)
-            except:
-                dt = 10
-                target.dt = -1.
-
-            try:
-                priority = float(target_extra_field(target=target, name='priority'))
-                cadence = float(target_extra_field(target=target, name='cadence'))
-            except:
-                priority = 1
-                cadence = 1
-
-            target.cadencepriority = computePriority(dt, priority, cadence)
-            prioritylist.append(target.cadencepriority)
-            pklist.append(target.pk)
-
-        prioritylist = np.array(prioritylist)
-        idxs = list(prioritylist.argsort())
-        sorted_pklist = np.array(pklist)[idxs]
-
-        clauses = ' '.join(['WHEN tom_targets_target.id=%s THEN %s' % (pk, i) for i, pk in enumerate(sorted_pklist)])
-        ordering = '(CASE %s END)' % clauses
-        qsnew = qs.extra(
-            select={'ordering': ordering}, order_by=('-ordering',))
 
-        return qsnew
+        # Sorted and paginated in the database, the pk keeps the order of equal priorities stable between pages
+        return annotate_cadence_priority(qs.select_related('summary'), Time(datetime.utcnow()).jd) \
+            .order_by('-cadencepriority', 'pk')
 
     def get_context_data(self, *args, **kwargs):
 
@@ -203,29 +184,6 @@ class BlackHoleListView(PermissionRequiredMixin, FilterView):
                                 if self.request.user.is_authenticated
                                 else TargetList.objects.none())
         context['query_string'] = self.request.META['QUERY_STRING']
-        jd_now = Time(datetime.utcnow()).jd
-
-        prioritylist = []
-
-        for target in context['object_list']:
-            try:
-                # if empty
-                last = float(target_extra_field(target=target, name='jdlastobs'))
-                target.dt = (jd_now - last)
-                dt = (jd_now - last)
-            except:
-                dt = 10
-                target.dt = -1.
-
-            try:
-                priority = float(target_extra_field(target=target, name='priority'))
-                cadence = float(target_extra_field(target=target, name='cadence'))
-            except:
-                priority = 1
-                cadence = 1
-
-            target.cadencepriority = computePriority(dt, priority, cadence)
-            prioritylist.append(target.cadencepriority)
 
         return context
 
@@ -608,10 +566,7 @@ class TargetExportView(TargetListView):
         :returns: response class with CSV
         :rtype: StreamingHttpResponse
         """
-        qs = context['filter'].qs.values()
-        file_buffer = export_targets(qs)
-        file_buffer.seek(0)  # goto the beginning of the buffer
-        response = StreamingHttpResponse(file_buffer, content_type="text/csv")
+        response = StreamingHttpResponse(stream_targets_csv(context['filter'].qs), content_type="text/csv")
         filename = "targets-{}.csv".format(slugify(datetime.utcnow()))
         response['Content-Disposition'] = 'attachment; filename="{}"'.format(filename)
         return response
@@ -633,7 +588,6 @@ class fits_upload(viewsets.ModelViewSet):
         t0 = time.time()
         self.check_permissions(request)
         observatory, MJD, ExpTime, dryRun, matchDist, comment = None, None, None, None, None, None
-        fits_quantity = None
 
         try:
             observation_filter = request.data.get('filter')
@@ -645,9 +599,10 @@ class fits_upload(viewsets.ModelViewSet):
         except Instrument.DoesNotExist:
             return Response(status=status.HTTP_400_BAD_REQUEST)
         try:
-            target = request.data.get('target')
-            target_id = Target.objects.get(name=target)
-        except Target.DoesNotExist:
+            target_id = get_target_by_name(request.data.get('target'))
+        except AmbiguousTargetNameError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if target_id is None:
             return Response(status=status.HTTP_400_BAD_REQUEST)
         try:
             dp_type = request.data.get('data_product_type')
@@ -674,16 +629,14 @@ class fits_upload(viewsets.ModelViewSet):
                 ExpTime = request.data.get('ExpTime')
                 if MJD is None or ExpTime is None:
                     return Response(status=status.HTTP_400_BAD_REQUEST)
-            if dp_type == 'fits_file':
-                time_threshold = timezone.now() - timedelta(days=1)
-                fits_quantity = BHTomFits.objects.filter(start_time__gte=time_threshold).count()
-                fits_quantity = fits_quantity * 10
+            force = request.data.get('force') in ('True', 'true', '1')
         except Exception as e:
             capture_exception(e)
             logger.error('data upload error: ' + str(e))
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
         successful_uploads = []
+        jobs = []
 
        # BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         logger.info('number of files : %s' % (str(len(data_product_files))))
@@ -694,10 +647,17 @@ class fits_upload(viewsets.ModelViewSet):
 
             logger.info(f.name)
             logger.info('len file presave: %s' % str(len(f)))
-          #  if os.path.exists('{0}/data/{1}/none/{2}'.format(BASE, target, f.name)):
-           #     messages.error(self.request, read_secret('FILE_EXIST'))
-           #     logger.error('File exits: %s %s' % (str(f.name), str(target)))
-           #     return Response(status=status.HTTP_201_CREATED)
+
+            content_hash = file_sha256(f)
+            duplicate = None if force else find_duplicate_upload(content_hash, target_id, dp_type,
+                                                                 instrument=instrument, user=user)
+            if duplicate is not None:
+                # The same file has already been uploaded, return the existing job instead of reprocessing it
+                logger.info('Duplicate upload of %s, content hash: %s' % (str(f.name), content_hash))
+                if isinstance(duplicate, BHTomFits):
+                    jobs.append(duplicate.file_id)
+                successful_uploads.append(str(duplicate.dataproduct_id))
+                continue
 
 
             dp = DataProduct(
@@ -708,15 +668,22 @@ class fits_upload(viewsets.ModelViewSet):
             )
             dp.save()
             logger.info('len file after save: %s' % str(len(dp.data)))
+            parse_context = UploadParseContext(dp)
             try:
-                run_hook('data_product_post_upload',
-                         dp, target_id, observatory,
-                         observation_filter, MJD, ExpTime,
-                         dryRun, matchDist, comment,
-                         user, fits_quantity,
-                         hashtag=hashtag)
-
-                run_data_processor(dp)
+                instance = run_hook('data_product_post_upload',
+                                    dp, target_id, observatory,
+                                    observation_filter, MJD, ExpTime,
+                                    dryRun, matchDist, comment,
+                                    user, 0,
+                                    hashtag=hashtag,
+                                    content_hash=content_hash,
+                                    parse_context=parse_context)
+
+                if isinstance(instance, BHTomFits):
+                    # Photometry is done asynchronously, the client can poll the job status
+                    jobs.append(instance.file_id)
+                else:
+                    run_data_processor(dp, parse_context)
                 successful_uploads.append(str(dp))
 
             except InvalidFileFormatException as iffe:
@@ -731,9 +698,15 @@ class fits_upload(viewsets.ModelViewSet):
                 ReducedDatum.objects.filter(data_product=dp).delete()
                 dp.delete()
 
+        if len(jobs) < len(successful_uploads):
+            refresh_reduced_data_view()
+
         t1 = time.time()
         total = t1 - t0
         logger.info('time: ' + str(total))
+
+        if jobs:
+            return Response({'jobs': jobs}, status=status.HTTP_202_ACCEPTED)
         return Response(status=status.HTTP_201_CREATED)
 
     def list(self, request, *args, **kwargs):
@@ -854,6 +827,7 @@ class DataProductUploadView(FormView):
         ExpTime = form.cleaned_data['ExpTime']
         matchDist = form.cleaned_data['matchDist']
         dryRun = form.cleaned_data['dryRun']
+        force = form.cleaned_data['force']
         comment = form.cleaned_data['comment']
         facility = form.cleaned_data['facility']
         observer = form.cleaned_data['observer']
@@ -870,6 +844,7 @@ class DataProductUploadView(FormView):
             return redirect(form.cleaned_data.get('referrer', '/'))
 
         successful_uploads = []
+        to_process = []
         logger.info(self.request.META)
 
         logger.info('number of files : %s' % (str(len(data_product_files))))
@@ -878,10 +853,18 @@ class DataProductUploadView(FormView):
             f.name = "{}_{}".format(user.id, f.name)
             logger.info(f.name)
             logger.info('len file presave: %s' % str(len(f)))
-          #  if os.path.exists('{0}/data/{1}/none/{2}'.format(BASE, target, f.name)):
-          #      messages.error(self.request, read_secret('FILE_EXIST'))
-           #     logger.error('File exits: %s %s' % (str(f.name), str(target)))
-          #      return redirect(form.cleaned_data.get('referrer', '/'))
+
+            content_hash = file_sha256(f)
+            instrument = Instrument.objects.filter(user_id=user, observatory_id=observatory).first() \
+                if observatory is not None else None
+            duplicate = None if force else find_duplicate_upload(content_hash, target, dp_type,
+                                                                 instrument=instrument, user=user)
+            if duplicate is not None:
+                logger.info('Duplicate upload of %s, content hash: %s' % (str(f.name), content_hash))
+                messages.warning(self.request,
+                                 'File {0} has already been uploaded for this target, check "Force re-upload" '
+                                 'to process it again'.format(f.name))
+                continue
 
 
             dp = DataProduct(
@@ -895,44 +878,44 @@ class DataProductUploadView(FormView):
 
             logger.info('len file after save: %s' % str(len(dp.data)))
 
+            parse_context = UploadParseContext(dp)
 
             try:
-                run_hook('data_product_post_upload',
-                         dp=dp,
-                         target=target,
-                         observatory=observatory,
-                         observation_filter=observation_filter,
-                         MJD=MJD,
-                         expTime=ExpTime,
-                         dry_run=dryRun,
-                         matchDist=matchDist,
-                         comment=comment,
-                         user=user,
-                         facility_name=facility,
-                         observer_name=observer,
-                         priority=-100)
-
-                run_data_processor(dp)
-
-                successful_uploads.append(str(dp).split('/')[-1])
-                refresh_reduced_data_view()
-            except InvalidFileFormatException as iffe:
-                deleteFits(dp)
-                ReducedDatum.objects.filter(data_product=dp).delete()
-                dp.delete()
-                messages.error(
-                    self.request,
-                    'File format invalid for file {0} -- error was {1}'.format(str(dp), iffe)
-                )
+                instance = run_hook('data_product_post_upload',
+                                    dp=dp,
+                                    target=target,
+                                    observatory=observatory,
+                                    observation_filter=observation_filter,
+                                    MJD=MJD,
+                                    expTime=ExpTime,
+                                    dry_run=dryRun,
+                                    matchDist=matchDist,
+                                    comment=comment,
+                                    user=user,
+                                    facility_name=facility,
+                                    observer_name=observer,
+                                    priority=-100,
+                                    content_hash=content_hash,
+                                    parse_context=parse_context)
+
+                if isinstance(instance, BHTomFits):
+                    successful_uploads.append(str(dp).split('/')[-1])
+                else:
+                    to_process.append((dp, parse_context))
             except Exception as e:
-                deleteFits(dp)
-                ReducedDatum.objects.filter(data_product=dp).delete()
-                dp.delete()
-                logger.error(e)
-                messages.error(self.request, 'There was a problem processing your file: {0}'.format(str(dp)))
+                self.discard_upload(dp, e)
+
+        # The files are parsed by the background task worker, outside of the request
+        if to_process:
+            data_product_ids = [dp.id for dp, _ in to_process]
+            BHTomData.objects.filter(dataproduct_id__in=data_product_ids) \
+                .update(status='W', status_message='Waiting for processing')
+            process_uploaded_data(data_product_ids)
+            successful_uploads += [str(dp).split('/')[-1] for dp, _ in to_process]
+
         if successful_uploads:
             message: str = 'Successfully uploaded: {0}.'.format('\n'.join([p for p in successful_uploads]))
-            if dp_type == 'fits_file' or dp_type == 'photometry_cpcs':
+            if dp_type == 'fits_file' or dp_type == 'photometry_cpcs' or to_process:
                 message += 'Your file is processing. This might take several minutes'
             messages.success(
                 self.request,
@@ -943,6 +926,22 @@ class DataProductUploadView(FormView):
         logger.info('time: ' + str(total))
         return redirect(form.cleaned_data.get('referrer', '/'))
 
+    def discard_upload(self, dp, error: Exception):
+        """
+        Removes a file which couldn't be processed, along with its data, and reports it to the user.
+        """
+        deleteFits(dp)
+        ReducedDatum.objects.filter(data_product=dp).delete()
+        dp.delete()
+        if isinstance(error, InvalidFileFormatException):
+            messages.error(
+                self.request,
+                'File format invalid for file {0} -- error was {1}'.format(str(dp), error)
+            )
+        else:
+            logger.error(error)
+            messages.error(self.request, 'There was a problem processing your file: {0}'.format(str(dp)))
+
     def form_invalid(self, form):
         """
         Adds errors to Django messaging framework in the case of an invalid form and redirects to the previous page.
@@ -2,7 +2,8 @@ from django.contrib import admin
 from django.db.models import F
 from tom_dataproducts.models import ReducedDatum
 
-from bhtom.models import BHTomFits, Instrument, Observatory, BHTomUser, BHTomCpcsTaskAsynch
+from bhtom.models import BHTomFits, Instrument, Observatory, BHTomUser, BHTomCpcsTaskAsynch, BHTomOutboxMessage, \
+    BHTomDispatchBucket
 from django.utils.html import format_html
 
 from bhtom.utils.asynch.taskCPCS import add_task_to_cpcs_queue
@@ -92,7 +93,8 @@ class ReducedDatum_display(admin.ModelAdmin):
 
 
 class BHTomCpcsTaskAsynch_displayField(admin.ModelAdmin):
-    list_display = ('id', 'get_url', 'get_status', 'target', 'data_send', 'data_created', 'get_number_tries', 'get_error')
+    list_display = ('id', 'get_url', 'get_status', 'target', 'data_send', 'data_created', 'get_number_tries', 'next_attempt',
+                    'get_error', 'last_error')
 
     def get_number_tries(self, obj):
         return obj.number_tries
@@ -110,7 +112,7 @@ class BHTomCpcsTaskAsynch_displayField(admin.ModelAdmin):
     get_status.short_description = 'status'
 
     def send_to_cpcs(self, request, queryset):
-        queryset.update(status='TODO')
+        queryset.update(status='TODO', next_attempt=None)
         queryset.update(number_tries=F('number_tries')+1)
 
         for obj in queryset:
@@ -128,9 +130,20 @@ class BHTomCpcsTaskAsynch_displayField(admin.ModelAdmin):
     actions = [send_to_cpcs]
 
 
+class BHTomOutboxMessage_displayField(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'attempts', 'next_attempt', 'created', 'delivered', 'last_error')
+    list_filter = ('kind', 'status')
+
+
+class BHTomDispatchBucket_displayField(admin.ModelAdmin):
+    list_display = ('instrument', 'tokens', 'queued', 'updated')
+
+
 admin.site.register(BHTomFits, BHTomFits_displayField)
 admin.site.register(Instrument, Instrument_displayField)
 admin.site.register(Observatory, Observatory_displayField)
 admin.site.register(BHTomUser, BHTomUser_displayField)
 admin.site.register(ReducedDatum, ReducedDatum_display)
 admin.site.register(BHTomCpcsTaskAsynch, BHTomCpcsTaskAsynch_displayField)
+admin.site.register(BHTomOutboxMessage, BHTomOutboxMessage_displayField)
+admin.site.register(BHTomDispatchBucket, BHTomDispatchBucket_displayField)
@@ -0,0 +1,19 @@
+import logging
+
+from django.core.management import call_command
+from django_cron import CronJobBase, Schedule
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class DeleteExpiredFitsJob(CronJobBase):
+    RUN_EVERY_MINS = 60
+
+    schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
+    code = 'delete_expired_fits'
+
+    def do(self):
+        logger.info('[DELETE EXPIRED FITS JOB] Deleting...')
+        result: str = call_command('delete_expired_fits')
+        logger.info(f'[DELETE EXPIRED FITS JOB] {result}')
+        return result
@@ -0,0 +1,19 @@
+import logging
+
+from django.core.management import call_command
+from django_cron import CronJobBase, Schedule
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class RequeueOutboxMessagesJob(CronJobBase):
+    RUN_EVERY_MINS = 10
+
+    schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
+    code = 'requeue_outbox_messages'
+
+    def do(self):
+        logger.info('[REQUEUE OUTBOX MESSAGES JOB] Queuing...')
+        result: str = call_command('requeue_outbox_messages')
+        logger.info(f'[REQUEUE OUTBOX MESSAGES JOB] {result}')
+        return result
@@ -0,0 +1,19 @@
+import logging
+
+from django.core.management import call_command
+from django_cron import CronJobBase, Schedule
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class RequeueStaleFitsJob(CronJobBase):
+    RUN_EVERY_MINS = 10
+
+    schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
+    code = 'requeue_stale_fits'
+
+    def do(self):
+        logger.info('[REQUEUE STALE FITS JOB] Queuing...')
+        result: str = call_command('requeue_stale_fits')
+        logger.info(f'[REQUEUE STALE FITS JOB] {result}')
+        return result
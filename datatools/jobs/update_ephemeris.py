@@ -0,0 +1,19 @@
+import logging
+
+from django.core.management import call_command
+from django_cron import CronJobBase, Schedule
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class UpdateEphemerisJob(CronJobBase):
+    RUN_EVERY_MINS = 6 * 60
+
+    schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
+    code = 'update_ephemeris'
+
+    def do(self):
+        logger.info('[UPDATE EPHEMERIS JOB] Updating...')
+        result: str = call_command('update_ephemeris')
+        logger.info(f'[UPDATE EPHEMERIS JOB] {result}')
+        return result
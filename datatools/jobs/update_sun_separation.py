@@ -0,0 +1,19 @@
+import logging
+
+from django.core.management import call_command
+from django_cron import CronJobBase, Schedule
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class UpdateSunSeparationJob(CronJobBase):
+    RUN_EVERY_MINS = 60
+
+    schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
+    code = 'update_sun_separation'
+
+    def do(self):
+        logger.info('[UPDATE SUN SEPARATION JOB] Updating...')
+        result: str = call_command('update_sun_separation')
+        logger.info(f'[UPDATE SUN SEPARATION JOB] {result}')
+        return result
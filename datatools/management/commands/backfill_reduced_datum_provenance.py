@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from bhtom.models import ReducedDatumExtraData, refresh_reduced_data_view
+from bhtom.utils.provenance import intern_extra_data_json
+from .utils.result_messages import MessageStatus, encode_message
+
+
+class Command(BaseCommand):
+
+    help = 'Moves facility/owner of the existing reduced data extra data into the interned provenance table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch_size', type=int, default=5000, help='Number of rows updated per transaction')
+
+    def handle(self, *args, **options) -> str:
+        batch_size: int = options['batch_size']
+        last_pk: int = 0
+        updated: int = 0
+
+        while True:
+            batch = list(ReducedDatumExtraData.objects
+                         .filter(provenance__isnull=True, extra_data__isnull=False, reduced_datum_id__gt=last_pk)
+                         .order_by('reduced_datum_id')
+                         .values_list('reduced_datum_id', 'extra_data', 'reduced_datum__source_name')[:batch_size])
+            if not batch:
+                break
+
+            last_pk = batch[-1][0]
+            to_update = []
+
+            for reduced_datum_id, extra_data, source_name in batch:
+                provenance_id, remaining_extra_data = intern_extra_data_json(extra_data, source_name)
+                if provenance_id is None:
+                    continue
+                to_update.append(ReducedDatumExtraData(reduced_datum_id=reduced_datum_id,
+                                                       provenance_id=provenance_id,
+                                                       extra_data=remaining_extra_data))
+
+            with transaction.atomic():
+                ReducedDatumExtraData.objects.bulk_update(to_update, ['provenance', 'extra_data'])
+
+            updated += len(to_update)
+            self.stdout.write(f'Backfilled provenance for {updated} reduced data...')
+
+        refresh_reduced_data_view()
+
+        return encode_message(MessageStatus.SUCCESS, f'Backfilled provenance for {updated} reduced data')
@@ -0,0 +1,51 @@
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import List
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from datatools.processors.photometry_processor import PhotometryProcessor
+from .utils.result_messages import MessageStatus, encode_message
+
+
+def write_synthetic_photometry(path: str, rows: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    mjd = 59000.0 + np.sort(rng.uniform(0.0, 1000.0, rows))
+    magnitude = rng.normal(15.0, 1.0, rows)
+    error = rng.uniform(0.01, 0.1, rows)
+    filters = rng.choice(['V', 'R', 'I'], rows)
+
+    with open(path, 'w') as f:
+        f.write('time,magnitude,error,filter\n')
+        f.writelines(f'{t:.6f},{m:.4f},{e:.4f},{flt}\n' for t, m, e, flt in zip(mjd, magnitude, error, filters))
+
+
+class Command(BaseCommand):
+
+    help = 'Measures PhotometryProcessor on synthetic plaintext files of the given sizes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000,1000000', help='Comma-separated numbers of rows')
+
+    def handle(self, *args, **options) -> str:
+        sizes: List[int] = [int(size) for size in options['sizes'].split(',')]
+        processor = PhotometryProcessor()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for rows in sizes:
+                path: str = os.path.join(tmp_dir, f'photometry_{rows}.csv')
+                write_synthetic_photometry(path, rows)
+
+                # The processor only needs the path of the data product's file
+                data_product = SimpleNamespace(data=SimpleNamespace(path=path))
+
+                start: float = time.perf_counter()
+                processed: int = sum(1 for _ in processor.process_data(data_product))
+                elapsed: float = time.perf_counter() - start
+
+                self.stdout.write(f'{rows} rows: {elapsed:.2f} s ({processed / elapsed:.0f} rows/s)')
+
+        return encode_message(MessageStatus.SUCCESS, 'Benchmark finished')
@@ -0,0 +1,38 @@
+import csv
+import logging
+
+from django.core.management.base import BaseCommand
+
+from bhtom.utils.crossmatch import crossmatch, read_positions_csv
+from .utils.result_messages import MessageStatus, encode_message
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+
+    help = 'Matches the positions from a CSV file (ra, dec and optionally radius columns, in degrees) ' \
+           'against the target catalogue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('positions', help='CSV file with the positions')
+        parser.add_argument('--radius', type=float, default=None,
+                            help='Radius in degrees of the positions without one')
+        parser.add_argument('--output', required=True, help='CSV file the matches are written to')
+
+    def handle(self, *args, **options) -> str:
+        try:
+            with open(options['positions'], newline='') as file:
+                ra, dec, radius = read_positions_csv(file, options['radius'])
+        except (OSError, ValueError) as e:
+            return encode_message(MessageStatus.ERROR, f'Cannot read the positions: {e}')
+
+        matches = crossmatch(ra, dec, radius)
+
+        with open(options['output'], 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=['index', 'ra', 'dec', 'target_id', 'target', 'separation'])
+            writer.writeheader()
+            writer.writerows(matches)
+
+        return encode_message(MessageStatus.SUCCESS,
+                              f'Found {len(matches)} matches for {len(ra)} positions')
@@ -0,0 +1,75 @@
+import logging
+import os
+from datetime import timedelta
+from typing import List
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from bhtom.models import BHTomFits
+from .utils.result_messages import MessageStatus, encode_message
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+
+    help = 'Deletes uploaded FITS files older than DAYS_DELETE_FILES from disk and marks them as not stored'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, help='Delete files uploaded more than this many days ago')
+        parser.add_argument('--batch_size', type=int, default=500, help='Number of files handled per batch')
+
+    def handle(self, *args, **options) -> str:
+        days: float = options['days'] if options['days'] is not None else settings.DAYS_DELETE_FILES
+        batch_size: int = options['batch_size']
+        time_threshold = timezone.now() - timedelta(days=days)
+
+        deleted_files: int = 0
+        reclaimed_bytes: int = 0
+        last_key = None
+        failed_files: int = 0
+
+        while True:
+            # Walks the (data_stored, start_time) index in (start_time, file_id) order. Files still waiting for
+            # or being sent to photometry are kept, and so are the files that couldn't be removed,
+            # which are skipped by the keyset paging.
+            expired = BHTomFits.objects.filter(data_stored=True, start_time__lte=time_threshold) \
+                .exclude(status__in=['C', 'D'])
+            if last_key is not None:
+                last_start_time, last_file_id = last_key
+                expired = expired.filter(Q(start_time__gt=last_start_time) |
+                                         Q(start_time=last_start_time, file_id__gt=last_file_id))
+            batch = list(expired.order_by('start_time', 'file_id')
+                         .values_list('file_id', 'start_time', 'dataproduct_id__data')[:batch_size])
+            if not batch:
+                break
+
+            not_stored: List[int] = []
+            for file_id, start_time, data in batch:
+                if not data:
+                    not_stored.append(file_id)
+                    continue
+                path: str = os.path.join(settings.MEDIA_ROOT, data)
+                try:
+                    size: int = os.path.getsize(path)
+                    os.remove(path)
+                    deleted_files += 1
+                    reclaimed_bytes += size
+                    not_stored.append(file_id)
+                    logger.info('remove fits: ' + str(data))
+                except FileNotFoundError:
+                    not_stored.append(file_id)
+                    logger.info('file not exist, change data_stored=false, fits: ' + str(data))
+                except OSError as e:
+                    failed_files += 1
+                    logger.error('Error with remove fits %s: %s' % (str(data), str(e)))
+
+            BHTomFits.objects.filter(file_id__in=not_stored).update(data_stored=False)
+            last_key = batch[-1][1], batch[-1][0]
+
+        return encode_message(MessageStatus.ERROR if failed_files else MessageStatus.SUCCESS,
+                              f'Deleted {deleted_files} expired files, reclaimed {reclaimed_bytes} bytes, '
+                              f'{failed_files} files could not be removed')
@@ -0,0 +1,18 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from bhtom.utils.upload_session import expire_upload_sessions
+from .utils.result_messages import MessageStatus, encode_message
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+
+    help = 'Expires the resumable uploads without activity for UPLOAD_SESSION_EXPIRY_HOURS ' \
+           'and removes the files reserved for them'
+
+    def handle(self, *args, **options) -> str:
+        expired: int = expire_upload_sessions()
+        return encode_message(MessageStatus.SUCCESS, f'Expired {expired} upload sessions')
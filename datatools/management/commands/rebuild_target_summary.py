@@ -0,0 +1,33 @@
+import logging
+
+from django.core.management.base import BaseCommand
+from tom_targets.models import Target
+
+from bhtom.utils.target_summary import rebuild_target_summaries
+from .utils.result_messages import MessageStatus, encode_message
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+
+    help = 'Rebuilds the typed target summaries (BHTomTargetSummary) from the targets\' positions and extra fields'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch_size', type=int, default=1000, help='Number of targets rebuilt per batch')
+
+    def handle(self, *args, **options) -> str:
+        batch_size: int = options['batch_size']
+        rebuilt: int = 0
+        last_id: int = 0
+
+        while True:
+            target_ids = list(Target.objects.filter(id__gt=last_id).order_by('id')
+                              .values_list('id', flat=True)[:batch_size])
+            if not target_ids:
+                break
+
+            rebuilt += rebuild_target_summaries(target_ids)
+            last_id = target_ids[-1]
+
+        return encode_message(MessageStatus.SUCCESS, f'Rebuilt the summaries of {rebuilt} targets')
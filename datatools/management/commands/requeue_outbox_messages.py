@@ -0,0 +1,34 @@
+import logging
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from bhtom.models import BHTomOutboxMessage
+from bhtom.utils.asynch.taskOutbox import deliver_outbox_message
+from .utils.result_messages import MessageStatus, encode_message
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+
+    help = 'Queues again the outbox messages whose delivery is overdue, e.g. because their task has been lost'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace_minutes', type=float, default=10,
+                            help='Only messages overdue by more than this many minutes are queued again')
+
+    def handle(self, *args, **options) -> str:
+        overdue_time = timezone.now() - timedelta(minutes=options['grace_minutes'])
+
+        # Delivery claims the message, so a message queued twice is still delivered once
+        message_ids = list(BHTomOutboxMessage.objects
+                           .filter(Q(status='P') | Q(status='R'), next_attempt__lt=overdue_time)
+                           .values_list('id', flat=True))
+
+        for message_id in message_ids:
+            deliver_outbox_message(message_id)
+
+        return encode_message(MessageStatus.SUCCESS, f'Queued {len(message_ids)} overdue outbox messages')
@@ -0,0 +1,24 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from bhtom.models import BHTomFits
+from bhtom.utils.asynch.taskCCDPHOTD import schedule_ccdphotd_dispatch
+from bhtom.utils.ccdphotd_scheduler import reclaim_stale_fits
+from .utils.result_messages import MessageStatus, encode_message
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+
+    help = 'Puts back in the CCDPHOTD queue the FITS files whose sending was interrupted ' \
+           'and makes sure that the dispatchers are queued if files are waiting'
+
+    def handle(self, *args, **options) -> str:
+        reclaimed: int = reclaim_stale_fits()
+
+        if BHTomFits.objects.filter(status='C').exists():
+            schedule_ccdphotd_dispatch()
+
+        return encode_message(MessageStatus.SUCCESS, f'Put back {reclaimed} FITS files in the CCDPHOTD queue')
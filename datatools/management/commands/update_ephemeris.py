@@ -0,0 +1,24 @@
+import logging
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+
+from bhtom.utils.ephemeris import get_ephemeris, remove_old_ephemerides
+from .utils.result_messages import MessageStatus, encode_message
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+
+    help = 'Prepares the Sun and Moon ephemeris tables of today and tomorrow and removes the old ones'
+
+    def handle(self, *args, **options) -> str:
+        today = datetime.utcnow().date()
+
+        # Tomorrow's table is ready before the first request of the day needs it
+        for day in [today, today + timedelta(days=1)]:
+            get_ephemeris(day)
+
+        removed: int = remove_old_ephemerides()
+        return encode_message(MessageStatus.SUCCESS, f'Prepared the ephemeris tables, removed {removed} old ones')
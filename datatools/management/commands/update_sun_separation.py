@@ -0,0 +1,17 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from bhtom.utils.sun_separation import update_sun_moon_separations
+from .utils.result_messages import MessageStatus, encode_message
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+
+    help = 'Updates the Sun and Moon separations of all the sidereal targets'
+
+    def handle(self, *args, **options) -> str:
+        updated: int = update_sun_moon_separations()
+        return encode_message(MessageStatus.SUCCESS, f'Updated the Sun and Moon separations of {updated} targets')
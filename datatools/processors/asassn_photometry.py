@@ -1,45 +1,48 @@
 import json
-import mimetypes
 import re
 from typing import Optional
 
+import numpy as np
 from astropy import units
-from astropy.io import ascii
 from astropy.time import Time, TimezoneInfo
-from tom_dataproducts.data_processor import DataProcessor
 from tom_dataproducts.exceptions import InvalidFileFormatException
 from tom_targets.models import Target
 import logging
 
-from datatools.utils.hjd_to_jd import hjd_to_jd
+from bhtom.utils.upload_parse_context import UploadParseContext, get_parse_context
+from datatools.utils.hjd_to_jd import hjd_to_jd_array
+from .data_processor import BHTomDataProcessor
 
 
 logger = logging.getLogger(__name__)
 
 
-class ASASSNPhotometryProcessor(DataProcessor):
+class ASASSNPhotometryProcessor(BHTomDataProcessor):
 
-    def process_data(self, data_product):
+    def process_data(self, data_product, parse_context: Optional[UploadParseContext] = None):
         """
         Routes a photometry processing call to a method specific to a file-format.
 
         :param data_product: Photometric DataProduct which will be processed into the ASAS-SN format
         :type data_product: DataProduct
 
+        :param parse_context: Parse context of the uploaded file
+        :type parse_context: UploadParseContext
+
         :returns: python list of 2-tuples, each with a timestamp and corresponding data
         :rtype: list
         """
 
-        mimetype = mimetypes.guess_type(data_product.data.path)[0]
-        if mimetype in self.PLAINTEXT_MIMETYPES:
+        parse_context = get_parse_context(data_product, parse_context)
+        if parse_context.mimetype in self.PLAINTEXT_MIMETYPES:
             logger.debug('[ASAS-SN PHOTOMETRY] Starting to process ASAS-SN data...')
-            photometry = self._process_photometry_from_plaintext(data_product)
+            photometry = self._process_photometry_from_plaintext(data_product, parse_context)
             logger.debug('[ASAS-SN PHOTOMETRY] Photometry processed!')
             return [(datum.pop('timestamp'), json.dumps(datum)) for datum in photometry]
         else:
             raise InvalidFileFormatException('Unsupported file type')
 
-    def _process_photometry_from_plaintext(self, data_product):
+    def _process_photometry_from_plaintext(self, data_product, parse_context: UploadParseContext):
         """
         Processes the photometric data from a plaintext file into a list of dicts. File is read using astropy as
         specified in the below documentation. The file is expected to be a multi-column delimited file, with headers for
@@ -49,6 +52,9 @@ class ASASSNPhotometryProcessor(DataProcessor):
         :param data_product: Photometric DataProduct which will be processed into a list of dicts
         :type data_product: DataProduct
 
+        :param parse_context: Parse context of the DataProduct's file
+        :type parse_context: UploadParseContext
+
         :returns: python list containing the photometric data from the DataProduct
         :rtype: list
         """
@@ -58,7 +64,7 @@ class ASASSNPhotometryProcessor(DataProcessor):
         ra: float = target.ra
         dec: float = target.dec
 
-        data = ascii.read(data_product.data.path)
+        data = parse_context.table
         if len(data) < 1:
             logger.error('[ASAS-SN PHOTOMETRY] Empty table!')
             raise InvalidFileFormatException('Empty table or invalid file type')
@@ -92,18 +98,23 @@ class ASASSNPhotometryProcessor(DataProcessor):
         else:
             camera_index: Optional[str] = None
 
-        for datum in data:
+        try:
+            hjds: np.ndarray = np.asarray(data[hjd_index], dtype=float)
+            # The conversion is done for the whole table at once
+            jds: Time = Time(hjd_to_jd_array(hjds, ra, dec), format='jd')
+            utc = TimezoneInfo(utc_offset=0 * units.hour)
+            timestamps = np.round(jds.unix * 1e6).astype('int64').astype('datetime64[us]').tolist()
+        except Exception as e:
+            logger.error(f'[ASAS-SN PHOTOMETRY] Error {e} while converting HJD')
+            raise InvalidFileFormatException(f'Error while processing data: {e}')
+
+        for datum, hjd, jd, timestamp in zip(data, hjds.tolist(), jds.jd.tolist(), timestamps):
             try:
-                hjd: Time = datum[hjd_index]
-                jd: Time = Time(hjd_to_jd(hjd, ra, dec), format='jd')
-
-                utc = TimezoneInfo(utc_offset=0 * units.hour)
-                jd.format = 'datetime'
                 value = {
-                    'timestamp': jd.to_datetime(timezone=utc),
+                    'timestamp': timestamp.replace(tzinfo=utc),
                     'magnitude': self._filter_non_numbers(str(datum['mag'])),
                     'filter': f'{datum[filter_index]}/ASAS-SN',
-                    'jd': jd.jd,
+                    'jd': jd,
                     'hjd': hjd
                 }
 
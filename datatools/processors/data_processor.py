@@ -0,0 +1,112 @@
+from datetime import datetime
+from importlib import import_module
+from itertools import islice
+from typing import Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from tom_dataproducts.data_processor import DataProcessor, DEFAULT_DATA_PROCESSOR_CLASS
+from tom_dataproducts.models import ReducedDatum
+from tom_targets.models import Target
+
+from bhtom.utils.provenance import bulk_create_reduced_datum_extra_data, data_product_provenance_id
+from bhtom.utils.upload_parse_context import UploadParseContext, get_parse_context
+
+DEFAULT_BATCH_SIZE: int = 5000
+
+
+class BHTomDataProcessor(DataProcessor):
+    """
+    DataProcessor reading the uploaded file through an UploadParseContext,
+    so that a file already parsed by data_product_post_upload isn't read again.
+    """
+
+    def process_data(self, data_product, parse_context: Optional[UploadParseContext] = None):
+        return []
+
+
+def get_data_processor(dp) -> DataProcessor:
+    """
+    Returns the processor set in DATA_PROCESSORS for the type of the DataProduct.
+    """
+    try:
+        processor_class = settings.DATA_PROCESSORS[dp.data_product_type]
+    except Exception:
+        processor_class = DEFAULT_DATA_PROCESSOR_CLASS
+
+    try:
+        mod_name, class_name = processor_class.rsplit('.', 1)
+        mod = import_module(mod_name)
+        clazz = getattr(mod, class_name)
+    except (ImportError, AttributeError):
+        raise ImportError('Could not import {}. Did you provide the correct path?'.format(processor_class))
+
+    return clazz()
+
+
+def process_data(dp, parse_context: Optional[UploadParseContext] = None) -> Iterable[Tuple[datetime, str]]:
+    """
+    Runs the data processor of the DataProduct, without writing anything to the database.
+
+    :returns: (timestamp, value) pairs, possibly produced lazily
+    """
+    data_processor = get_data_processor(dp)
+    if isinstance(data_processor, BHTomDataProcessor):
+        return data_processor.process_data(dp, parse_context=get_parse_context(dp, parse_context))
+    return data_processor.process_data(dp)
+
+
+def run_data_processor(dp, parse_context: Optional[UploadParseContext] = None):
+    """
+    Same as tom_dataproducts.data_processor.run_data_processor, but passes the parse context
+    of the upload to the BHTOM processors and inserts the data in batches (see write_reduced_data).
+
+    :param dp: DataProduct which will be processed into a list
+    :type dp: DataProduct
+
+    :param parse_context: Parse context of the uploaded file, created if not given
+    :type parse_context: UploadParseContext
+
+    :returns: QuerySet of `ReducedDatum` objects created by the `run_data_processor` call
+    :rtype: `QuerySet` of `ReducedDatum`
+    """
+
+    write_reduced_data(dp, process_data(dp, parse_context))
+
+    return ReducedDatum.objects.filter(data_product=dp)
+
+
+def write_reduced_data(dp, data: Iterable[Tuple[datetime, str]], batch_size: Optional[int] = None) -> int:
+    """
+    Inserts the (timestamp, value) pairs produced by a data processor as ReducedDatum rows, batch_size rows
+    per INSERT, together with the provenance of the DataProduct. Everything is done in one transaction,
+    so a failure in any batch (or in the processor producing the data lazily) leaves no rows behind.
+
+    :returns: number of inserted rows
+    """
+    batch_size = batch_size or getattr(settings, 'DATA_PROCESSOR_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    data = iter(data)
+    written: int = 0
+
+    with transaction.atomic():
+        provenance_id: Optional[int] = data_product_provenance_id(dp)
+
+        while True:
+            batch: List[ReducedDatum] = [ReducedDatum(target=dp.target, data_product=dp,
+                                                      data_type=dp.data_product_type,
+                                                      timestamp=timestamp, value=value)
+                                         for timestamp, value in islice(data, batch_size)]
+            if not batch:
+                break
+
+            ReducedDatum.objects.bulk_create(batch)
+            if provenance_id is not None:
+                bulk_create_reduced_datum_extra_data(batch, provenance_id)
+            written += len(batch)
+
+        if written:
+            # Marks the target's data as changed once for the whole upload
+            Target.objects.filter(pk=dp.target_id).update(modified=timezone.now())
+
+    return written
@@ -1,17 +1,21 @@
-import mimetypes
 import json
+from datetime import timezone
+from typing import Optional
 
-from astropy import units
-from astropy.io import ascii
-from astropy.time import Time, TimezoneInfo
+import numpy as np
+from astropy.time import Time
 
-from tom_dataproducts.data_processor import DataProcessor
 from tom_dataproducts.exceptions import InvalidFileFormatException
 
+from bhtom.utils.upload_parse_context import UploadParseContext, get_parse_context
+from .data_processor import BHTomDataProcessor
 
-class PhotometryProcessor(DataProcessor):
 
-    def process_data(self, data_product):
+class PhotometryProcessor(BHTomDataProcessor):
+
+    REQUIRED_COLUMNS = ['time', 'magnitude', 'filter', 'error']
+
+    def process_data(self, data_product, parse_context: Optional[UploadParseContext] = None):
         """
         Routes a photometry processing call to a method specific to a file-format.
 
@@ -19,48 +23,66 @@ class PhotometryProcessor(DataProcessor):
         ingestion
         :type data_product: DataProduct
 
-        :returns: python list of 2-tuples, each with a timestamp and corresponding data
-        :rtype: list
+        :param parse_context: Parse context of the uploaded file
+        :type parse_context: UploadParseContext
+
+        :returns: generator of 2-tuples, each with a timestamp and corresponding data
+        :rtype: generator
         """
 
-        mimetype = mimetypes.guess_type(data_product.data.path)[0]
-        if mimetype in self.PLAINTEXT_MIMETYPES:
-            photometry = self._process_photometry_from_plaintext(data_product)
-            return [(datum.pop('timestamp'), json.dumps(datum)) for datum in photometry]
+        parse_context = get_parse_context(data_product, parse_context)
+        if parse_context.mimetype in self.PLAINTEXT_MIMETYPES:
+            photometry = self._process_photometry_from_plaintext(parse_context)
+            return ((datum.pop('timestamp'), json.dumps(datum)) for datum in photometry)
         else:
             raise InvalidFileFormatException('Unsupported file type')
 
-    def _process_photometry_from_plaintext(self, data_product):
+    def _process_photometry_from_plaintext(self, parse_context: UploadParseContext):
         """
-        Processes the photometric data from a plaintext file into a list of dicts. File is read using astropy as
+        Processes the photometric data from a plaintext file into dicts. File is read using astropy as
         specified in the below documentation. The file is expected to be a multi-column delimited file, with headers for
         time, magnitude, filter, and error.
         # http://docs.astropy.org/en/stable/io/ascii/read.html
 
-        :param data_product: Photometric DataProduct which will be processed into a list of dicts
-        :type data_product: DataProduct
+        The table is validated and the times are converted for all rows at once, the dicts are then
+        generated lazily, so that big files don't have to be held in memory as a list of dicts.
 
-        :returns: python list containing the photometric data from the DataProduct
-        :rtype: list
-        """
+        :param parse_context: Parse context of the photometric DataProduct which will be processed into dicts
+        :type parse_context: UploadParseContext
 
-        photometry = []
+        :returns: generator of dicts containing the photometric data from the DataProduct
+        :rtype: generator
+        """
 
-        data = ascii.read(data_product.data.path)
+        data = parse_context.table
         if len(data) < 1:
             raise InvalidFileFormatException('Empty table or invalid file type')
 
-        for datum in data:
-            time = Time(float(datum['time']), format='mjd')
-            utc = TimezoneInfo(utc_offset=0*units.hour)
-            time.format = 'datetime'
-            value = {
-                'timestamp': time.to_datetime(timezone=utc),
-                'magnitude': datum['magnitude'],
-                'filter': datum['filter'],
-                'error': datum['error'],
-                'jd': time.jd
-            }
-            photometry.append(value)
-
-        return photometry
+        missing_columns = [column for column in self.REQUIRED_COLUMNS if column not in data.colnames]
+        if missing_columns:
+            raise InvalidFileFormatException(f'Missing columns: {", ".join(missing_columns)}')
+
+        try:
+            mjd = np.asarray(data['time'], dtype=float)
+        except (TypeError, ValueError):
+            raise InvalidFileFormatException('Time column must contain MJD values')
+        if not np.all(np.isfinite(mjd)):
+            raise InvalidFileFormatException('Time column contains empty or invalid values')
+
+        time = Time(mjd, format='mjd')
+
+        # Time.to_datetime() converts element by element, going through unix time keeps it vectorized.
+        # tolist() converts to python types at once, which are also JSON-serializable
+        timestamps = np.round(time.unix * 1e6).astype('int64').astype('datetime64[us]').tolist()
+        jds = time.jd.tolist()
+        magnitudes = data['magnitude'].tolist()
+        filters = data['filter'].tolist()
+        errors = data['error'].tolist()
+
+        return ({
+            'timestamp': timestamp.replace(tzinfo=timezone.utc),
+            'magnitude': magnitude,
+            'filter': filter,
+            'error': error,
+            'jd': jd
+        } for timestamp, magnitude, filter, error, jd in zip(timestamps, magnitudes, filters, errors, jds))
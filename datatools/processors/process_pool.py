@@ -0,0 +1,97 @@
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, List, Optional, Tuple, Union
+
+import django
+from django.conf import settings
+from tom_dataproducts.models import DataProduct
+
+from bhtom.utils.upload_parse_context import UploadParseContext
+from .data_processor import process_data
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+ProcessingResult = Union[list, Exception]
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """
+    Returns the pool of processes parsing the uploaded files, started on the first use and kept for the
+    lifetime of the background task worker (see bhtom.utils.asynch.taskUploadProcessing). It isn't meant
+    for the web workers, whose requests must not wait for the pool. Processes are spawned (not forked from
+    the worker) and set up Django themselves, so that they don't share the worker's database connections.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=getattr(settings, 'UPLOAD_PROCESSING_WORKERS', 4),
+                                        mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=django.setup)
+    return _executor
+
+
+def reset_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+    _executor = None
+
+
+def _process_data_product(dp: DataProduct, parse_context: Optional[UploadParseContext]) -> list:
+    # Runs in the pool: only parses and converts the file, the database is not touched here
+    return list(process_data(dp, parse_context))
+
+
+def process_data_products(uploads: List[Tuple[DataProduct, Optional[UploadParseContext]]]) \
+        -> Iterator[Tuple[DataProduct, ProcessingResult]]:
+    """
+    Runs the data processors of the uploaded DataProducts concurrently and yields (data product, result)
+    as the files are done, where result is the list of (timestamp, value) pairs or the raised exception.
+    The caller writes the results one at a time, so writes to the target's data stay serialized.
+    A single file is processed in this process and its data is produced lazily.
+    """
+    if len(uploads) == 1:
+        dp, parse_context = uploads[0]
+        try:
+            yield dp, process_data(dp, parse_context)
+        except Exception as e:
+            yield dp, e
+        return
+
+    for dp, _ in uploads:
+        # The target is pickled along with the data product, the processors must not query for it
+        dp.target
+
+    try:
+        executor = get_executor()
+        futures = {executor.submit(_process_data_product, dp, parse_context): (dp, parse_context)
+                   for dp, parse_context in uploads}
+    except BrokenProcessPool:
+        reset_executor()
+        futures = {}
+
+    pending = list(uploads)
+
+    for future in as_completed(futures):
+        dp, parse_context = futures[future]
+        try:
+            result: ProcessingResult = future.result()
+        except BrokenProcessPool:
+            # The rest is processed below, in this process
+            logger.error('Upload processing pool is broken, processing the remaining files in-process')
+            reset_executor()
+            break
+        except Exception as e:
+            result = e
+
+        pending.remove((dp, parse_context))
+        yield dp, result
+
+    for dp, parse_context in pending:
+        try:
+            yield dp, _process_data_product(dp, parse_context)
+        except Exception as e:
+            yield dp, e
@@ -0,0 +1,77 @@
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+from astropy.time import Time
+from specutils import Spectrum1D
+from tom_dataproducts.exceptions import InvalidFileFormatException
+from tom_dataproducts.processors.data_serializers import SpectrumSerializer
+from tom_dataproducts.processors.spectroscopy_processor import SpectroscopyProcessor as TomSpectroscopyProcessor
+from tom_observations.facility import get_service_class
+
+from bhtom.utils.upload_parse_context import UploadParseContext, get_parse_context
+from .data_processor import BHTomDataProcessor
+
+
+class SpectroscopyProcessor(BHTomDataProcessor, TomSpectroscopyProcessor):
+    """
+    The TOM Toolkit SpectroscopyProcessor, with plaintext spectra read through the upload parse context,
+    which has already been used to read the comments in data_product_post_upload.
+    """
+
+    def process_data(self, data_product, parse_context: Optional[UploadParseContext] = None):
+        """
+        Routes a spectroscopy processing call to a method specific to a file-format, then serializes the returned data.
+
+        :param data_product: Spectroscopic DataProduct which will be processed into the specified format for database
+        ingestion
+        :type data_product: DataProduct
+
+        :param parse_context: Parse context of the uploaded file
+        :type parse_context: UploadParseContext
+
+        :returns: python list of 2-tuples, each with a timestamp and corresponding data
+        :rtype: list
+        """
+
+        parse_context = get_parse_context(data_product, parse_context)
+        if parse_context.mimetype in self.FITS_MIMETYPES:
+            spectrum, obs_date = self._process_spectrum_from_fits(data_product)
+        elif parse_context.mimetype in self.PLAINTEXT_MIMETYPES:
+            spectrum, obs_date = self._process_spectrum_from_parse_context(parse_context)
+        else:
+            raise InvalidFileFormatException('Unsupported file type')
+
+        serialized_spectrum = SpectrumSerializer().serialize(spectrum)
+
+        return [(obs_date, serialized_spectrum)]
+
+    def _process_spectrum_from_parse_context(self, parse_context: UploadParseContext):
+        """
+        Same as SpectroscopyProcessor._process_spectrum_from_plaintext, with the table and comments
+        taken from the parse context.
+
+        :returns: Spectrum1D object containing the data from the DataProduct and the datetime of observation
+        """
+
+        data = parse_context.table
+        if len(data) < 1:
+            raise InvalidFileFormatException('Empty table or invalid file type')
+        facility_name = None
+        date_obs = datetime.now()
+
+        for comment in parse_context.comments:
+            if 'date-obs' in comment.lower():
+                date_obs = comment.split(':')[1].strip()
+            if 'facility' in comment.lower():
+                facility_name = comment.split(':')[1].strip()
+
+        facility = get_service_class(facility_name)() if facility_name else None
+        wavelength_units = facility.get_wavelength_units() if facility else self.DEFAULT_WAVELENGTH_UNITS
+        flux_constant = facility.get_flux_constant() if facility else self.DEFAULT_FLUX_CONSTANT
+
+        spectral_axis = np.array(data['wavelength']) * wavelength_units
+        flux = np.array(data['flux']) * flux_constant
+        spectrum = Spectrum1D(flux=flux, spectral_axis=spectral_axis)
+
+        return spectrum, Time(date_obs).to_datetime()
@@ -1,8 +1,11 @@
 from typing import List
 
+import numpy as np
+import pytest
 from astropy import time, coordinates as coord, units as u
 
-from .utils.hjd_to_jd import hjd_to_jd
+from bhtom.utils.crossmatch import TargetIndex, read_positions
+from .utils.hjd_to_jd import hjd_to_jd, hjd_to_jd_array
 
 
 def isclose(a, b, rel_tol=1e-06, abs_tol=1e-06):
@@ -73,3 +76,83 @@ def test_hjd_to_mjd_degree_coords():
         for jd in jds:
             hjd = hjd_for_jd(jd, target)
             assert isclose(hjd_to_jd(hjd[0], ra=target.ra, dec=target.dec, ra_unit=u.hourangle), jd)
+
+
+def test_hjd_to_jd_array():
+    target: coord.SkyCoord = coord.SkyCoord(288.0, -76.0, unit=(u.deg, u.deg), frame='icrs')
+
+    jds: np.ndarray = np.array([2458849.50000000,
+                                2458853.50000000,
+                                2458858.50000000,
+                                2458863.50000000,
+                                2458850.00000000,
+                                2458850.04166667])
+
+    greenwich = coord.EarthLocation.of_site('greenwich')
+
+    times = time.Time(jds, format='jd', scale='utc', location=greenwich)
+    hjds = jds + times.light_travel_time(target, 'heliocentric').value
+
+    converted: np.ndarray = hjd_to_jd_array(hjds, ra=target.ra, dec=target.dec)
+
+    assert converted.shape == jds.shape
+    for converted_jd, jd in zip(converted, jds):
+        assert isclose(converted_jd, jd)
+
+
+def crossmatch_index(ra: List[float], dec: List[float]) -> TargetIndex:
+    return TargetIndex('test', [(i, str(i), r, d) for i, (r, d) in enumerate(zip(ra, dec))])
+
+
+def matched_pairs(index: TargetIndex, ra: List[float], dec: List[float], radius: List[float]):
+    position_index, target_index, _ = index.match(np.array(ra, dtype=float), np.array(dec, dtype=float),
+                                                  np.array(radius, dtype=float))
+    return sorted(zip(position_index.tolist(), target_index.tolist()))
+
+
+def test_crossmatch_zero_radius():
+    index: TargetIndex = crossmatch_index([10.0, 10.0001], [20.0, 20.0])
+
+    assert matched_pairs(index, [10.0], [20.0], [0.0]) == [(0, 0)]
+
+
+def test_crossmatch_ra_wrap():
+    index: TargetIndex = crossmatch_index([359.95, 0.05, 180.0], [0.0, 0.0, 0.0])
+
+    assert matched_pairs(index, [0.0, 359.99], [0.0, 0.0], [0.06, 0.1]) == [(0, 0), (0, 1), (1, 0), (1, 1)]
+
+
+def test_crossmatch_pole():
+    index: TargetIndex = crossmatch_index([0.0, 90.0, 180.0, 270.0, 0.0], [89.9, 89.9, 89.9, 89.9, 89.0])
+
+    assert matched_pairs(index, [123.0], [90.0], [0.11]) == [(0, 0), (0, 1), (0, 2), (0, 3)]
+
+
+def test_crossmatch_mixed_radii():
+    rng = np.random.default_rng(1)
+    targets_ra: np.ndarray = rng.uniform(0, 360, 2000)
+    targets_dec: np.ndarray = np.degrees(np.arcsin(rng.uniform(-1, 1, 2000)))
+    ra: np.ndarray = rng.uniform(0, 360, 200)
+    dec: np.ndarray = np.degrees(np.arcsin(rng.uniform(-1, 1, 200)))
+    radius: np.ndarray = np.concatenate([np.zeros(10), rng.uniform(0.001, 0.1, 90), rng.uniform(1, 5, 100)])
+
+    index: TargetIndex = crossmatch_index(targets_ra.tolist(), targets_dec.tolist())
+    targets = coord.SkyCoord(targets_ra, targets_dec, unit=u.deg)
+
+    expected = sorted((p, t) for p in range(len(ra))
+                      for t in np.flatnonzero(coord.SkyCoord(ra[p], dec[p], unit=u.deg)
+                                              .separation(targets).deg <= radius[p]).tolist())
+
+    assert matched_pairs(index, ra.tolist(), dec.tolist(), radius.tolist()) == expected
+
+
+def test_read_positions_limits():
+    rows = [{'ra': 1, 'dec': 2, 'radius': 0.5}, {'ra': 3, 'dec': 4}]
+
+    ra, dec, radius = read_positions(rows, 1.0, max_positions=2)
+    assert radius.tolist() == [0.5, 1.0]
+
+    for invalid_rows, max_positions in [(rows, 1), ([{'ra': 1, 'dec': 2, 'radius': 6}], None),
+                                        ([{'ra': 1, 'dec': 91, 'radius': 1}], None)]:
+        with pytest.raises(ValueError):
+            read_positions(invalid_rows, None, max_positions=max_positions)
@@ -1,40 +1,68 @@
+from functools import lru_cache
+
 import numpy as np
 from astropy import time, coordinates as coord, units as u
 from astropy.coordinates.errors import UnknownSiteException
-from scipy.optimize import least_squares
 import logging
 
 
 logger = logging.getLogger(__name__)
 
+# Light travel time changes by at most ~1e-4 day per day, so every iteration shrinks the error ~1e4 times:
+# once a step is below STEP_TOLERANCE, the remaining error is below ~1e-9 day
+MAX_ITERATIONS: int = 5
+STEP_TOLERANCE: float = 1e-5
 
-def hjd_to_jd(hjd: float,
-              ra, dec,
-              ra_unit=u.deg,
-              location_name: str = 'greenwich') -> float:
+
+@lru_cache(maxsize=None)
+def get_earth_location(location_name: str = 'greenwich') -> coord.EarthLocation:
     '''
-        Returns MJD corresponding to the given HJD
-        with the heliocentric correction's precision up to 1e-06 (when no Earth Location is provided)
+        Site registry lookups are costly, so the locations are resolved only once
     '''
+    try:
+        return coord.EarthLocation.of_site(location_name)
+    except UnknownSiteException:
+        return coord.EarthLocation.of_site('greenwich')
+
+
+def hjd_to_jd_array(hjd: np.ndarray,
+                    ra, dec,
+                    ra_unit=u.deg,
+                    location_name: str = 'greenwich') -> np.ndarray:
+    '''
+        Returns JDs corresponding to the given HJDs of one target
+        with the heliocentric correction's precision up to 1e-06 (when no Earth Location is provided).
+        Solves jd + ltt(jd) = hjd by fixed-point iteration jd = hjd - ltt(jd) over the whole array.
+    '''
+    hjd = np.atleast_1d(np.asarray(hjd, dtype=float))
+
     try:
         target_location: coord.SkyCoord = coord.SkyCoord(ra=ra,
                                                          dec=dec,
                                                          unit=(ra_unit, ra_unit))
-        try:
-            location: coord.EarthLocation = coord.EarthLocation.of_site(location_name)
-        except UnknownSiteException:
-            location: coord.EarthLocation = coord.EarthLocation.of_site('greenwich')
-
-        def helio_corr(mjd: float) -> float:
-            times: time.Time = time.Time(mjd, format='jd', scale='utc', location=location)
-            return times.light_travel_time(target_location, 'heliocentric').value
+        location: coord.EarthLocation = get_earth_location(location_name)
 
-        def hjd_guess_diff(jd: np.array):
-            hjd_guess = jd[0] + helio_corr(jd[0])
-            return abs(hjd_guess - hjd)
+        jd: np.ndarray = hjd
+        for _ in range(MAX_ITERATIONS):
+            times: time.Time = time.Time(jd, format='jd', scale='utc', location=location)
+            new_jd: np.ndarray = hjd - times.light_travel_time(target_location, 'heliocentric').value
+            converged: bool = np.max(np.abs(new_jd - jd)) < STEP_TOLERANCE
+            jd = new_jd
+            if converged:
+                break
 
-        optim_mjd = least_squares(hjd_guess_diff, np.array([hjd]))
-        return optim_mjd.x[0]
+        return jd
     except Exception as e:
-        logger.error(f'[HJD TO JD CONVERSION] Error while converting HJD {hjd}: {e}')
-        return time.Time(hjd, format='jd', scale='utc', location='greenwich').jd
+        logger.error(f'[HJD TO JD CONVERSION] Error while converting HJDs: {e}')
+        return hjd
+
+
+def hjd_to_jd(hjd: float,
+              ra, dec,
+              ra_unit=u.deg,
+              location_name: str = 'greenwich') -> float:
+    '''
+        Returns JD corresponding to the given HJD
+        with the heliocentric correction's precision up to 1e-06 (when no Earth Location is provided)
+    '''
+    return float(hjd_to_jd_array(np.array([hjd]), ra, dec, ra_unit, location_name)[0])
@@ -121,7 +121,7 @@ INSTALLED_APPS = [
     'tom_observations',
     'tom_dataproducts',
     'bhtom',
-    'datatools',
+    'datatools.apps.DatatoolsConfig',
     'rest_framework',
     'tom_publications',
     'captcha',
@@ -130,9 +130,20 @@ INSTALLED_APPS = [
 ]
 
 CRON_CLASSES = [
-    'datatools.jobs.update_all_lightcurves.UpdateAllLightcurvesJob'
+    'datatools.jobs.update_all_lightcurves.UpdateAllLightcurvesJob',
+    'datatools.jobs.delete_expired_fits.DeleteExpiredFitsJob',
+    'datatools.jobs.requeue_outbox_messages.RequeueOutboxMessagesJob',
+    'datatools.jobs.update_sun_separation.UpdateSunSeparationJob',
+    'datatools.jobs.update_ephemeris.UpdateEphemerisJob',
+    'datatools.jobs.requeue_stale_fits.RequeueStaleFitsJob',
+    'datatools.jobs.delete_expired_upload_sessions.DeleteExpiredUploadSessionsJob'
 ]
 
+# Uploaded FITS files are removed from disk after this many days
+DAYS_DELETE_FILES: float = float(read_secret('DAYS_DELETE_FILES', '1'))
+# Resumable uploads which don't receive anything for this long expire and their partial files are removed
+UPLOAD_SESSION_EXPIRY_HOURS: float = 24
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -292,9 +303,18 @@ CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
         'LOCATION': tempfile.gettempdir()
+    },
+    # Versions of the in-memory indices of each process (bhtom.utils.index_version), kept apart from
+    # the default cache so that they are never culled along with e.g. the airmass plots
+    'index_versions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'bhtom_index_versions')
     }
 }
 
+# Daily Sun and Moon ephemeris tables (bhtom.utils.ephemeris)
+EPHEMERIS_DIR = os.path.join(tempfile.gettempdir(), 'bhtom_ephemeris')
+
 # TOM Specific configuration
 TARGET_TYPE = 'SIDEREAL'
 
@@ -350,10 +370,15 @@ DATA_PRODUCT_TYPES = {
 
 DATA_PROCESSORS = {
     'photometry': 'datatools.processors.photometry_processor.PhotometryProcessor',
-    'spectroscopy': 'tom_dataproducts.processors.spectroscopy_processor.SpectroscopyProcessor',
+    'spectroscopy': 'datatools.processors.spectroscopy_processor.SpectroscopyProcessor',
     'photometry_asassn': 'datatools.processors.asassn_photometry.ASASSNPhotometryProcessor'
 }
 
+# Number of ReducedDatum rows inserted per statement by datatools.processors.data_processor.run_data_processor
+DATA_PROCESSOR_BATCH_SIZE = 5000
+# Number of processes of the background task worker parsing the files of a multi-file upload concurrently
+UPLOAD_PROCESSING_WORKERS = 4
+
 TOM_FACILITY_CLASSES = [
     'tom_observations.facilities.lco.LCOFacility',
     'tom_observations.facilities.gemini.GEMFacility',
@@ -408,6 +433,7 @@ EXTRA_FIELDS = [
     {'name': 'dicovery_date', 'type': 'datetime'},
     {'name': 'cadence', 'type': 'number'},
     {'name': 'Sun_separation', 'type': 'number'},
+    {'name': 'Moon_separation', 'type': 'number'},
     {'name': 'dont_update_me', 'type': 'boolean'}
 ]
 
@@ -471,4 +497,30 @@ sentry_sdk.init(
     send_default_pii=True
 )
 
-BACKGROUND_TASK_QUEUE = 'cpcs_file_queue'
\ No newline at end of file
+BACKGROUND_TASK_QUEUE = 'cpcs_file_queue'
+# Worker threads used by process_tasks, e.g. for dispatching uploaded FITS files to CCDPHOTD
+BACKGROUND_TASK_RUN_ASYNC = True
+BACKGROUND_TASK_ASYNC_THREADS = 4
+# CPCS calibration retries: attempt n is retried after CPCS_RETRY_DELAY * 2^(n-1) seconds
+CPCS_MAX_TRIES = 5
+CPCS_RETRY_DELAY = 10
+
+# Delivery of the outbox messages (CPCS calls, emails queued by model hooks):
+# attempt n is retried after OUTBOX_RETRY_DELAY * 2^(n-1) seconds
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_RETRY_DELAY = 30
+
+# Fair-share dispatch of uploaded FITS files to CCDPHOTD (see bhtom.utils.ccdphotd_scheduler):
+# every instrument can send a burst of CCDPHOTD_BUCKET_CAPACITY files right away, further files are
+# queued behind other instruments' files according to CCDPHOTD_BUCKET_REFILL_PER_MINUTE.
+# The dispatchers share the BACKGROUND_TASK_ASYNC_THREADS worker threads with the other queues (CPCS retries,
+# outbox delivery), so keep CCDPHOTD_DISPATCH_CONCURRENCY below the number of threads. Each dispatcher sends
+# at most CCDPHOTD_DISPATCH_BATCH files before queuing itself again.
+CCDPHOTD_DISPATCH_CONCURRENCY = 2
+CCDPHOTD_DISPATCH_BATCH = 10
+# Files claimed by a dispatcher longer ago than this (e.g. the worker was stopped) are put back in the queue
+CCDPHOTD_CLAIM_TIMEOUT_MINUTES = 30
+CCDPHOTD_BUCKET_CAPACITY = 20
+CCDPHOTD_BUCKET_REFILL_PER_MINUTE = 2.0
+# Each point of the target's priority moves its files this many seconds ahead in the queue
+CCDPHOTD_TARGET_PRIORITY_SECONDS = 60